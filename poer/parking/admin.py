@@ -1,5 +1,20 @@
 from django.contrib import admin
-from .models import ParkingSpot, Car, ParkingLog, Payment
+from smart_parking.db_router import use_replica
+from .models import ParkingSpot, Car, ParkingLog, Payment, ParkingLogArchive, PaymentArchive
+from .plates import search_cars
+
+class ReplicaChangeListMixin:
+    """Просмотр списков в админке читает данные из реплики"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            # Шаблон отрисовывается здесь, пока действует маршрутизация на реплику
+            if hasattr(response, 'render'):
+                response.render()
+        return response
 
 @admin.register(ParkingSpot)
 class ParkingSpotAdmin(admin.ModelAdmin):
@@ -9,13 +24,19 @@ class ParkingSpotAdmin(admin.ModelAdmin):
     ordering = ('number',)
 
 @admin.register(Car)
-class CarAdmin(admin.ModelAdmin):
+class CarAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('license_plate', 'created_at')
     search_fields = ('license_plate',)
     ordering = ('license_plate',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу триграмм вместо LIKE '%...%' по всей таблице
+        if not search_term.strip():
+            return queryset, False
+        return search_cars(search_term, queryset), False
+
 @admin.register(ParkingLog)
-class ParkingLogAdmin(admin.ModelAdmin):
+class ParkingLogAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('car', 'spot', 'entry_time', 'exit_time')
     list_filter = ('entry_time', 'exit_time')
     search_fields = ('car__license_plate', 'spot__number')
@@ -23,9 +44,31 @@ class ParkingLogAdmin(admin.ModelAdmin):
     date_hierarchy = 'entry_time'
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('parking_log', 'amount', 'status', 'payment_time')
     list_filter = ('status', 'payment_time')
     search_fields = ('parking_log__car__license_plate',)
     raw_id_fields = ('parking_log',)
     date_hierarchy = 'payment_time'
+
+class ReadOnlyArchiveAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    """Архивные данные доступны только для просмотра"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ParkingLogArchive)
+class ParkingLogArchiveAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('log_id', 'car', 'spot', 'entry_time', 'exit_time', 'period')
+    list_filter = ('period',)
+    search_fields = ('car__license_plate', 'spot__number')
+    raw_id_fields = ('car', 'spot')
+
+@admin.register(PaymentArchive)
+class PaymentArchiveAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('payment_id', 'log_id', 'amount', 'status', 'payment_time', 'period')
+    list_filter = ('period', 'status')
+    search_fields = ('=log_id', '=payment_id')
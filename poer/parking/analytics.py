@@ -0,0 +1,235 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import FloatField, Func
+from django.utils import timezone
+import numpy as np
+
+from .archive import archive_cutoff
+from .fastjson import json_value
+from .importers import chunked
+from .models import ParkingSpot, ParkingLog, ParkingLogArchive
+from .stats import buckets
+
+LOAD_CHUNK_SIZE = 100000
+# Интервалы распределения длительности стоянки, минуты
+DWELL_BINS = (0, 15, 30, 60, 120, 240, 480, 720, 1440, np.inf)
+
+
+class Epoch(Func):
+    """
+    Момент времени в секундах Unix (float), вычисленный в базе:
+    строки не превращаются в datetime в Python при загрузке.
+    """
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Дата хранится текстом в UTC; julianday 2440587.5 - 1970-01-01
+        return self.as_sql(
+            compiler, connection,
+            template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def to_datetime(seconds):
+    return datetime.fromtimestamp(float(seconds), tz=dt_timezone.utc)
+
+
+class SessionIntervals:
+    """
+    Сессии окна в виде массивов NumPy:
+    spot - индекс места в numbers, entry/exit - границы сессии,
+    обрезанные окном (секунды Unix), dwell - полная длительность
+    закрытых сессий с въездом внутри окна (секунды).
+    """
+    __slots__ = ('spot_ids', 'numbers', 'spot', 'entry', 'exit', 'dwell', 'start', 'end')
+
+    def __init__(self, spot_ids, numbers, spot, entry, exit, dwell, start, end):
+        self.spot_ids = spot_ids
+        self.numbers = numbers
+        self.spot = spot
+        self.entry = entry
+        self.exit = exit
+        self.dwell = dwell
+        self.start = start
+        self.end = end
+
+
+def load_intervals(start_time, end_time, now=None):
+    """
+    Сессии, пересекающие окно [start_time, end_time): горячие логи
+    и (если окно старше горизонта архивации) архив. Незакрытые сессии
+    считаются до now. Сессии выбираются по индексу выезда (exit_time
+    IS NULL и exit_time > start_time), поэтому история до начала окна
+    не читается.
+    """
+    now = now or timezone.now()
+    horizon = min(end_time, now)
+    spots = list(ParkingSpot.objects.order_by('number').values_list('id', 'number'))
+    spot_ids = np.array([spot_id for spot_id, _ in spots], dtype=np.int64)
+    numbers = [number for _, number in spots]
+
+    models = [ParkingLog]
+    if start_time < archive_cutoff(now):
+        models.append(ParkingLogArchive)
+    # Незакрытые сессии (в архиве их нет) и закрытые после начала окна
+    querysets = [ParkingLog.objects.filter(exit_time__isnull=True, entry_time__lt=horizon)]
+    querysets += [model.objects.filter(exit_time__gt=start_time, entry_time__lt=horizon) for model in models]
+    parts = []
+    for queryset in querysets:
+        rows = queryset.order_by().values_list('spot_id', Epoch('entry_time'), Epoch('exit_time'))
+        for chunk in chunked(rows.iterator(chunk_size=LOAD_CHUNK_SIZE), LOAD_CHUNK_SIZE):
+            # None (незакрытая сессия) становится NaN
+            parts.append(np.array(chunk, dtype=np.float64))
+    data = np.concatenate(parts) if parts else np.empty((0, 3))
+
+    start, end, current = start_time.timestamp(), horizon.timestamp(), now.timestamp()
+    raw_entry, raw_exit = data[:, 1], data[:, 2]
+    closed = ~np.isnan(raw_exit)
+    dwell_mask = closed & (raw_entry >= start)
+    dwell = raw_exit[dwell_mask] - raw_entry[dwell_mask]
+
+    entry = np.maximum(raw_entry, start)
+    exit = np.minimum(np.where(closed, raw_exit, current), end)
+    lookup = np.full(int(spot_ids.max()) + 1 if len(spot_ids) else 1, -1, dtype=np.int64)
+    lookup[spot_ids] = np.arange(len(spot_ids))
+    spot = lookup[data[:, 0].astype(np.int64)]
+    keep = (exit > entry) & (spot >= 0)
+    return SessionIntervals(
+        spot_ids, numbers, spot[keep], entry[keep], exit[keep], dwell, start, end_time.timestamp()
+    )
+
+
+def bucket_edges(start_time, end_time, granularity):
+    """Границы интервалов (секунды Unix) в часовом поясе отчетов, включая конец окна"""
+    series = buckets(start_time, end_time, granularity)
+    edges = np.array([max(bucket, start_time).timestamp() for bucket in series] + [end_time.timestamp()])
+    return series, edges
+
+
+def occupancy_matrix(intervals, edges):
+    """
+    Занятые секунды по местам и интервалам (места x интервалы).
+    Части сессии в первом и последнем интервале добавляются через
+    bincount, полностью покрытые интервалы - разностным массивом
+    с накопленной суммой по строке.
+    """
+    spots = len(intervals.numbers)
+    count = len(edges) - 1
+    widths = np.diff(edges)
+    if not len(intervals.spot) or not count:
+        return np.zeros((spots, count))
+
+    first = np.searchsorted(edges, intervals.entry, side='right') - 1
+    last = np.searchsorted(edges, intervals.exit, side='left') - 1
+    same = first == last
+    row = intervals.spot * (count + 1)
+
+    partial = np.where(same, intervals.exit - intervals.entry, edges[first + 1] - intervals.entry)
+    size = spots * (count + 1)
+    occupied = np.bincount(row + first, weights=partial, minlength=size)
+    tail = ~same
+    occupied += np.bincount(row[tail] + last[tail], weights=intervals.exit[tail] - edges[last[tail]], minlength=size)
+
+    # +1 с интервала после первого, -1 с последнего: число сессий, покрывающих интервал целиком
+    full = np.bincount(row[tail] + first[tail] + 1, minlength=size) - np.bincount(row[tail] + last[tail], minlength=size)
+    full = np.cumsum(full.reshape(spots, count + 1), axis=1)[:, :count]
+    return occupied.reshape(spots, count + 1)[:, :count] + full * widths
+
+
+def concurrency(intervals, edges):
+    """
+    Число одновременно занятых мест: события +1 (въезд) и -1 (выезд),
+    отсортированные по времени (выезды раньше въездов в тот же момент),
+    и их накопленная сумма.
+    :return: (пик, момент пика в секундах Unix или None, пик по интервалам)
+    """
+    count = len(edges) - 1
+    if not len(intervals.entry):
+        return 0, None, np.zeros(count, dtype=np.int64)
+    times = np.concatenate([intervals.entry, intervals.exit])
+    deltas = np.concatenate([
+        np.ones(len(intervals.entry), dtype=np.int64),
+        -np.ones(len(intervals.exit), dtype=np.int64)
+    ])
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    level = np.cumsum(deltas[order])
+    peak = int(level.argmax())
+
+    # Уровень на начало интервала, затем максимум событий внутри интервала
+    before = np.searchsorted(times, edges[:-1], side='right')
+    by_bucket = np.where(before > 0, level[np.maximum(before - 1, 0)], 0)
+    bucket = np.searchsorted(edges, times, side='right') - 1
+    inside = bucket < count
+    np.maximum.at(by_bucket, bucket[inside], level[inside])
+    return int(level[peak]), float(times[peak]), by_bucket
+
+
+def dwell_distribution(dwell):
+    """Распределение длительности стоянки по DWELL_BINS и ее квантили, минуты"""
+    minutes = dwell / 60
+    counts, _ = np.histogram(minutes, bins=DWELL_BINS)
+    if len(minutes):
+        p50, p90, p99 = np.percentile(minutes, [50, 90, 99])
+        mean = float(minutes.mean())
+    else:
+        p50 = p90 = p99 = mean = None
+    return {
+        'bins': [
+            {'from': low, 'to': None if np.isinf(high) else high, 'count': int(number)}
+            for low, high, number in zip(DWELL_BINS[:-1], DWELL_BINS[1:], counts)
+        ],
+        'sessions': int(len(minutes)),
+        'mean': mean,
+        'p50': None if p50 is None else float(p50),
+        'p90': None if p90 is None else float(p90),
+        'p99': None if p99 is None else float(p99),
+    }
+
+
+def occupancy_heatmap(start_time, end_time, granularity='hour', now=None):
+    """
+    Загрузка мест по интервалам окна, пиковая одновременная занятость
+    и распределение длительности стоянки.
+    :return: dict с массивами NumPy: 'occupied_seconds' и 'utilization'
+             (места x интервалы), 'peak_by_bucket', 'average_by_bucket'
+    """
+    series, edges = bucket_edges(start_time, end_time, granularity)
+    intervals = load_intervals(start_time, end_time, now)
+    occupied = occupancy_matrix(intervals, edges)
+    widths = np.diff(edges)
+    peak, peak_time, peak_by_bucket = concurrency(intervals, edges)
+    return {
+        'buckets': series,
+        'spot_ids': intervals.spot_ids,
+        'numbers': intervals.numbers,
+        'occupied_seconds': occupied,
+        'utilization': occupied / widths * 100,
+        'peak': peak,
+        'peak_time': to_datetime(peak_time) if peak_time is not None else None,
+        'peak_by_bucket': peak_by_bucket,
+        'average_by_bucket': occupied.sum(axis=0) / widths,
+        'dwell': dwell_distribution(intervals.dwell),
+    }
+
+
+def heatmap_json(heatmap, digits=1):
+    """
+    Данные для JSON: матрица - процент загрузки (места x интервалы).
+    Массивы NumPy остаются массивами: fastjson.dumps кодирует их
+    через orjson без преобразования в списки.
+    """
+    return {
+        'buckets': [json_value(bucket) for bucket in heatmap['buckets']],
+        'spots': heatmap['numbers'],
+        'utilization': np.round(heatmap['utilization'], digits),
+        'average_by_bucket': np.round(heatmap['average_by_bucket'], 2),
+        'peak_by_bucket': heatmap['peak_by_bucket'],
+        'peak': heatmap['peak'],
+        'peak_time': json_value(heatmap['peak_time']),
+        'dwell': heatmap['dwell'],
+    }
@@ -3,8 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .api_views import (
     ParkingSpotViewSet, CarViewSet,
     ParkingLogViewSet, PaymentViewSet,
-    EquipmentViewSet
+    EquipmentViewSet, ReportJobViewSet, occupancy, analytics_export, analytics_occupancy
 )
+from .streams import occupancy_stream
 
 router = DefaultRouter()
 router.register(r'spots', ParkingSpotViewSet)
@@ -12,7 +13,12 @@ router.register(r'cars', CarViewSet)
 router.register(r'logs', ParkingLogViewSet)
 router.register(r'payments', PaymentViewSet)
 router.register(r'equipment', EquipmentViewSet, basename='equipment')
+router.register(r'reports', ReportJobViewSet)
 
 urlpatterns = [
+    path('occupancy/', occupancy, name='occupancy'),
+    path('occupancy/stream/', occupancy_stream, name='occupancy-stream'),
+    path('analytics/export/', analytics_export, name='analytics-export'),
+    path('analytics/occupancy/', analytics_occupancy, name='analytics-occupancy'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,30 +1,67 @@
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django.utils import timezone
-from django.http import HttpResponse
-from datetime import datetime
-from .models import ParkingSpot, Car, ParkingLog, Payment
+from django.http import HttpResponse, FileResponse
+from django.db import router
+from django.urls import reverse
+from datetime import datetime, timedelta
+from .models import ParkingSpot, Car, ParkingLog, Payment, ReportJob
 from .serializers import (
     ParkingSpotSerializer, CarSerializer,
-    ParkingLogSerializer, PaymentSerializer
+    ParkingLogSerializer, PaymentSerializer, ReportJobSerializer
 )
 from .equipment import ParkingSystem
-from .reports import ReportGenerator
+from .pagination import ParkingLogPagination, PaymentPagination
+from .changefeed import ChangeFeedMixin
+from .occupancy import cached_occupancy_counts
+from .conditional import ConditionalListMixin
+from .versions import SPOTS_VERSION, CARS_VERSION
+from .bulk import BulkMixin, bulk_items, errors_response, reserve_spots
+from .streams import publish_spots_on_commit
+from .plates import search_cars, index_cars
+from .fastjson import FastJSONListMixin, json_value, dumps, streaming_response
+from .roles import IsParkingAdmin, IsParkingStaff
+from .stats import revenue_series, local_midnight
+from .report_jobs import DAILY, MONTHLY, DONE, parse_params, submit_report, download_response
+from .exports import export_rows, iter_csv, write_xlsx
+from .columnar import DATASETS, FORMATS, month_range, parse_month, partition_path
+from .analytics import occupancy_heatmap, heatmap_json
+from .receipts import receipt_response
+from .tariffs import bill_session, open_session_debts
 from django.conf import settings
+from smart_parking.sqlite import run_write
+from smart_parking.db_router import use_replica
 import logging
+import tempfile
+import zipfile
 
 logger = logging.getLogger(__name__)
 
-class ParkingSpotViewSet(viewsets.ModelViewSet):
+class ReplicaListMixin:
+    """Списки (GET) читаются из реплики, если она доступна"""
+
+    def list(self, request, *args, **kwargs):
+        with use_replica():
+            return super().list(request, *args, **kwargs)
+
+class ParkingSpotViewSet(ConditionalListMixin, BulkMixin, viewsets.ModelViewSet):
     queryset = ParkingSpot.objects.all()
     serializer_class = ParkingSpotSerializer
+    version_name = SPOTS_VERSION
+    bulk_unique_field = 'number'
+    bulk_version_names = (SPOTS_VERSION,)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def after_bulk_write(self, objects):
+        super().after_bulk_write(objects)
+        # Сигналы при bulk-операциях не отправляются; рассылка - после смены версии
+        publish_spots_on_commit(objects)
+
     @action(detail=False, methods=['get'])
     def available(self, request):
         """Получение списка доступных мест"""
-        spots = self.queryset.filter(is_available=True)
+        spots = self.queryset.filter(is_occupied=False, is_reserved=False)
         serializer = self.get_serializer(spots, many=True)
         return Response(serializer.data)
 
@@ -67,6 +104,20 @@ class ParkingSpotViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    def bulk_reserve(self, request):
+        """Резервация нескольких мест одной транзакцией"""
+        items, error = bulk_items(request)
+        if error:
+            return error
+        logs, errors = reserve_spots(items)
+        if errors:
+            return errors_response(errors)
+        return Response(
+            ParkingLogSerializer(logs, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=True, methods=['post'])
     def cancel_reservation(self, request, pk=None):
         """Отмена резервации"""
@@ -96,22 +147,44 @@ class ParkingSpotViewSet(viewsets.ModelViewSet):
             'cancelled_spots': serializer.data
         })
 
-class CarViewSet(viewsets.ModelViewSet):
+class CarViewSet(ConditionalListMixin, BulkMixin, viewsets.ModelViewSet):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
+    version_name = CARS_VERSION
+    read_replica = True
+    bulk_unique_field = 'license_plate'
+    bulk_version_names = (CARS_VERSION,)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
         queryset = Car.objects.all()
         license_plate = self.request.query_params.get('license_plate', None)
         if license_plate:
-            queryset = queryset.filter(license_plate__icontains=license_plate)
+            queryset = search_cars(license_plate, queryset)
         return queryset
 
-class ParkingLogViewSet(viewsets.ModelViewSet):
-    queryset = ParkingLog.objects.all()
+    def after_bulk_write(self, objects):
+        # Номера могли измениться, а сигналы при bulk-операциях не отправляются
+        index_cars(objects)
+        super().after_bulk_write(objects)
+
+class ParkingLogViewSet(ReplicaListMixin, FastJSONListMixin, ChangeFeedMixin, viewsets.ModelViewSet):
+    queryset = ParkingLog.objects.select_related('car', 'spot')
     serializer_class = ParkingLogSerializer
+    pagination_class = ParkingLogPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    fast_fields = (
+        ('id', 'id'), ('car', 'car_id'), ('spot', 'spot_id'),
+        ('entry_time', 'entry_time'), ('exit_time', 'exit_time'),
+        ('is_reservation', 'is_reservation'),
+        ('reservation_start', 'reservation_start'), ('reservation_end', 'reservation_end'),
+        ('updated_at', 'updated_at'),
+    )
+
+    def fast_row(self, row, now):
+        data = super().fast_row(row, now)
+        data['duration'] = json_value((row['exit_time'] or now) - row['entry_time'])
+        return data
 
     @action(detail=False, methods=['get'])
     def active_reservations(self, request):
@@ -125,6 +198,54 @@ class ParkingLogViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(reservations, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsParkingAdmin])
+    def export(self, request):
+        """
+        Выгрузка всех сессий с платежами для аудита:
+        ?output=csv|xlsx&start=YYYY-MM-DD&end=YYYY-MM-DD (включительно)
+        &archive=0 - без архива. CSV отдается потоком, XLSX собирается
+        во временном файле (constant_memory) и затем отдается файлом.
+        """
+        output = request.query_params.get('output', 'csv')
+        try:
+            if output not in ('csv', 'xlsx'):
+                raise ValueError('output must be csv or xlsx')
+            start = request.query_params.get('start')
+            end = request.query_params.get('end')
+            start_time = local_midnight(datetime.strptime(start, '%Y-%m-%d').date()) if start else None
+            end_time = local_midnight(datetime.strptime(end, '%Y-%m-%d').date() + timedelta(days=1)) if end else None
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with use_replica():
+            # Поток читается после выхода из view: база выбирается сейчас
+            using = router.db_for_read(ParkingLog)
+        rows = export_rows(
+            start_time,
+            end_time,
+            archived=request.query_params.get('archive', '1') != '0',
+            using=using
+        )
+        filename = f"parking_logs_{start or 'all'}_{end or 'all'}.{output}"
+        if output == 'csv':
+            response = streaming_response(request, iter_csv(rows), 'text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+        target = tempfile.TemporaryFile()
+        write_xlsx(rows, target)
+        target.seek(0)
+        # Временный файл удаляется при закрытии ответа
+        return FileResponse(
+            target,
+            as_attachment=True,
+            filename=filename,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
     @action(detail=False, methods=['get'])
     def future_reservations(self, request):
         """Получение будущих резерваций"""
@@ -138,23 +259,49 @@ class ParkingLogViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def exit(self, request, pk=None):
-        log = self.get_object()
-        if log.exit_time:
+        closed = run_write(self._close_log, self.get_object().pk)
+        if closed is None:
             return Response(
                 {'error': 'Автомобиль уже выехал'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+
+        log, payment = closed
+        data = self.get_serializer(log).data
+        # Доплата по тарифу (ожидающий платеж) или 0
+        data['amount_due'] = json_value(payment.amount) if payment else '0.00'
+        return Response(data)
+
+    def _close_log(self, log_id):
+        # Лог перечитывается в транзакции записи: параллельный выезд,
+        # закрывший его раньше, не приводит ко второму начислению
+        log = ParkingLog.objects.select_for_update().select_related('spot', 'car').get(pk=log_id)
+        if log.exit_time:
+            return None
         log.exit_time = timezone.now()
         log.spot.is_occupied = False
         log.spot.save()
         log.save()
-        return Response(self.get_serializer(log).data)
+        return log, bill_session(log)
 
-class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all()
+    @action(detail=False, methods=['get'], permission_classes=[IsParkingStaff])
+    def debts(self, request):
+        """Текущий долг по незакрытым сессиям по тарифу"""
+        with use_replica():
+            sessions, total = open_session_debts()
+        for session in sessions:
+            session['entry_time'] = json_value(session['entry_time'])
+        return HttpResponse(dumps({'total': total, 'sessions': sessions}), content_type='application/json')
+
+class PaymentViewSet(ReplicaListMixin, FastJSONListMixin, ChangeFeedMixin, viewsets.ModelViewSet):
+    queryset = Payment.objects.select_related('parking_log__car', 'parking_log__spot')
     serializer_class = PaymentSerializer
+    pagination_class = PaymentPagination
     permission_classes = [permissions.IsAuthenticated]
+    fast_fields = (
+        ('id', 'id'), ('parking_log', 'parking_log_id'), ('amount', 'amount'),
+        ('status', 'status'), ('payment_time', 'payment_time'), ('updated_at', 'updated_at'),
+    )
 
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -173,57 +320,208 @@ class PaymentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def receipt(self, request, pk=None):
         """Получить PDF-чек об оплате"""
-        payment = self.get_object()
-        report_generator = ReportGenerator()
-        pdf_content = report_generator.generate_receipt_pdf(payment)
-        
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_{payment.id}.pdf"'
-        return response
+        return receipt_response(request, self.get_object())
 
     @action(detail=False, methods=['get'])
     def daily_report(self, request):
-        """Получить ежедневный отчет"""
+        """Получить ежедневный отчет (готовый файл или 202 и задание)"""
         try:
-            date_str = request.query_params.get('date')
-            if date_str:
-                date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            else:
-                date = None
-
-            report_generator = ReportGenerator()
-            excel_content = report_generator.generate_daily_report_excel(date)
-            
-            response = HttpResponse(excel_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="daily_report_{date or datetime.now().date()}.xlsx"'
-            return response
+            params = parse_params(DAILY, request.query_params)
         except ValueError:
             return Response(
                 {'error': 'Invalid date format. Use YYYY-MM-DD'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        return self._report_response(request, DAILY, params)
 
     @action(detail=False, methods=['get'])
     def monthly_report(self, request):
-        """Получить месячный отчет"""
+        """Получить месячный отчет (готовый файл или 202 и задание)"""
         try:
-            year = int(request.query_params.get('year', datetime.now().year))
-            month = int(request.query_params.get('month', datetime.now().month))
+            params = parse_params(MONTHLY, request.query_params)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self._report_response(request, MONTHLY, params)
 
-            if not (1 <= month <= 12):
-                raise ValueError('Month must be between 1 and 12')
+    def _report_response(self, request, kind, params):
+        job = submit_report(kind, params, request.user)
+        if job.status == DONE:
+            return download_response(job)
+        return ReportJobViewSet.accepted(job, request)
 
-            report_generator = ReportGenerator()
-            excel_content = report_generator.generate_monthly_report_excel(year, month)
-            
-            response = HttpResponse(excel_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="monthly_report_{year}_{month:02d}.xlsx"'
-            return response
+    @action(detail=False, methods=['get'])
+    def revenue(self, request):
+        """
+        Ряд выручки: ?start=YYYY-MM-DD&end=YYYY-MM-DD (включительно)
+        &granularity=hour|day|week|month
+        """
+        try:
+            start = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+            end = datetime.strptime(request.query_params['end'], '%Y-%m-%d').date()
+            granularity = request.query_params.get('granularity', 'day')
+            if end < start:
+                raise ValueError('end must not be earlier than start')
+            with use_replica():
+                series = revenue_series(
+                    local_midnight(start),
+                    local_midnight(end + timedelta(days=1)),
+                    granularity
+                )
+        except KeyError as e:
+            return Response(
+                {'error': f'Parameter {e.args[0]} is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'granularity': granularity, 'results': series})
+
+class ReportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Отчеты строятся в фоне: POST {"kind": "daily", "date": "YYYY-MM-DD"}
+    или {"kind": "monthly", "year": ..., "month": ...} возвращает задание,
+    статус - GET /api/reports/{id}/, файл - GET /api/reports/{id}/download/
+    """
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    # Те же права, что у daily_report/monthly_report, которые создают задания
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request):
+        kind = request.data.get('kind')
+        try:
+            params = parse_params(kind, request.data)
         except ValueError as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        job = submit_report(kind, params, request.user)
+        if job.status == DONE:
+            return Response(ReportJobSerializer(job, context={'request': request}).data)
+        return self.accepted(job, request)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != DONE:
+            return Response(
+                ReportJobSerializer(job, context={'request': request}).data,
+                status=status.HTTP_409_CONFLICT
+            )
+        return download_response(job)
+
+    @staticmethod
+    def accepted(job, request):
+        """202 с заданием и ссылкой на его статус"""
+        response = Response(
+            ReportJobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+        response['Location'] = request.build_absolute_uri(reverse('reportjob-detail', args=[job.pk]))
+        return response
+
+@api_view(['GET'])
+def occupancy(request):
+    """Счетчики свободных, занятых и зарезервированных мест"""
+    return Response(cached_occupancy_counts())
+
+@api_view(['GET'])
+@permission_classes([IsParkingAdmin])
+def analytics_export(request):
+    """
+    Логи и платежи в колоночном формате для аналитики:
+    ?dataset=logs|payments&start=YYYY-MM&end=YYYY-MM&output=parquet|arrow.
+    Отдаются готовые разделы по месяцам: их пишут manage.py export_columnar
+    и периодическая задача export_analytics, а не запрос. Один месяц
+    отдается файлом, несколько - ZIP с разбиением month=YYYY-MM.
+    """
+    dataset = request.query_params.get('dataset', 'logs')
+    output = request.query_params.get('output', 'parquet')
+    try:
+        if dataset not in DATASETS:
+            raise ValueError(f'dataset must be one of: {", ".join(DATASETS)}')
+        if output not in FORMATS:
+            raise ValueError(f'output must be one of: {", ".join(FORMATS)}')
+        current = timezone.localdate().replace(day=1)
+        start = parse_month(request.query_params['start']) if 'start' in request.query_params else current
+        end = parse_month(request.query_params['end']) if 'end' in request.query_params else start
+        if end < start:
+            raise ValueError('end must not be earlier than start')
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    partitions = [(month, partition_path(dataset, month, output)) for month in month_range(start, end)]
+    missing = [f'{month:%Y-%m}' for month, path in partitions if not path.exists()]
+    if missing:
+        return Response(
+            {
+                'error': 'Partitions are not exported yet, run manage.py export_columnar',
+                'missing': missing,
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if len(partitions) == 1:
+        month, path = partitions[0]
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{dataset}_{month:%Y-%m}.{output}')
+
+    # Parquet уже сжат, поэтому файлы складываются в архив без сжатия
+    target = tempfile.TemporaryFile()
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as archive:
+        for month, path in partitions:
+            archive.write(path, f'{dataset}/month={month:%Y-%m}/{path.name}')
+    target.seek(0)
+    return FileResponse(
+        target,
+        as_attachment=True,
+        filename=f'{dataset}_{start:%Y-%m}_{end:%Y-%m}.zip',
+        content_type='application/zip'
+    )
+
+@api_view(['GET'])
+@permission_classes([IsParkingAdmin])
+def analytics_occupancy(request):
+    """
+    Загрузка мест по интервалам (места x интервалы, %), пиковая занятость
+    и распределение длительности стоянки: ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    (включительно)&granularity=hour|day|week|month
+    """
+    try:
+        start = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.query_params['end'], '%Y-%m-%d').date()
+        granularity = request.query_params.get('granularity', 'hour')
+        if end < start:
+            raise ValueError('end must not be earlier than start')
+        with use_replica():
+            heatmap = occupancy_heatmap(
+                local_midnight(start),
+                local_midnight(end + timedelta(days=1)),
+                granularity
+            )
+    except KeyError as e:
+        return Response(
+            {'error': f'Parameter {e.args[0]} is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    # Матрица может содержать миллионы значений: кодируется orjson напрямую из NumPy
+    data = heatmap_json(heatmap)
+    data['granularity'] = granularity
+    return HttpResponse(dumps(data), content_type='application/json')
 
 class EquipmentViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
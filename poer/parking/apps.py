@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ParkingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'parking'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from smart_parking.sqlite import configure_connection
+        from smart_parking.metrics import install_query_counter
+
+        connection_created.connect(configure_connection, dispatch_uid='smart_parking_sqlite_pragmas')
+        connection_created.connect(install_query_counter, dispatch_uid='smart_parking_query_counter')
+
+        # Обработчики сигналов
+        from . import conditional, occupancy, plates, receipts, roles, rollups, streams  # noqa: F401
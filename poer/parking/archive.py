@@ -0,0 +1,159 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.utils import timezone
+import logging
+
+from .models import ParkingLog, Payment, ParkingLogArchive, PaymentArchive
+from .rollups import moving_to_archive
+
+logger = logging.getLogger(__name__)
+
+# Закрытые логи старше горизонта переносятся в архивные таблицы
+DEFAULT_HORIZON_DAYS = 180
+DEFAULT_BATCH_SIZE = 1000
+
+LOG_FIELDS = (
+    'id', 'car_id', 'spot_id', 'entry_time', 'exit_time', 'is_reservation',
+    'reservation_start', 'reservation_end', 'created_at', 'updated_at',
+)
+PAYMENT_FIELDS = (
+    'id', 'parking_log_id', 'amount', 'status', 'payment_time',
+    'created_at', 'updated_at',
+)
+
+
+def archive_horizon():
+    """Горизонт архивации из настроек"""
+    days = getattr(settings, 'PARKING_ARCHIVE_HORIZON_DAYS', DEFAULT_HORIZON_DAYS)
+    return timedelta(days=days)
+
+
+def archive_cutoff(now=None):
+    """Момент времени, раньше которого закрытые логи считаются холодными"""
+    return (now or timezone.now()) - archive_horizon()
+
+
+def period_of(value):
+    """Ключ месячного раздела архива (ГГГГ-ММ) в локальном часовом поясе"""
+    return timezone.localtime(value).strftime('%Y-%m')
+
+
+def archivable_logs(cutoff):
+    """Закрытые логи, вышедшие раньше cutoff, в порядке первичного ключа"""
+    return ParkingLog.objects.filter(
+        exit_time__isnull=False,
+        exit_time__lt=cutoff
+    ).order_by('id')
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Перенос одной пачки закрытых логов и их платежей в архив.
+    Каждая пачка переносится в отдельной транзакции, поэтому прерванный
+    перенос можно безопасно перезапустить: уже перенесенные логи
+    удалены из горячей таблицы, а повторная вставка игнорируется.
+    :return: (количество логов, количество платежей)
+    """
+    with transaction.atomic():
+        logs = list(archivable_logs(cutoff).values(*LOG_FIELDS)[:batch_size])
+        if not logs:
+            return 0, 0
+
+        log_ids = [log['id'] for log in logs]
+        periods = {log['id']: period_of(log['exit_time']) for log in logs}
+        payments = list(
+            Payment.objects.filter(parking_log_id__in=log_ids).values(*PAYMENT_FIELDS)
+        )
+
+        ParkingLogArchive.objects.bulk_create(
+            [
+                ParkingLogArchive(
+                    log_id=log['id'],
+                    period=periods[log['id']],
+                    car_id=log['car_id'],
+                    spot_id=log['spot_id'],
+                    entry_time=log['entry_time'],
+                    exit_time=log['exit_time'],
+                    is_reservation=log['is_reservation'],
+                    reservation_start=log['reservation_start'],
+                    reservation_end=log['reservation_end'],
+                    created_at=log['created_at'],
+                    updated_at=log['updated_at'],
+                )
+                for log in logs
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        PaymentArchive.objects.bulk_create(
+            [
+                PaymentArchive(
+                    payment_id=payment['id'],
+                    log_id=payment['parking_log_id'],
+                    period=periods[payment['parking_log_id']],
+                    amount=payment['amount'],
+                    status=payment['status'],
+                    payment_time=payment['payment_time'],
+                    created_at=payment['created_at'],
+                    updated_at=payment['updated_at'],
+                )
+                for payment in payments
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+
+        # Почасовые итоги учитывают архив: перенос их не меняет
+        with moving_to_archive():
+            Payment.objects.filter(parking_log_id__in=log_ids).delete()
+            ParkingLog.objects.filter(id__in=log_ids).delete()
+
+    return len(logs), len(payments)
+
+
+def archive_logs(cutoff=None, batch_size=DEFAULT_BATCH_SIZE, max_batches=None, progress=None):
+    """
+    Перенос всех холодных логов в архив пачками. Каждая пачка фиксируется
+    отдельно, поэтому перенос можно прервать и перезапустить.
+    :param progress: вызывается после пачки: (номер пачки, логов, платежей)
+    :return: (количество логов, количество платежей)
+    """
+    cutoff = cutoff or archive_cutoff()
+    total_logs = total_payments = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        moved_logs, moved_payments = archive_batch(cutoff, batch_size)
+        if not moved_logs:
+            break
+        total_logs += moved_logs
+        total_payments += moved_payments
+        batches += 1
+        logger.info(f"Архивировано логов: {total_logs}, платежей: {total_payments}")
+        if progress:
+            progress(batches, moved_logs, moved_payments)
+
+    return total_logs, total_payments
+
+
+def payment_totals(start_time, end_time, status='completed'):
+    """
+    Сумма и количество платежей за период с учетом архива.
+    Отчеты, захватывающие границу горячих и холодных данных,
+    получают единый результат из обеих таблиц.
+    """
+    totals = {'total_amount': 0, 'total_count': 0}
+    for model in (Payment, PaymentArchive):
+        stats = model.objects.filter(
+            payment_time__gte=start_time,
+            payment_time__lt=end_time,
+            status=status
+        ).aggregate(
+            total_amount=Sum('amount'),
+            total_count=Count('id')
+        )
+        totals['total_amount'] += stats['total_amount'] or 0
+        totals['total_count'] += stats['total_count'] or 0
+    return totals
+
@@ -0,0 +1,254 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
+from smart_parking.sqlite import run_write
+
+from .models import Car, ParkingSpot, ParkingLog
+from .plates import index_unindexed_cars
+from .serializers import ReservationSerializer
+from .streams import publish_spots_on_commit
+from .versions import bump_version, SPOTS_VERSION, LOGS_VERSION
+
+MAX_BULK_ITEMS = 5000
+
+
+def strip_unique_validators(serializer):
+    """
+    Отключение UniqueValidator у полей: в пакетном режиме уникальность
+    проверяется одним запросом на весь пакет, а не запросом на элемент.
+    """
+    for field in serializer.fields.values():
+        field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    return serializer
+
+
+def bulk_items(request):
+    """Массив элементов из тела запроса или (None, ответ с ошибкой)"""
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return None, Response(
+            {'error': 'Ожидается непустой массив объектов'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > MAX_BULK_ITEMS:
+        return None, Response(
+            {'error': f'Не более {MAX_BULK_ITEMS} объектов за запрос'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return items, None
+
+
+def parse_id(value):
+    """Идентификатор элемента (число или строка из цифр) или None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def errors_response(errors):
+    """Ошибки по элементам: список той же длины, что и запрос ({} - элемент корректен)"""
+    return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BulkMixin:
+    """
+    POST  <resource>/bulk/ - создание массива объектов,
+    PATCH <resource>/bulk/ - частичное обновление массива объектов с полем id.
+    Все объекты проверяются сериализатором и записываются одной транзакцией
+    через bulk_create/bulk_update; при любой ошибке ничего не записывается.
+    """
+    bulk_unique_field = None
+    bulk_version_names = ()
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        items, error = bulk_items(request)
+        if error:
+            return error
+        if request.method == 'POST':
+            return self.bulk_create(items)
+        return self.bulk_update(items)
+
+    def bulk_create(self, items):
+        serializer = self.get_serializer(data=items, many=True)
+        strip_unique_validators(serializer.child)
+        valid = serializer.is_valid()
+        errors = serializer.errors if not valid else [{} for _ in items]
+        self.check_unique(items, errors)
+        if any(errors):
+            return errors_response(errors)
+
+        model = self.get_queryset().model
+        objects = [model(**attrs) for attrs in serializer.validated_data]
+        run_write(self.write_bulk_create, objects)
+        return Response(
+            self.get_serializer(objects, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def bulk_update(self, items):
+        ids = [parse_id(item.get('id')) if isinstance(item, dict) else None for item in items]
+        instances = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+
+        errors = []
+        objects = []
+        fields = set()
+        for pk, item in zip(ids, items):
+            instance = instances.get(pk)
+            if pk is None and isinstance(item, dict) and item.get('id') is not None:
+                errors.append({'id': ['Ожидается целое число']})
+                continue
+            if instance is None:
+                errors.append({'id': ['Объект не найден']})
+                continue
+            serializer = strip_unique_validators(
+                self.get_serializer(instance, data=item, partial=True)
+            )
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            for name, value in serializer.validated_data.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            objects.append(instance)
+            errors.append({})
+        self.check_unique(items, errors, ids)
+        if any(errors):
+            return errors_response(errors)
+
+        if fields:
+            # bulk_update не вызывает auto_now, а по updated_at работают
+            # лента изменений и опрос состояния мест
+            now = timezone.now()
+            for instance in objects:
+                instance.updated_at = now
+            run_write(self.write_bulk_update, objects, sorted(fields | {'updated_at'}))
+        return Response(self.get_serializer(objects, many=True).data)
+
+    def check_unique(self, items, errors, ids=None):
+        """Проверка уникального поля внутри пакета и по базе одним запросом"""
+        field = self.bulk_unique_field
+        if not field:
+            return
+        values = [item.get(field) if isinstance(item, dict) else None for item in items]
+        owners = {}
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            try:
+                hash(value)
+            except TypeError:
+                # Список или объект вместо значения; сериализатор мог уже сообщить об ошибке
+                errors[index].setdefault(field, ['Неверное значение'])
+                continue
+            if value in owners:
+                errors[index].setdefault(field, []).append('Значение повторяется в запросе')
+            owners.setdefault(value, index)
+
+        queryset = self.get_queryset().model.objects.filter(**{f'{field}__in': list(owners)})
+        for pk, value in queryset.values_list('pk', field):
+            index = owners[value]
+            if ids is None or ids[index] != pk:
+                errors[index].setdefault(field, []).append('Объект с таким значением уже существует')
+
+    def write_bulk_create(self, objects):
+        self.get_queryset().model.objects.bulk_create(objects)
+        self.after_bulk_write(objects)
+
+    def write_bulk_update(self, objects, fields):
+        self.get_queryset().model.objects.bulk_update(objects, fields, batch_size=500)
+        self.after_bulk_write(objects)
+
+    def after_bulk_write(self, objects):
+        """
+        Вызывается в той же транзакции записи, что и bulk-операция.
+        Сигналы при bulk-операциях не отправляются, поэтому версии меняются явно.
+        """
+        if self.bulk_version_names:
+            bump_version(*self.bulk_version_names)
+
+
+def reserve_spots(items):
+    """
+    Пакетная резервация мест одной транзакцией. Доступность мест
+    проверяется внутри той же транзакции записи, поэтому место, занятое
+    параллельным запросом после проверки, зарезервировано не будет.
+    :return: (созданные логи, None) или (None, ошибки по элементам)
+    """
+    serializer = ReservationSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return run_write(_write_reservations, serializer.validated_data)
+
+
+def _reservation_errors(reservations, spots):
+    """Ошибки по элементам: место не существует, занято или уже в пакете"""
+    open_logs = {}
+    for spot_id, entry_time in ParkingLog.objects.filter(
+        spot_id__in=list(spots), exit_time__isnull=True
+    ).values_list('spot_id', 'entry_time'):
+        open_logs.setdefault(spot_id, []).append(entry_time)
+
+    errors = []
+    seen = set()
+    for reservation in reservations:
+        spot = spots.get(reservation['spot'])
+        if spot is None:
+            errors.append({'spot': ['Место не существует']})
+        elif reservation['spot'] in seen or not spot.is_available or any(
+            reservation['start_time'] <= entry_time <= reservation['end_time']
+            for entry_time in open_logs.get(spot.id, ())
+        ):
+            errors.append({'spot': ['Место недоступно для резервации в указанный период']})
+        else:
+            errors.append({})
+        seen.add(reservation['spot'])
+    return errors
+
+
+def _write_reservations(reservations):
+    # select_for_update блокирует места на PostgreSQL; SQLite и так
+    # сериализует записи (BEGIN IMMEDIATE), там блокировка не нужна
+    spots = ParkingSpot.objects.select_for_update().in_bulk(
+        [reservation['spot'] for reservation in reservations]
+    )
+    errors = _reservation_errors(reservations, spots)
+    if any(errors):
+        return None, errors
+
+    plates = {reservation['license_plate'] for reservation in reservations}
+    Car.objects.bulk_create([Car(license_plate=plate) for plate in plates], ignore_conflicts=True)
+    index_unindexed_cars()
+    car_ids = dict(Car.objects.filter(license_plate__in=plates).values_list('license_plate', 'id'))
+
+    now = timezone.now()
+    logs = []
+    for reservation in reservations:
+        spot = spots[reservation['spot']]
+        spot.is_reserved = True
+        spot.reservation_start = reservation['start_time']
+        spot.reservation_end = reservation['end_time']
+        spot.updated_at = now
+        logs.append(ParkingLog(
+            car_id=car_ids[reservation['license_plate']],
+            spot=spot,
+            entry_time=reservation['start_time'],
+            is_reservation=True,
+            reservation_start=reservation['start_time'],
+            reservation_end=reservation['end_time'],
+        ))
+
+    ParkingLog.objects.bulk_create(logs)
+    ParkingSpot.objects.bulk_update(
+        [spots[reservation['spot']] for reservation in reservations],
+        ['is_reserved', 'reservation_start', 'reservation_end', 'updated_at']
+    )
+    bump_version(SPOTS_VERSION, LOGS_VERSION)
+    publish_spots_on_commit(spots.values())
+    return logs, None
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .pagination import encode_cursor, decode_position
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+
+
+def settle_seconds():
+    """
+    Строки моложе этого интервала отдаются в следующем опросе: транзакция,
+    начатая раньше, могла еще не зафиксировать строку с меньшим updated_at.
+    Она может ждать блокировку до busy_timeout и затем выполняться
+    до WRITE_TRANSACTION_MAX_SECONDS.
+    """
+    busy_timeout = getattr(settings, 'SQLITE_PRAGMAS', {}).get('busy_timeout', 0)
+    return busy_timeout / 1000 + getattr(settings, 'WRITE_TRANSACTION_MAX_SECONDS', 1)
+
+
+def parse_token(token):
+    """Позиция (updated_at, id) из токена; испорченный токен - ошибка 400"""
+    return decode_position(token, 'since')
+
+
+def changes_after(queryset, token=None, limit=DEFAULT_LIMIT, now=None):
+    """
+    Строки, созданные или измененные после позиции токена,
+    в порядке (updated_at, id), и токен для следующего запроса.
+    :return: (строки, следующий токен, есть ли еще изменения)
+    """
+    settled = (now or timezone.now()) - timedelta(seconds=settle_seconds())
+    queryset = queryset.filter(updated_at__lt=settled).order_by('updated_at', 'id')
+    if token:
+        updated_at, last_id = parse_token(token)
+        queryset = queryset.filter(
+            Q(updated_at__gte=updated_at),
+            Q(updated_at__gt=updated_at) | Q(id__gt=last_id)
+        )
+
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        token = encode_cursor([rows[-1].updated_at, rows[-1].pk])
+    return rows, token, has_more
+
+
+class ChangeFeedMixin:
+    """
+    GET <resource>/changes/?since=<token>&limit=N - лента изменений для синхронизации.
+    Первый запрос без since отдает изменения с начала истории. Удаления
+    (например, перенос в архив) и массовые .update() в ленту не попадают.
+    """
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        rows, token, has_more = changes_after(
+            self.get_queryset(),
+            request.query_params.get('since'),
+            limit
+        )
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'next_since': token,
+            'has_more': has_more,
+        })
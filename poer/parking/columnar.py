@@ -0,0 +1,237 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+import logging
+import os
+import tempfile
+import time
+
+from .importers import chunked
+from .models import ParkingLog, Payment, ParkingLogArchive, PaymentArchive
+from .stats import local_midnight
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Строк в одной группе строк (row group) и в одной пачке чтения из базы
+ROW_GROUP_SIZE = 100000
+FORMATS = ('parquet', 'arrow')
+DATASETS = ('logs', 'payments')
+
+
+class ColumnarUnavailable(Exception):
+    """pyarrow не установлен"""
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ColumnarUnavailable('Для выгрузки в Parquet/Arrow установите pyarrow')
+
+
+def schema(dataset):
+    timestamp = pa.timestamp('us', tz='UTC')
+    if dataset == 'logs':
+        return pa.schema([
+            ('id', pa.int64()),
+            ('car_id', pa.int64()),
+            ('license_plate', pa.string()),
+            ('spot_id', pa.int64()),
+            ('spot', pa.string()),
+            ('entry_time', timestamp),
+            ('exit_time', timestamp),
+            ('is_reservation', pa.bool_()),
+            ('reservation_start', timestamp),
+            ('reservation_end', timestamp),
+            ('archived', pa.bool_()),
+        ])
+    return pa.schema([
+        ('id', pa.int64()),
+        ('parking_log_id', pa.int64()),
+        ('spot_id', pa.int64()),
+        ('amount', pa.decimal128(10, 2)),
+        ('status', pa.string()),
+        ('payment_time', timestamp),
+        ('created_at', timestamp),
+        ('archived', pa.bool_()),
+    ])
+
+
+def _log_rows(start_time, end_time):
+    """Сессии с въездом в [start_time, end_time): горячая таблица, затем архив"""
+    fields = (
+        'car_id', 'car__license_plate', 'spot_id', 'spot__number', 'entry_time', 'exit_time',
+        'is_reservation', 'reservation_start', 'reservation_end',
+    )
+    window = {'entry_time__gte': start_time, 'entry_time__lt': end_time}
+    for row in ParkingLog.objects.filter(**window).order_by('id').values_list(
+        'id', *fields
+    ).iterator(chunk_size=ROW_GROUP_SIZE):
+        yield row + (False,)
+    for row in ParkingLogArchive.objects.filter(**window).order_by('log_id').values_list(
+        'log_id', *fields
+    ).iterator(chunk_size=ROW_GROUP_SIZE):
+        yield row + (True,)
+
+
+def _payment_rows(start_time, end_time):
+    """Платежи, созданные в [start_time, end_time): горячая таблица, затем архив"""
+    window = {'created_at__gte': start_time, 'created_at__lt': end_time}
+    for row in Payment.objects.filter(**window).order_by('id').values_list(
+        'id', 'parking_log_id', 'parking_log__spot_id', 'amount', 'status', 'payment_time', 'created_at'
+    ).iterator(chunk_size=ROW_GROUP_SIZE):
+        yield row + (False,)
+    # В архиве платеж связан с логом через log_id, а не через внешний ключ
+    archived = PaymentArchive.objects.filter(**window).annotate(
+        spot_id=Subquery(ParkingLogArchive.objects.filter(log_id=OuterRef('log_id')).values('spot_id')[:1])
+    )
+    for row in archived.order_by('payment_id').values_list(
+        'payment_id', 'log_id', 'spot_id', 'amount', 'status', 'payment_time', 'created_at'
+    ).iterator(chunk_size=ROW_GROUP_SIZE):
+        yield row + (True,)
+
+
+ROWS = {'logs': _log_rows, 'payments': _payment_rows}
+
+
+def month_range(first, last):
+    """Первые числа месяцев от first до last включительно"""
+    current = first.replace(day=1)
+    while current <= last:
+        yield current
+        current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_bounds(month):
+    following = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return local_midnight(month), local_midnight(following)
+
+
+def export_root():
+    return Path(getattr(settings, 'ANALYTICS_EXPORT_ROOT', settings.BASE_DIR / 'analytics'))
+
+
+def partition_path(dataset, month, fmt='parquet', root=None):
+    """<root>/<dataset>/month=YYYY-MM/part-0.<fmt> - разбиение в стиле Hive"""
+    return Path(root or export_root()) / dataset / f'month={month:%Y-%m}' / f'part-0.{fmt}'
+
+
+def last_change(dataset, start_time, end_time):
+    """
+    Момент последнего изменения строк раздела: updated_at горячих строк
+    и archived_at архивных (перенос в архив меняет поле archived).
+    Удаления строк в обход архивации не видны - для них нужен force.
+    """
+    if dataset == 'logs':
+        hot, archive, field = ParkingLog, ParkingLogArchive, 'entry_time'
+    else:
+        hot, archive, field = Payment, PaymentArchive, 'created_at'
+    window = {f'{field}__gte': start_time, f'{field}__lt': end_time}
+    changes = [
+        hot.objects.filter(**window).aggregate(last=Max('updated_at'))['last'],
+        archive.objects.filter(**window).aggregate(last=Max('archived_at'))['last'],
+    ]
+    changes = [value for value in changes if value]
+    return max(changes) if changes else None
+
+
+def is_complete(dataset, path, month):
+    """
+    Раздел можно не перезаписывать: он записан после окончания месяца,
+    в месяце нет незакрытых сессий и ни одна строка не менялась после начала
+    записи (время изменения файла, см. write_partition).
+    """
+    if not path.exists():
+        return False
+    written = datetime.fromtimestamp(path.stat().st_mtime, tz=dt_timezone.utc)
+    start_time, end_time = month_bounds(month)
+    if written < end_time:
+        return False
+    if dataset == 'logs' and ParkingLog.objects.filter(
+        entry_time__gte=start_time, entry_time__lt=end_time, exit_time__isnull=True
+    ).exists():
+        return False
+    changed = last_change(dataset, start_time, end_time)
+    return changed is None or changed < written
+
+
+def write_partition(dataset, month, path, fmt='parquet'):
+    """
+    Запись месяца в файл группами по ROW_GROUP_SIZE строк прямо из курсора:
+    в памяти находится только текущая пачка. Файл пишется во временный
+    (свой у каждой записи) и заменяется целиком. Время изменения файла -
+    момент начала чтения: по нему is_complete находит строки, измененные позже.
+    :return: число строк
+    """
+    require_pyarrow()
+    table_schema = schema(dataset)
+    start_time, end_time = month_bounds(month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(handle)
+    temporary = Path(temporary)
+    # mkstemp создает файл с правами 0600
+    temporary.chmod(0o644)
+    started = time.time()
+
+    if fmt == 'arrow':
+        writer = pa.ipc.new_file(str(temporary), table_schema)
+    else:
+        writer = pq.ParquetWriter(str(temporary), table_schema, compression='zstd')
+
+    rows = 0
+    try:
+        for chunk in chunked(ROWS[dataset](start_time, end_time), ROW_GROUP_SIZE):
+            columns = list(zip(*chunk))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, table_schema)],
+                schema=table_schema
+            )
+            if fmt == 'arrow':
+                writer.write_batch(batch)
+            else:
+                # Каждая пачка - отдельная группа строк
+                writer.write_table(pa.Table.from_batches([batch]))
+            rows += len(chunk)
+    except BaseException:
+        writer.close()
+        temporary.unlink(missing_ok=True)
+        raise
+    writer.close()
+    os.utime(temporary, (started, started))
+    os.replace(temporary, path)
+    return rows
+
+
+def export_partitions(first, last, datasets=DATASETS, fmt='parquet', root=None, force=False, progress=None):
+    """
+    Выгрузка месяцев first..last. Полные разделы (is_complete) пропускаются,
+    поэтому повторный запуск дописывает новые месяцы, обновляет текущий
+    и закрытые месяцы, данные которых изменились после записи.
+    :return: список (набор, месяц, путь, строк или None для пропущенных)
+    """
+    require_pyarrow()
+    result = []
+    for month in month_range(first, last):
+        for dataset in datasets:
+            path = partition_path(dataset, month, fmt, root)
+            if not force and is_complete(dataset, path, month):
+                result.append((dataset, month, path, None))
+                continue
+            rows = write_partition(dataset, month, path, fmt)
+            logger.info(f"Выгружен раздел {path}: {rows} строк")
+            result.append((dataset, month, path, rows))
+            if progress:
+                progress(dataset, month, rows)
+    return result
+
+
+def parse_month(value):
+    """YYYY-MM -> первое число месяца; ValueError при ошибке"""
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
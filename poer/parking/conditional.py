@@ -0,0 +1,52 @@
+import hashlib
+import time
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from smart_parking.db_router import replica_snapshot, use_replica
+
+from .models import Car
+from .versions import get_version, track_model, CARS_VERSION
+
+track_model(Car, CARS_VERSION)
+
+
+class ConditionalListMixin:
+    """
+    ETag / Last-Modified для списков по версии набора данных.
+    Если версия не изменилась, ответ 304 отдается без запроса к базе
+    и без сериализации. Last-Modified имеет точность в секунду, поэтому
+    не отдается, пока не закончилась секунда последнего изменения:
+    иначе следующее изменение в ту же секунду дало бы тот же заголовок
+    и ошибочный 304 клиенту, который присылает только If-Modified-Since.
+
+    При read_replica = True список читается из реплики SQLite, и версией
+    служит снимок реплики: версия в кэше меняется при записи в основную
+    базу раньше, чем изменение попадает в реплику. Если снимок определить
+    нельзя, список читается из основной базы.
+    """
+    version_name = None
+    read_replica = False
+
+    def list(self, request, *args, **kwargs):
+        snapshot = replica_snapshot() if self.read_replica else None
+        version = snapshot or get_version(self.version_name)
+        # Содержимое зависит от параметров запроса (страница, фильтры)
+        source = 'replica' if snapshot else 'primary'
+        digest = hashlib.md5(f"{source}:{version['token']}:{request.get_full_path()}".encode()).hexdigest()
+        etag = quote_etag(digest)
+        last_modified = int(version['modified'])
+        if time.time() < last_modified + 1:
+            last_modified = None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None and snapshot:
+            with use_replica():
+                response = super().list(request, *args, **kwargs)
+        elif response is None:
+            response = super().list(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'no-cache'
+        return response
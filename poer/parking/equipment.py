@@ -1,9 +1,11 @@
 import cv2
 import numpy as np
 import requests
-from datetime import datetime
+from django.utils import timezone
+from smart_parking.sqlite import run_write
 from .models import Car, ParkingLog, ParkingSpot
 from .plate_recognition import PlateRecognizer
+from .tariffs import bill_session
 import logging
 
 logger = logging.getLogger(__name__)
@@ -111,19 +113,10 @@ class ParkingSystem:
         logger.info(f"Распознан номер {plate_number} с уверенностью {confidence}%")
 
         try:
-            car = Car.objects.get(number=plate_number)
-            available_spot = ParkingSpot.objects.filter(is_available=True).first()
+            car = Car.objects.get(license_plate=plate_number)
+            available_spot = run_write(self._occupy_spot, car)
             
             if available_spot:
-                # Создаем запись о парковке
-                parking_log = ParkingLog.objects.create(
-                    car=car,
-                    spot=available_spot,
-                    entry_time=datetime.now()
-                )
-                available_spot.is_available = False
-                available_spot.save()
-
                 # Открываем шлагбаум
                 if self.barrier.open_barrier():
                     return True, f"Автомобиль {plate_number} успешно въехал на парковку"
@@ -154,18 +147,10 @@ class ParkingSystem:
         logger.info(f"Распознан номер {plate_number} с уверенностью {confidence}%")
 
         try:
-            car = Car.objects.get(number=plate_number)
-            active_log = ParkingLog.objects.filter(car=car, exit_time__isnull=True).first()
+            car = Car.objects.get(license_plate=plate_number)
+            active_log = run_write(self._release_spot, car)
             
             if active_log:
-                # Обновляем запись о парковке
-                active_log.exit_time = datetime.now()
-                active_log.save()
-
-                # Освобождаем место
-                active_log.spot.is_available = True
-                active_log.spot.save()
-
                 # Открываем шлагбаум
                 if self.barrier.open_barrier():
                     return True, f"Автомобиль {plate_number} успешно выехал с парковки"
@@ -176,4 +161,33 @@ class ParkingSystem:
         except Car.DoesNotExist:
             return False, f"Автомобиль с номером {plate_number} не зарегистрирован"
         finally:
-            self.camera.release() 
\ No newline at end of file
+            self.camera.release()
+
+    def _occupy_spot(self, car):
+        """Запись въезда: занимаем первое свободное место (одна короткая транзакция)"""
+        available_spot = ParkingSpot.objects.filter(is_occupied=False, is_reserved=False).first()
+        if available_spot:
+            # Создаем запись о парковке
+            ParkingLog.objects.create(
+                car=car,
+                spot=available_spot,
+                entry_time=timezone.now()
+            )
+            available_spot.is_occupied = True
+            available_spot.save()
+        return available_spot
+
+    def _release_spot(self, car):
+        """Запись выезда: закрываем активный лог и освобождаем место"""
+        active_log = ParkingLog.objects.filter(car=car, exit_time__isnull=True).select_related('spot').first()
+        if active_log:
+            # Обновляем запись о парковке
+            active_log.exit_time = timezone.now()
+            active_log.save()
+            # Доплата по тарифу - ожидающий платеж
+            bill_session(active_log)
+
+            # Освобождаем место
+            active_log.spot.is_occupied = False
+            active_log.spot.save()
+        return active_log
@@ -0,0 +1,169 @@
+import csv
+from datetime import datetime
+from django.utils import timezone
+import xlsxwriter
+
+from .importers import chunked
+from .models import ParkingLog, ParkingLogArchive, PaymentArchive
+
+EXPORT_CHUNK_SIZE = 2000
+# Предел строк листа Excel; дальше выгрузка продолжается на следующем листе
+XLSX_MAX_ROWS = 1048576
+
+# (поле CSV, заголовок XLSX, тип). Строка выгрузки - платеж, а не сессия
+# (сессия повторяется на каждый свой платеж), поэтому поля оплаты названы
+# payment_*; для загрузки через import_logs выгрузка не предназначена
+COLUMNS = (
+    ('log_id', 'ID лога', 'number'),
+    ('license_plate', 'Номер автомобиля', 'text'),
+    ('spot', 'Место', 'text'),
+    ('entry_time', 'Въезд', 'datetime'),
+    ('exit_time', 'Выезд', 'datetime'),
+    ('duration_seconds', 'Длительность, сек', 'number'),
+    ('is_reservation', 'Резервация', 'bool'),
+    ('reservation_start', 'Начало резервации', 'datetime'),
+    ('reservation_end', 'Конец резервации', 'datetime'),
+    ('payment_amount', 'Сумма платежа', 'money'),
+    ('payment_status', 'Статус оплаты', 'text'),
+    ('payment_time', 'Время оплаты', 'datetime'),
+)
+
+LOG_FIELDS = (
+    'car__license_plate', 'spot__number', 'entry_time', 'exit_time',
+    'is_reservation', 'reservation_start', 'reservation_end',
+)
+
+
+def _row(log_id, log, payment):
+    plate, spot, entry_time, exit_time, is_reservation, reservation_start, reservation_end = log
+    duration = (exit_time - entry_time).total_seconds() if exit_time else None
+    return (
+        log_id, plate, spot, entry_time, exit_time, duration,
+        is_reservation, reservation_start, reservation_end
+    ) + tuple(payment)
+
+
+def _filtered(queryset, start_time, end_time):
+    if start_time is not None:
+        queryset = queryset.filter(entry_time__gte=start_time)
+    if end_time is not None:
+        queryset = queryset.filter(entry_time__lt=end_time)
+    return queryset
+
+
+def _archived_rows(start_time, end_time, using, chunk_size):
+    """
+    Архивные сессии с платежами: в архиве нет внешнего ключа, поэтому
+    логи и платежи читаются двумя потоками по возрастанию log_id
+    и соединяются слиянием без загрузки в память.
+    """
+    logs = _filtered(ParkingLogArchive.objects.using(using), start_time, end_time)
+    payments = PaymentArchive.objects.using(using).filter(
+        log_id__in=logs.values('log_id')
+    ).order_by('log_id', 'payment_id').values_list('log_id', 'amount', 'status', 'payment_time')
+    payments = payments.iterator(chunk_size=chunk_size)
+    payment = next(payments, None)
+
+    for log_id, *log in logs.order_by('log_id').values_list('log_id', *LOG_FIELDS).iterator(chunk_size=chunk_size):
+        matched = False
+        while payment is not None and payment[0] <= log_id:
+            if payment[0] == log_id:
+                matched = True
+                yield _row(log_id, log, payment[1:])
+            payment = next(payments, None)
+        if not matched:
+            yield _row(log_id, log, (None, None, None))
+
+
+def export_rows(start_time=None, end_time=None, archived=True, using=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Поток строк выгрузки по COLUMNS: сессии с въездом в [start_time, end_time)
+    (сначала архив, затем горячая таблица), по строке на каждый платеж;
+    сессии без платежей - одной строкой с пустыми полями оплаты.
+    Строки читаются через iterator(), память не зависит от их числа.
+    """
+    if archived:
+        yield from _archived_rows(start_time, end_time, using, chunk_size)
+    logs = _filtered(ParkingLog.objects.using(using), start_time, end_time).order_by('id', 'payment__id')
+    rows = logs.values_list(
+        'id', *LOG_FIELDS, 'payment__amount', 'payment__status', 'payment__payment_time'
+    ).iterator(chunk_size=chunk_size)
+    for log_id, *values in rows:
+        yield _row(log_id, values[:len(LOG_FIELDS)], values[len(LOG_FIELDS):])
+
+
+def csv_value(value, tz):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.astimezone(tz).isoformat()
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: writerow возвращает готовую строку"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSV (UTF-8 с BOM для Excel) пачками байтов по chunk_size строк"""
+    writer = csv.writer(_Echo())
+    # Часовой пояс получается один раз: timezone.localtime() на каждое
+    # значение заметно замедляет выгрузку
+    tz = timezone.get_current_timezone()
+    yield ('\ufeff' + writer.writerow([name for name, _, _ in COLUMNS])).encode()
+    for chunk in chunked(rows, chunk_size):
+        yield ''.join(writer.writerow([csv_value(value, tz) for value in row]) for row in chunk).encode()
+
+
+def write_csv(rows, target):
+    """Запись CSV в открытый бинарный файл"""
+    for data in iter_csv(rows):
+        target.write(data)
+
+
+def write_xlsx(rows, target):
+    """
+    Запись XLSX в режиме constant_memory: каждая строка сбрасывается
+    во временный файл сразу после записи. target - путь или бинарный файл.
+    """
+    tz = timezone.get_current_timezone()
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#D9E1F2', 'border': 1})
+    formats = {
+        'datetime': workbook.add_format({'num_format': 'dd.mm.yyyy hh:mm:ss'}),
+        'money': workbook.add_format({'num_format': '#,##0.00'}),
+    }
+
+    def add_sheet():
+        worksheet = workbook.add_worksheet(f'Логи {len(workbook.worksheets()) + 1}')
+        worksheet.freeze_panes(1, 0)
+        for col, (_, title, _) in enumerate(COLUMNS):
+            worksheet.write_string(0, col, title, header_format)
+        return worksheet
+
+    worksheet = add_sheet()
+    row_index = 1
+    for row in rows:
+        if row_index >= XLSX_MAX_ROWS:
+            worksheet = add_sheet()
+            row_index = 1
+        for col, ((_, _, kind), value) in enumerate(zip(COLUMNS, row)):
+            if value is None:
+                continue
+            if kind == 'datetime':
+                worksheet.write_datetime(row_index, col, value.astimezone(tz).replace(tzinfo=None), formats['datetime'])
+            elif kind == 'money':
+                worksheet.write_number(row_index, col, float(value), formats['money'])
+            elif kind == 'bool':
+                worksheet.write_boolean(row_index, col, value)
+            elif kind == 'number':
+                worksheet.write_number(row_index, col, value)
+            else:
+                worksheet.write_string(row_index, col, value)
+        row_index += 1
+    workbook.close()
@@ -0,0 +1,147 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 2000
+
+
+def dumps(data):
+    """JSON в байтах: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_value(value):
+    """Значение из values() в том же виде, что отдают сериализаторы DRF"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, timedelta):
+        return str(value.total_seconds())
+    return value
+
+
+async def _async_chunks(chunks):
+    """
+    Синхронный поток как асинхронный: каждая пачка готовится в потоке
+    sync_to_async (thread_sensitive - тот же поток и то же соединение с базой)
+    """
+    chunks = iter(chunks)
+    end = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, end)
+            if chunk is end:
+                break
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close)()
+
+
+def streaming_response(request, chunks, content_type):
+    """
+    Потоковый ответ из синхронного генератора. Под ASGI Django полностью
+    буферизует синхронный итератор, поэтому там поток отдается асинхронным.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    ?format=fastjson - списки отдаются потоком через FastJSONListMixin,
+    остальные ответы (объекты, ошибки) кодируются этим рендерером целиком.
+    """
+    media_type = 'application/json'
+    format = 'fastjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class FastJSONListMixin:
+    """
+    Быстрый путь списка: строки читаются через values() без моделей
+    и сериализаторов и отдаются потоком пачками по CHUNK_SIZE, поэтому
+    память не растет с размером страницы.
+    fast_fields - пары (поле ответа, поле для values()).
+    """
+    fast_fields = ()
+
+    def get_renderers(self):
+        return super().get_renderers() + [FastJSONRenderer()]
+
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, 'format', None) != FastJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # База (реплика или основная) выбирается сейчас: поток читается
+        # уже после выхода из view и из блока use_replica()
+        queryset = queryset.using(queryset.db)
+        lookups = [lookup for name, lookup in self.fast_fields]
+
+        paginator = self.paginator
+        limit = None
+        if paginator is not None:
+            queryset = paginator.page_queryset(queryset, request)
+            limit = paginator.page_size
+            if paginator.time_field not in lookups:
+                lookups.append(paginator.time_field)
+        rows = queryset.values(*lookups)
+        if limit is not None:
+            rows = rows[:limit + 1]
+
+        response = streaming_response(request, self.fast_stream(rows, paginator, limit), 'application/json')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def fast_row(self, row, now):
+        return {name: json_value(row[lookup]) for name, lookup in self.fast_fields}
+
+    def fast_stream(self, rows, paginator, limit):
+        now = timezone.now()
+        rows = rows.iterator(chunk_size=CHUNK_SIZE)
+        page = islice(rows, limit) if limit is not None else rows
+
+        yield b'{"results":['
+        separator = b''
+        last = None
+        while True:
+            batch = list(islice(page, CHUNK_SIZE))
+            if not batch:
+                break
+            last = batch[-1]
+            yield separator + dumps([self.fast_row(row, now) for row in batch])[1:-1]
+            separator = b','
+
+        next_link = None
+        if paginator is not None and last is not None and next(rows, None) is not None:
+            next_link = paginator.get_next_link(paginator.position(last))
+        yield b'],"next":' + dumps(next_link) + b'}'
@@ -0,0 +1,251 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import logging
+
+from .models import Car, ParkingSpot, ParkingLog, Payment, ImportCheckpoint
+from .plates import index_unindexed_cars
+from .rollups import add_closed_logs, add_paid_payments
+from .versions import bump_version, CARS_VERSION, SPOTS_VERSION, LOGS_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class ImportDataError(Exception):
+    """Ошибка в строке входного файла"""
+
+
+def iter_records(path, fmt=None):
+    """
+    Потоковое чтение записей из CSV (с заголовком) или JSONL.
+    Формат определяется по расширению файла, если не указан явно.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def chunked(iterable, size):
+    """Разбиение потока на списки фиксированного размера"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_time(value):
+    """Разбор даты-времени; наивные значения считаются локальным временем"""
+    if not value:
+        return None
+    parsed = parse_datetime(value) if isinstance(value, str) else value
+    if parsed is None:
+        raise ImportDataError(f'Неверный формат времени: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def require(record, field):
+    """Обязательное поле записи"""
+    value = record.get(field)
+    if value in (None, ''):
+        raise ImportDataError(f'Не указано поле {field}: {record}')
+    return str(value).strip()
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'y', 'да')
+
+
+PAYMENT_STATUSES = {value for value, _ in Payment.PAYMENT_STATUS_CHOICES}
+
+
+def parse_amount(value):
+    """Сумма платежа: конечное неотрицательное число с точностью до копеек"""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ImportDataError(f'Неверная сумма: {value}')
+    if not amount.is_finite() or amount < 0:
+        raise ImportDataError(f'Неверная сумма: {value}')
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_status(value):
+    """Статус платежа из Payment.PAYMENT_STATUS_CHOICES (по умолчанию completed)"""
+    status = str(value or '').strip() or 'completed'
+    if status not in PAYMENT_STATUSES:
+        raise ImportDataError(f'Неверный статус платежа: {value}')
+    return status
+
+
+class Checkpoint:
+    """
+    Прогресс импорта в базе: количество уже зафиксированных строк.
+    Сохраняется в той же транзакции, что и пачка, поэтому после сбоя
+    повторный запуск продолжает ровно с первой незафиксированной строки.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def load(self):
+        return ImportCheckpoint.objects.filter(key=self.key).values_list('rows', flat=True).first() or 0
+
+    def save(self, rows):
+        ImportCheckpoint.objects.update_or_create(key=self.key, defaults={'rows': rows})
+
+    def clear(self):
+        ImportCheckpoint.objects.filter(key=self.key).delete()
+
+
+class BaseImporter:
+    """Пакетный импорт: одна транзакция и один bulk-запрос на пачку"""
+    # bulk_create не отправляет сигналы: версии кэшей меняются после каждой пачки
+    version_names = ()
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.car_ids = {}
+
+    def run(self, records, skip=0, checkpoint=None):
+        """
+        Импорт потока записей.
+        :param skip: количество строк, уже импортированных ранее
+        :return: (количество строк, длительность в секундах)
+        """
+        records = islice(records, skip, None)
+        done = skip
+        started = time.monotonic()
+
+        for chunk in chunked(records, self.chunk_size):
+            chunk_started = time.monotonic()
+            with transaction.atomic():
+                self.import_chunk(chunk)
+                if checkpoint:
+                    checkpoint.save(done + len(chunk))
+            done += len(chunk)
+            if self.version_names:
+                bump_version(*self.version_names)
+            if self.progress:
+                elapsed = time.monotonic() - chunk_started
+                self.progress(done, len(chunk) / elapsed if elapsed else 0)
+
+        return done - skip, time.monotonic() - started
+
+    def import_chunk(self, chunk):
+        raise NotImplementedError
+
+    def resolve_cars(self, plates):
+        """Получение id автомобилей по номерам; отсутствующие создаются"""
+        missing = {plate for plate in plates if plate not in self.car_ids}
+        if missing:
+            Car.objects.bulk_create(
+                [Car(license_plate=plate) for plate in missing],
+                ignore_conflicts=True
+            )
+            # bulk_create не отправляет сигналы, индекс номеров строится явно
+            index_unindexed_cars()
+            self.car_ids.update(
+                Car.objects.filter(license_plate__in=missing).values_list('license_plate', 'id')
+            )
+        return self.car_ids
+
+
+class CarImporter(BaseImporter):
+    """Импорт автомобилей с обновлением существующих по номеру"""
+    version_names = (CARS_VERSION,)
+
+    def import_chunk(self, chunk):
+        cars = {}
+        for record in chunk:
+            plate = require(record, 'license_plate')
+            # Последняя запись с одинаковым номером перекрывает предыдущие
+            cars[plate] = Car(
+                license_plate=plate,
+                owner=record.get('owner') or None,
+                phone=record.get('phone') or None,
+            )
+
+        Car.objects.bulk_create(
+            list(cars.values()),
+            update_conflicts=True,
+            unique_fields=['license_plate'],
+            update_fields=['owner', 'phone', 'updated_at']
+        )
+        index_unindexed_cars()
+
+
+class LogImporter(BaseImporter):
+    """Импорт исторических въездов/выездов и платежей по ним"""
+    version_names = (CARS_VERSION, SPOTS_VERSION, LOGS_VERSION)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spot_ids = dict(ParkingSpot.objects.values_list('number', 'id'))
+
+    def resolve_spots(self, numbers):
+        """Получение id мест по номерам; отсутствующие создаются"""
+        missing = {number for number in numbers if number not in self.spot_ids}
+        if missing:
+            ParkingSpot.objects.bulk_create(
+                [ParkingSpot(number=number) for number in missing],
+                ignore_conflicts=True
+            )
+            self.spot_ids.update(
+                ParkingSpot.objects.filter(number__in=missing).values_list('number', 'id')
+            )
+        return self.spot_ids
+
+    def import_chunk(self, chunk):
+        keys = [(require(record, 'license_plate'), require(record, 'spot')) for record in chunk]
+        car_ids = self.resolve_cars({plate for plate, _ in keys})
+        spot_ids = self.resolve_spots({number for _, number in keys})
+
+        logs = []
+        for (plate, number), record in zip(keys, chunk):
+            logs.append(ParkingLog(
+                car_id=car_ids[plate],
+                spot_id=spot_ids[number],
+                entry_time=parse_time(require(record, 'entry_time')),
+                exit_time=parse_time(record.get('exit_time')),
+                is_reservation=parse_bool(record.get('is_reservation')),
+                reservation_start=parse_time(record.get('reservation_start')),
+                reservation_end=parse_time(record.get('reservation_end')),
+            ))
+        # SQLite и PostgreSQL возвращают первичные ключи из bulk_create
+        ParkingLog.objects.bulk_create(logs)
+
+        payments = []
+        for log, record in zip(logs, chunk):
+            if record.get('amount') in (None, ''):
+                continue
+            payments.append(Payment(
+                parking_log_id=log.id,
+                amount=parse_amount(record['amount']),
+                status=parse_status(record.get('payment_status')),
+                payment_time=parse_time(record.get('payment_time')) or log.exit_time,
+            ))
+        Payment.objects.bulk_create(payments)
+
+        # Почасовые итоги: сигналы при bulk_create не отправляются
+        add_closed_logs(logs)
+        add_paid_payments(payments, {log.id: log.spot_id for log in logs})
@@ -0,0 +1,44 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from parking.importers import iter_records, Checkpoint, ImportDataError, DEFAULT_CHUNK_SIZE
+
+class ImportCommand(BaseCommand):
+    """Общая часть команд потокового импорта из CSV/JSONL"""
+    importer_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file (.csv with header or .jsonl)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Override format detection')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            '--checkpoint',
+            help='Progress key (defaults to the absolute input path); committed rows are skipped on rerun'
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and start over')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options['checkpoint'] or os.path.abspath(options['path']))
+        if options['restart']:
+            checkpoint.clear()
+        skip = checkpoint.load()
+        if skip:
+            self.stdout.write(f'Resuming after {skip} already imported rows')
+
+        importer = self.importer_class(
+            chunk_size=options['chunk_size'],
+            progress=lambda done, rate: self.stdout.write(f'{done} rows ({rate:,.0f} rows/sec)')
+        )
+        try:
+            rows, elapsed = importer.run(
+                iter_records(options['path'], options['format']),
+                skip=skip,
+                checkpoint=checkpoint
+            )
+        except (ImportDataError, ValueError, KeyError) as e:
+            raise CommandError(f'Import stopped after {checkpoint.load()} rows: {e}')
+
+        checkpoint.clear()
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec)'
+        ))
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from parking.archive import (
+    archive_cutoff, archive_logs, archivable_logs, DEFAULT_BATCH_SIZE
+)
+
+class Command(BaseCommand):
+    help = 'Move closed parking logs older than the archive horizon into archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Archive horizon in days (defaults to PARKING_ARCHIVE_HORIZON_DAYS)'
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count archivable logs')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+        else:
+            cutoff = archive_cutoff()
+
+        if options['dry_run']:
+            count = archivable_logs(cutoff).count()
+            self.stdout.write(f'{count} logs closed before {cutoff:%Y-%m-%d %H:%M} can be archived')
+            return
+
+        # Каждая пачка фиксируется отдельно, поэтому команду можно
+        # прервать и перезапустить без потери или дублирования данных
+        total_logs, total_payments = archive_logs(
+            cutoff,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            progress=lambda batch, logs, payments: self.stdout.write(
+                f'Batch {batch}: {logs} logs, {payments} payments'
+            )
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total_logs} logs and {total_payments} payments closed before {cutoff:%Y-%m-%d %H:%M}'
+        ))
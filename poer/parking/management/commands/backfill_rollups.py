@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from parking.rollups import rebuild_rollups, rollup_bounds
+
+class Command(BaseCommand):
+    help = 'Rebuild hourly occupancy and revenue rollups from parking logs and payments (including the archive)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild, YYYY-MM-DD (defaults to the earliest log or payment)')
+        parser.add_argument('--until', help='Last day to rebuild, YYYY-MM-DD (defaults to the latest exit or payment)')
+
+    def parse_day(self, value):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def handle(self, *args, **options):
+        bounds = rollup_bounds()
+        if bounds is None and not options['since']:
+            self.stdout.write('Nothing to rebuild')
+            return
+        start = self.parse_day(options['since']) if options['since'] else bounds[0]
+        if options['until']:
+            end = self.parse_day(options['until']) + timedelta(days=1)
+        else:
+            end = bounds[1] if bounds else timezone.now()
+        if end <= start:
+            raise CommandError('--until must not be earlier than --since')
+
+        def progress(month, sessions, revenue):
+            self.stdout.write(f'{month:%Y-%m}: {sessions} occupancy rows, {revenue} revenue rows')
+
+        sessions, revenue = rebuild_rollups(start, end, progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {sessions} occupancy and {revenue} revenue rows from {start:%Y-%m-%d} to {end:%Y-%m-%d %H:%M}'
+        ))
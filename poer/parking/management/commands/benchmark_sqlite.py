@@ -0,0 +1,152 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from smart_parking.sqlite import apply_pragmas, WriterQueue
+
+SCHEMA = """
+CREATE TABLE spot (id INTEGER PRIMARY KEY, is_occupied INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE log (
+    id INTEGER PRIMARY KEY,
+    spot_id INTEGER NOT NULL,
+    entry_time REAL NOT NULL,
+    exit_time REAL
+);
+CREATE INDEX log_spot ON log (spot_id);
+"""
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class Command(BaseCommand):
+    help = 'Compare default SQLite settings with the tuned profile under concurrent gate writes and report reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode')
+        parser.add_argument('--spots', type=int, default=200)
+        parser.add_argument('--rows', type=int, default=100000, help='Rows preloaded into the log table')
+
+    def handle(self, *args, **options):
+        for mode in ('default', 'tuned'):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.prepare(path, options)
+                stats = self.run_mode(mode, path, options)
+            self.report(mode, stats)
+
+    def prepare(self, path, options):
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO spot (id) VALUES (?)', ((i,) for i in range(options['spots'])))
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO log (spot_id, entry_time, exit_time) VALUES (?, ?, ?)',
+            (
+                (random.randrange(options['spots']), now - i, now - i + 3600)
+                for i in range(options['rows'])
+            )
+        )
+        conn.commit()
+        conn.close()
+
+    def connect(self, mode, path):
+        if mode == 'default':
+            # Как Django по умолчанию: таймаут 5 с, журнал DELETE, отложенные транзакции
+            return sqlite3.connect(path, timeout=5, check_same_thread=False)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_pragmas(conn.cursor(), settings.SQLITE_PRAGMAS)
+        return conn
+
+    def run_mode(self, mode, path, options):
+        local = threading.local()
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'writes': [], 'reads': [], 'errors': 0}
+
+        def get_conn():
+            if not hasattr(local, 'conn'):
+                local.conn = self.connect(mode, path)
+            return local.conn
+
+        def write_once():
+            conn = get_conn()
+            spot_id = random.randrange(options['spots'])
+            try:
+                if mode == 'tuned':
+                    conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    'INSERT INTO log (spot_id, entry_time) VALUES (?, ?)', (spot_id, time.time())
+                )
+                conn.execute('UPDATE spot SET is_occupied = 1 - is_occupied WHERE id = ?', (spot_id,))
+                conn.execute('COMMIT') if mode == 'tuned' else conn.commit()
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+
+        writer = WriterQueue(name='bench-writer') if mode == 'tuned' else None
+
+        def writer_loop():
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    if writer:
+                        writer.call(write_once)
+                    else:
+                        write_once()
+                except sqlite3.OperationalError:
+                    with lock:
+                        stats['errors'] += 1
+                    continue
+                with lock:
+                    stats['writes'].append(time.perf_counter() - started)
+
+        def reader_loop():
+            conn = self.connect(mode, path)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute(
+                        'SELECT spot_id, COUNT(*), SUM(exit_time - entry_time) FROM log GROUP BY spot_id'
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    with lock:
+                        stats['errors'] += 1
+                    continue
+                with lock:
+                    stats['reads'].append(time.perf_counter() - started)
+            conn.close()
+
+        threads = [threading.Thread(target=writer_loop) for _ in range(options['writers'])]
+        threads += [threading.Thread(target=reader_loop) for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        stats['duration'] = options['duration']
+        return stats
+
+    def report(self, mode, stats):
+        writes, reads = stats['writes'], stats['reads']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{mode} mode'))
+        self.stdout.write(
+            f"  writes: {len(writes) / stats['duration']:,.0f}/s, "
+            f"p50 {percentile(writes, 0.5) * 1000:.1f} ms, p99 {percentile(writes, 0.99) * 1000:.1f} ms"
+        )
+        self.stdout.write(
+            f"  reads:  {len(reads) / stats['duration']:,.1f}/s, "
+            f"p50 {percentile(reads, 0.5) * 1000:.1f} ms, p99 {percentile(reads, 0.99) * 1000:.1f} ms"
+        )
+        self.stdout.write(f"  'database is locked' errors: {stats['errors']}")
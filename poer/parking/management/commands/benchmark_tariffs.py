@@ -0,0 +1,66 @@
+import time
+import numpy as np
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from parking.tariffs import compile_tariff
+
+# Тариф с правилами всех видов, если --configured не указан
+EXAMPLE_TARIFF = {
+    'rate': 100,
+    'rules': [
+        {'days': [0, 1, 2, 3, 4], 'start': '08:00', 'end': '20:00', 'rate': 150},
+        {'days': [5, 6], 'rate': 80},
+        {'start': '22:00', 'end': '06:00', 'rate': 30},
+    ],
+    'grace_minutes': 15,
+    'daily_cap': 1500,
+    'step_minutes': 15,
+}
+
+class Command(BaseCommand):
+    help = 'Price random parking sessions with the vectorized tariff engine and compare with per-session pricing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365, help='Entry times spread over this many days')
+        parser.add_argument('--mean-hours', type=float, default=3.0, help='Mean session length (exponential)')
+        parser.add_argument('--sample', type=int, default=2000, help='Sessions priced one by one for comparison')
+        parser.add_argument('--configured', action='store_true', help='Use settings.PARKING_TARIFF instead of the example tariff')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        config = getattr(settings, 'PARKING_TARIFF', {}) if options['configured'] else EXAMPLE_TARIFF
+        started = time.perf_counter()
+        tariff = compile_tariff(config)
+        compiled = time.perf_counter() - started
+
+        rng = np.random.default_rng(options['seed'])
+        base = datetime(2025, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+        entry = base + rng.uniform(0, options['days'] * 86400, options['sessions'])
+        exit = entry + rng.exponential(options['mean_hours'] * 3600, options['sessions'])
+
+        started = time.perf_counter()
+        amounts = tariff.price_batch(entry, exit)
+        batch = time.perf_counter() - started
+
+        sample = min(options['sample'], options['sessions'])
+        started = time.perf_counter()
+        single = [
+            float(tariff.price(datetime.fromtimestamp(a, dt_timezone.utc), datetime.fromtimestamp(b, dt_timezone.utc)))
+            for a, b in zip(entry[:sample], exit[:sample])
+        ]
+        one_by_one = (time.perf_counter() - started) / max(sample, 1)
+        mismatches = int(np.count_nonzero(np.abs(np.array(single) - amounts[:sample]) > 0.005))
+
+        self.stdout.write(f'compile: {compiled * 1000:.2f} ms')
+        self.stdout.write(
+            f"batch: {options['sessions']} sessions in {batch:.3f} s "
+            f"({options['sessions'] / batch:,.0f} sessions/s), total {amounts.sum():,.2f}"
+        )
+        self.stdout.write(
+            f'one by one: {one_by_one * 1e6:.1f} us/session, '
+            f"{one_by_one * options['sessions']:.1f} s projected for the batch"
+        )
+        style = self.style.SUCCESS if not mismatches else self.style.ERROR
+        self.stdout.write(style(f'{mismatches} mismatches in {sample} sampled sessions'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from parking.columnar import (
+    DATASETS, FORMATS, ColumnarUnavailable, export_partitions, export_root, parse_month
+)
+from parking.models import ParkingLog, ParkingLogArchive
+
+class Command(BaseCommand):
+    help = 'Export parking logs and payments to month-partitioned Parquet (or Arrow IPC) files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help='Dataset root (defaults to settings.ANALYTICS_EXPORT_ROOT)')
+        parser.add_argument('--since', help='First month, YYYY-MM (defaults to the earliest entry)')
+        parser.add_argument('--until', help='Last month, YYYY-MM (defaults to the current month)')
+        parser.add_argument('--dataset', choices=DATASETS, action='append', help='Export only this dataset')
+        parser.add_argument('--format', choices=FORMATS, default='parquet')
+        parser.add_argument('--force', action='store_true', help='Rewrite partitions of closed months too')
+
+    def handle(self, *args, **options):
+        try:
+            first = parse_month(options['since']) if options['since'] else self.earliest_month()
+            last = parse_month(options['until']) if options['until'] else timezone.localdate().replace(day=1)
+        except ValueError as e:
+            raise CommandError(f'Invalid month: {e}')
+        if first is None:
+            self.stdout.write('Nothing to export')
+            return
+
+        try:
+            partitions = export_partitions(
+                first, last,
+                datasets=options['dataset'] or DATASETS,
+                fmt=options['format'],
+                root=options['output_dir'],
+                force=options['force'],
+                progress=lambda dataset, month, rows: self.stdout.write(f'{dataset} {month:%Y-%m}: {rows} rows')
+            )
+        except ColumnarUnavailable as e:
+            raise CommandError(str(e))
+
+        written = sum(1 for *_, rows in partitions if rows is not None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} partitions, kept {len(partitions) - written} complete ones "
+            f"under {options['output_dir'] or export_root()}"
+        ))
+
+    @staticmethod
+    def earliest_month():
+        candidates = [
+            ParkingLog.objects.aggregate(first=Min('entry_time'))['first'],
+            ParkingLogArchive.objects.aggregate(first=Min('entry_time'))['first'],
+        ]
+        candidates = [value for value in candidates if value]
+        if not candidates:
+            return None
+        return timezone.localtime(min(candidates)).date().replace(day=1)
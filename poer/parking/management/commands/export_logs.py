@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from parking.exports import export_rows, write_csv, write_xlsx
+from parking.stats import local_midnight
+
+class Command(BaseCommand):
+    help = 'Export parking sessions with their payments to CSV or XLSX (constant memory)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file (.csv or .xlsx)')
+        parser.add_argument('--since', help='First entry day, YYYY-MM-DD')
+        parser.add_argument('--until', help='Last entry day (inclusive), YYYY-MM-DD')
+        parser.add_argument('--no-archive', action='store_true', help='Skip archived sessions')
+
+    def handle(self, *args, **options):
+        try:
+            start_time = local_midnight(self.parse_day(options['since'])) if options['since'] else None
+            end_time = local_midnight(self.parse_day(options['until']) + timedelta(days=1)) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(e)
+
+        rows = 0
+
+        def counted(source):
+            nonlocal rows
+            for row in source:
+                rows += 1
+                yield row
+
+        source = counted(export_rows(start_time, end_time, archived=not options['no_archive']))
+        if options['path'].endswith('.xlsx'):
+            write_xlsx(source, options['path'])
+        else:
+            with open(options['path'], 'wb') as f:
+                write_csv(source, f)
+        self.stdout.write(self.style.SUCCESS(f"Exported {rows} rows to {options['path']}"))
+
+    @staticmethod
+    def parse_day(value):
+        return datetime.strptime(value, '%Y-%m-%d').date()
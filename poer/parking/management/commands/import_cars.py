@@ -0,0 +1,6 @@
+from parking.importers import CarImporter
+from ._importing import ImportCommand
+
+class Command(ImportCommand):
+    help = 'Bulk import or update cars (license_plate, owner, phone) from CSV/JSONL'
+    importer_class = CarImporter
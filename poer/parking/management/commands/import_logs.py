@@ -0,0 +1,9 @@
+from parking.importers import LogImporter
+from ._importing import ImportCommand
+
+class Command(ImportCommand):
+    help = (
+        'Bulk import historical entry/exit records (license_plate, spot, entry_time, exit_time, '
+        'is_reservation, amount, payment_status, payment_time) from CSV/JSONL'
+    )
+    importer_class = LogImporter
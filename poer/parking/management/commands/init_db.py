@@ -60,13 +60,13 @@ class Command(BaseCommand):
         if not Car.objects.exists():
             Car.objects.create(
                 license_plate='ABC123',
-                owner_name='John Doe',
-                phone_number='+1234567890'
+                owner='John Doe',
+                phone='+1234567890'
             )
             Car.objects.create(
                 license_plate='XYZ789',
-                owner_name='Jane Smith',
-                phone_number='+0987654321'
+                owner='Jane Smith',
+                phone='+0987654321'
             )
 
         self.stdout.write(self.style.SUCCESS('Successfully initialized database')) 
\ No newline at end of file
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from parking.plates import reindex_cars, index_unindexed_cars
+
+class Command(BaseCommand):
+    help = 'Rebuild normalized plates and the trigram index used by plate search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Index only cars that have no normalized plate yet'
+        )
+
+    def handle(self, *args, **options):
+        if options['missing_only']:
+            total = index_unindexed_cars(options['batch_size'])
+        else:
+            total = reindex_cars(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} cars'))
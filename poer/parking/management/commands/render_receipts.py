@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from parking.columnar import parse_month
+from parking.receipts import receipts_root, write_receipts_zip
+
+class Command(BaseCommand):
+    help = 'Render PDF receipts of payments completed in a month into a ZIP archive (process pool)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help='Month, YYYY-MM')
+        parser.add_argument('--output', help='ZIP file (defaults to receipts_YYYY_MM.zip)')
+        parser.add_argument('--workers', type=int, help='Worker processes (defaults to settings.RECEIPT_WORKERS or CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            month = parse_month(options['month'])
+        except ValueError as e:
+            raise CommandError(f'Invalid month: {e}')
+        output = options['output'] or f'receipts_{month:%Y_%m}.zip'
+
+        count = write_receipts_zip(
+            month, output,
+            workers=options['workers'],
+            progress=lambda count: self.stdout.write(f'{count} receipts') if count % 10000 == 0 else None
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} receipts to {output} (cached under {receipts_root()})'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from smart_parking.db_router import sync_replica, REPLICA_ALIAS
+from parking.versions import bump_version, REPLICA_VERSIONS
+
+class Command(BaseCommand):
+    help = 'Refresh the read replica SQLite file from the primary database'
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError(f'Database alias "{REPLICA_ALIAS}" is not configured')
+        sync_replica()
+        bump_version(*REPLICA_VERSIONS)
+        self.stdout.write(self.style.SUCCESS(
+            f"Replica {settings.DATABASES[REPLICA_ALIAS]['NAME']} is up to date"
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-19 09:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0002_car_owner_car_phone_parkinglog_is_reservation_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.BigIntegerField(unique=True, verbose_name='ID исходного платежа')),
+                ('log_id', models.BigIntegerField(db_index=True, verbose_name='ID исходного лога')),
+                ('period', models.CharField(db_index=True, max_length=7, verbose_name='Период (ГГГГ-ММ)')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('completed', 'Оплачено'), ('failed', 'Ошибка оплаты')], max_length=20, verbose_name='Статус')),
+                ('payment_time', models.DateTimeField(blank=True, null=True, verbose_name='Время оплаты')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Архивный платеж',
+                'verbose_name_plural': 'Архив платежей',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['payment_time'], name='parking_archpay_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParkingLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log_id', models.BigIntegerField(unique=True, verbose_name='ID исходного лога')),
+                ('period', models.CharField(db_index=True, max_length=7, verbose_name='Период (ГГГГ-ММ)')),
+                ('entry_time', models.DateTimeField(verbose_name='Время въезда')),
+                ('exit_time', models.DateTimeField(verbose_name='Время выезда')),
+                ('is_reservation', models.BooleanField(default=False, verbose_name='Резервация')),
+                ('reservation_start', models.DateTimeField(blank=True, null=True, verbose_name='Начало резервации')),
+                ('reservation_end', models.DateTimeField(blank=True, null=True, verbose_name='Конец резервации')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='parking.car', verbose_name='Автомобиль')),
+                ('spot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='parking.parkingspot', verbose_name='Парковочное место')),
+            ],
+            options={
+                'verbose_name': 'Архивный лог парковки',
+                'verbose_name_plural': 'Архив логов парковки',
+                'ordering': ['-entry_time'],
+                'indexes': [models.Index(fields=['entry_time'], name='parking_archlog_entry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0003_parkinglogarchive_paymentarchive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['-entry_time', 'id'], name='parking_log_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-created_at', 'id'], name='parking_payment_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['updated_at', 'id'], name='parking_log_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['updated_at', 'id'], name='parking_payment_changes_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+GRAM_SIZE = 3
+LOOKALIKES = str.maketrans('АВЕКМНОРСТУХ', 'ABEKMHOPCTYX')
+
+
+def build_plate_index(apps, schema_editor):
+    # Копия normalize_plate/plate_grams из parking.plates на момент миграции
+    Car = apps.get_model('parking', 'Car')
+    PlateTrigram = apps.get_model('parking', 'PlateTrigram')
+    cars = list(Car.objects.only('id', 'license_plate'))
+    trigrams = []
+    for car in cars:
+        value = (car.license_plate or '').upper().translate(LOOKALIKES)
+        car.plate_normalized = ''.join(ch for ch in value if ch.isalnum())
+        trigrams.extend(
+            PlateTrigram(car_id=car.id, gram=gram)
+            for gram in {car.plate_normalized[i:i + GRAM_SIZE] for i in range(len(car.plate_normalized) - GRAM_SIZE + 1)}
+        )
+    Car.objects.bulk_update(cars, ['plate_normalized'], batch_size=500)
+    PlateTrigram.objects.bulk_create(trigrams, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0005_changefeed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='plate_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20, verbose_name='Нормализованный номер'),
+        ),
+        migrations.CreateModel(
+            name='PlateTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plate_trigrams', to='parking.car')),
+            ],
+            options={
+                'verbose_name': 'Триграмма номера',
+                'verbose_name_plural': 'Триграммы номеров',
+                'constraints': [models.UniqueConstraint(fields=('gram', 'car'), name='parking_plate_trigram_uniq')],
+            },
+        ),
+        migrations.RunPython(build_plate_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0006_plate_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'payment_time'], name='parking_payment_report_idx'),
+        ),
+    ]
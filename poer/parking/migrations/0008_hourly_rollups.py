@@ -0,0 +1,57 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    # Отчеты читают итоги сразу после обновления (PARKING_REPORT_ROLLUPS),
+    # поэтому они заполняются по уже накопленным логам и платежам
+    from parking.rollups import rebuild_rollups, rollup_bounds
+
+    bounds = rollup_bounds(apps)
+    if bounds:
+        rebuild_rollups(*bounds, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0007_payment_report_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Начало часа')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма')),
+                ('payments', models.PositiveIntegerField(default=0, verbose_name='Оплат')),
+                ('spot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='parking.parkingspot', verbose_name='Парковочное место')),
+            ],
+            options={
+                'verbose_name': 'Почасовая выручка',
+                'verbose_name_plural': 'Почасовая выручка',
+                'indexes': [models.Index(fields=['hour'], name='parking_hourly_rev_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('spot', 'hour'), name='parking_hourly_revenue_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySpotStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Начало часа')),
+                ('occupied_seconds', models.FloatField(default=0, verbose_name='Занято, секунд')),
+                ('entries', models.PositiveIntegerField(default=0, verbose_name='Въездов')),
+                ('spot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='parking.parkingspot', verbose_name='Парковочное место')),
+            ],
+            options={
+                'verbose_name': 'Почасовая загрузка места',
+                'verbose_name_plural': 'Почасовая загрузка мест',
+                'indexes': [models.Index(fields=['hour'], name='parking_hourly_spot_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('spot', 'hour'), name='parking_hourly_spot_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:23
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0008_hourly_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('daily', 'Ежедневный отчет'), ('monthly', 'Месячный отчет')], max_length=20, verbose_name='Тип отчета')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('params_key', models.CharField(max_length=64, verbose_name='Ключ параметров')),
+                ('is_final', models.BooleanField(default=False, verbose_name='Период закрыт')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('file_name', models.CharField(blank=True, default='', max_length=100, verbose_name='Файл результата')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало построения')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание построения')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Задание на отчет',
+                'verbose_name_plural': 'Задания на отчеты',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['params_key', 'status'], name='parking_reportjob_key_idx')],
+            },
+        ),
+    ]
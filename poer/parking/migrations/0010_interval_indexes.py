@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0009_report_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['entry_time', 'exit_time', 'spot'], name='parking_log_interval_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(condition=models.Q(('exit_time__isnull', True)), fields=['spot', 'entry_time'], name='parking_log_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglogarchive',
+            index=models.Index(fields=['entry_time', 'exit_time', 'spot'], name='parking_archlog_interval_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0010_interval_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['exit_time', 'entry_time', 'spot'], name='parking_log_exit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglogarchive',
+            index=models.Index(fields=['exit_time', 'entry_time', 'spot'], name='parking_archlog_exit_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0012_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Отметка исполнителя'),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='worker',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='Исполнитель'),
+        ),
+    ]
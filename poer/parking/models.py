@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
+import uuid
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import post_migrate
@@ -94,6 +95,7 @@ class ParkingSpot(models.Model):
 class Car(models.Model):
     """Модель автомобиля"""
     license_plate = models.CharField(max_length=20, unique=True, verbose_name="Номер автомобиля")
+    plate_normalized = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False, verbose_name="Нормализованный номер")
     owner = models.CharField(max_length=100, verbose_name="Владелец", null=True, blank=True)
     phone = models.CharField(max_length=20, verbose_name="Телефон", null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -107,6 +109,21 @@ class Car(models.Model):
     def __str__(self):
         return f"{self.license_plate} ({self.owner or 'Неизвестный владелец'})"
 
+class PlateTrigram(models.Model):
+    """Триграмма нормализованного номера автомобиля (индекс поиска по подстроке)"""
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='plate_trigrams')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        verbose_name = "Триграмма номера"
+        verbose_name_plural = "Триграммы номеров"
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'car'], name='parking_plate_trigram_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} ({self.car_id})"
+
 class ParkingLog(models.Model):
     """Модель лога въезда/выезда"""
     car = models.ForeignKey(Car, on_delete=models.CASCADE, verbose_name="Автомобиль")
@@ -123,6 +140,22 @@ class ParkingLog(models.Model):
         verbose_name = "Лог парковки"
         verbose_name_plural = "Логи парковки"
         ordering = ['-entry_time']
+        indexes = [
+            # Ключ постраничного вывода API (-entry_time, id)
+            models.Index(fields=['-entry_time', 'id'], name='parking_log_keyset_idx'),
+            # Лента изменений API (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='parking_log_changes_idx'),
+            # Интервалы сессий для аналитики загрузки: чтение только из индекса
+            models.Index(fields=['entry_time', 'exit_time', 'spot'], name='parking_log_interval_idx'),
+            # Незакрытые сессии (отчеты добавляют их к почасовым итогам)
+            models.Index(
+                fields=['spot', 'entry_time'],
+                condition=models.Q(exit_time__isnull=True),
+                name='parking_log_open_idx'
+            ),
+            # Начисления по тарифу за сессии, закрытые в периоде
+            models.Index(fields=['exit_time', 'entry_time', 'spot'], name='parking_log_exit_idx'),
+        ]
 
     def __str__(self):
         return f"{self.car} - {self.spot} ({self.entry_time})"
@@ -152,10 +185,167 @@ class Payment(models.Model):
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
         ordering = ['-created_at']
+        indexes = [
+            # Ключ постраничного вывода API (-created_at, id)
+            models.Index(fields=['-created_at', 'id'], name='parking_payment_keyset_idx'),
+            # Лента изменений API (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='parking_payment_changes_idx'),
+            # Отчеты по выручке за период (status = ... AND payment_time BETWEEN ...)
+            models.Index(fields=['status', 'payment_time'], name='parking_payment_report_idx'),
+        ]
 
     def __str__(self):
         return f"Платеж {self.id} - {self.amount} руб."
 
+class ParkingLogArchive(models.Model):
+    """Архивная (холодная) копия закрытого лога парковки"""
+    log_id = models.BigIntegerField(unique=True, verbose_name="ID исходного лога")
+    period = models.CharField(max_length=7, db_index=True, verbose_name="Период (ГГГГ-ММ)")
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, verbose_name="Автомобиль")
+    spot = models.ForeignKey(ParkingSpot, on_delete=models.CASCADE, verbose_name="Парковочное место")
+    entry_time = models.DateTimeField(verbose_name="Время въезда")
+    exit_time = models.DateTimeField(verbose_name="Время выезда")
+    is_reservation = models.BooleanField(default=False, verbose_name="Резервация")
+    reservation_start = models.DateTimeField(null=True, blank=True, verbose_name="Начало резервации")
+    reservation_end = models.DateTimeField(null=True, blank=True, verbose_name="Конец резервации")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Архивный лог парковки"
+        verbose_name_plural = "Архив логов парковки"
+        ordering = ['-entry_time']
+        indexes = [
+            models.Index(fields=['entry_time'], name='parking_archlog_entry_idx'),
+            models.Index(fields=['entry_time', 'exit_time', 'spot'], name='parking_archlog_interval_idx'),
+            models.Index(fields=['exit_time', 'entry_time', 'spot'], name='parking_archlog_exit_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.car} - {self.spot} ({self.entry_time}) [архив]"
+
+    def calculate_duration(self):
+        """Расчет длительности парковки"""
+        return self.exit_time - self.entry_time
+
+class PaymentArchive(models.Model):
+    """Архивная (холодная) копия платежа по закрытому логу"""
+    payment_id = models.BigIntegerField(unique=True, verbose_name="ID исходного платежа")
+    log_id = models.BigIntegerField(db_index=True, verbose_name="ID исходного лога")
+    period = models.CharField(max_length=7, db_index=True, verbose_name="Период (ГГГГ-ММ)")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES, verbose_name="Статус")
+    payment_time = models.DateTimeField(null=True, blank=True, verbose_name="Время оплаты")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Архивный платеж"
+        verbose_name_plural = "Архив платежей"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment_time'], name='parking_archpay_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Платеж {self.payment_id} - {self.amount} руб. [архив]"
+
+class HourlySpotStats(models.Model):
+    """Почасовой итог по месту: занятое время закрытых сессий и число въездов"""
+    spot = models.ForeignKey(ParkingSpot, on_delete=models.CASCADE, verbose_name="Парковочное место")
+    hour = models.DateTimeField(verbose_name="Начало часа")
+    occupied_seconds = models.FloatField(default=0, verbose_name="Занято, секунд")
+    entries = models.PositiveIntegerField(default=0, verbose_name="Въездов")
+
+    class Meta:
+        verbose_name = "Почасовая загрузка места"
+        verbose_name_plural = "Почасовая загрузка мест"
+        constraints = [
+            models.UniqueConstraint(fields=['spot', 'hour'], name='parking_hourly_spot_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='parking_hourly_spot_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.spot} {self.hour:%Y-%m-%d %H:00}"
+
+class HourlyRevenue(models.Model):
+    """Почасовой итог оплаченных платежей по месту"""
+    spot = models.ForeignKey(ParkingSpot, on_delete=models.CASCADE, verbose_name="Парковочное место")
+    hour = models.DateTimeField(verbose_name="Начало часа")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Сумма")
+    payments = models.PositiveIntegerField(default=0, verbose_name="Оплат")
+
+    class Meta:
+        verbose_name = "Почасовая выручка"
+        verbose_name_plural = "Почасовая выручка"
+        constraints = [
+            models.UniqueConstraint(fields=['spot', 'hour'], name='parking_hourly_revenue_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='parking_hourly_rev_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.spot} {self.hour:%Y-%m-%d %H:00}: {self.amount} руб."
+
+class ReportJob(models.Model):
+    """Задание на построение отчета в фоне"""
+    KIND_CHOICES = [
+        ('daily', 'Ежедневный отчет'),
+        ('monthly', 'Месячный отчет'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Тип отчета")
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    params_key = models.CharField(max_length=64, verbose_name="Ключ параметров")
+    is_final = models.BooleanField(default=False, verbose_name="Период закрыт")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    file_name = models.CharField(max_length=100, blank=True, default='', verbose_name="Файл результата")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Автор")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало построения")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание построения")
+    # Процесс, в пуле которого выполняется задание, и его последняя отметка
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name="Исполнитель")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Отметка исполнителя")
+
+    class Meta:
+        verbose_name = "Задание на отчет"
+        verbose_name_plural = "Задания на отчеты"
+        ordering = ['-created_at']
+        indexes = [
+            # Поиск готового или выполняющегося отчета с теми же параметрами
+            models.Index(fields=['params_key', 'status'], name='parking_reportjob_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.params} ({self.get_status_display()})"
+
+class ImportCheckpoint(models.Model):
+    """Прогресс импорта: строк уже зафиксировано (сохраняется в транзакции пачки)"""
+    key = models.CharField(max_length=500, unique=True, verbose_name="Ключ импорта")
+    rows = models.PositiveBigIntegerField(default=0, verbose_name="Импортировано строк")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Прогресс импорта"
+        verbose_name_plural = "Прогресс импорта"
+
+    def __str__(self):
+        return f"{self.key}: {self.rows}"
+
 @receiver(post_migrate)
 def create_user_groups(sender, **kwargs):
     """Создание групп пользователей и назначение прав при миграции"""
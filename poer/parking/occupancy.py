@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.db.models import Count, Q, OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ParkingSpot, ParkingLog
+from .versions import get_version, bump_version, track_model, SPOTS_VERSION, LOGS_VERSION
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def occupancy_counts():
+    """Сводные счетчики одним запросом"""
+    counts = ParkingSpot.objects.aggregate(
+        total=Count('id'),
+        occupied=Count('id', filter=Q(is_occupied=True)),
+        reserved=Count('id', filter=Q(is_occupied=False, is_reserved=True)),
+    )
+    counts['free'] = counts['total'] - counts['occupied'] - counts['reserved']
+    return counts
+
+
+def cached_occupancy_counts():
+    """
+    Счетчики free/occupied/reserved из кэша. Ключ включает версию мест,
+    которая меняется при каждом сохранении места, поэтому устаревшие
+    значения никогда не читаются.
+    """
+    version = get_version(SPOTS_VERSION)
+    key = f"parking:occupancy:{version['token']}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = occupancy_counts()
+        counts['version'] = version['token']
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
+
+
+def lot_version():
+    """
+    Версия состояния стоянки для кэша сетки мест на главной странице:
+    меняется при изменении любого места или лога (номер текущего автомобиля)
+    """
+    return f"{get_version(SPOTS_VERSION)['token']}-{get_version(LOGS_VERSION)['token']}"
+
+
+def spots_with_current_car():
+    """Места с номером текущего автомобиля одним запросом"""
+    current_plate = ParkingLog.objects.filter(
+        spot=OuterRef('pk'),
+        exit_time__isnull=True
+    ).order_by('-entry_time').values('car__license_plate')[:1]
+    return ParkingSpot.objects.annotate(current_plate=Subquery(current_plate))
+
+
+@receiver(post_save, sender=ParkingSpot)
+@receiver(post_delete, sender=ParkingSpot)
+def spots_changed(sender, **kwargs):
+    bump_version(SPOTS_VERSION)
+
+
+track_model(ParkingLog, LOGS_VERSION)
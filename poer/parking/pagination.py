@@ -0,0 +1,124 @@
+import base64
+import json
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    """Непрозрачный курсор из списка значений (даты - в ISO 8601)"""
+    payload = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, param='cursor'):
+    """
+    Разбор курсора; строковые значения возвращаются как есть.
+    Испорченный курсор - ошибка запроса (400) по параметру param.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValidationError({param: 'Неверный курсор'})
+    if not isinstance(values, list):
+        raise ValidationError({param: 'Неверный курсор'})
+    return values
+
+
+def decode_position(token, param='cursor'):
+    """Позиция (момент времени, id) из курсора"""
+    values = decode_cursor(token, param)
+    if len(values) != 2:
+        raise ValidationError({param: 'Неверный курсор'})
+    try:
+        time_value = parse_datetime(str(values[0]))
+    except ValueError:
+        time_value = None
+    last_id = values[1]
+    # bool - подкласс int, но в курсоре не встречается
+    if time_value is None or not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValidationError({param: 'Неверный курсор'})
+    return time_value, last_id
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу (time_field DESC, id ASC) без OFFSET и COUNT(*).
+    Курсор хранит позицию последней строки страницы, поэтому стоимость
+    любой страницы одинакова независимо от глубины.
+    """
+    time_field = None
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def position(self, row):
+        """Позиция строки (модель или словарь из values())"""
+        if isinstance(row, dict):
+            return row[self.time_field], row['id']
+        return getattr(row, self.time_field), row.pk
+
+    def page_queryset(self, queryset, request):
+        """Упорядоченный запрос, начинающийся после позиции из курсора"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.time_field}', 'id')
+
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            time_value, last_id = decode_position(token, self.cursor_query_param)
+            # Диапазон по индексу (time <= t) и отсечение уже выданных строк с time = t
+            queryset = queryset.filter(
+                Q(**{f'{self.time_field}__lte': time_value}),
+                Q(**{f'{self.time_field}__lt': time_value}) | Q(id__gt=last_id)
+            )
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = list(self.page_queryset(queryset, request)[:self.page_size + 1])
+        self.next_position = self.position(rows[self.page_size - 1]) if len(rows) > self.page_size else None
+        return rows[:self.page_size]
+
+    def get_next_link(self, position=None):
+        position = position or self.next_position
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ParkingLogPagination(KeysetPagination):
+    time_field = 'entry_time'
+
+
+class PaymentPagination(KeysetPagination):
+    time_field = 'created_at'
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+
+from .models import Car, PlateTrigram
+
+GRAM_SIZE = 3
+
+# Кириллические буквы, совпадающие по написанию с латинскими на номерах
+LOOKALIKES = str.maketrans('АВЕКМНОРСТУХ', 'ABEKMHOPCTYX')
+
+
+def normalize_plate(value):
+    """Номер в верхнем регистре, латиницей, без пробелов и разделителей"""
+    value = (value or '').upper().translate(LOOKALIKES)
+    return ''.join(ch for ch in value if ch.isalnum())
+
+
+def plate_grams(normalized):
+    """Уникальные триграммы нормализованного номера"""
+    return {normalized[i:i + GRAM_SIZE] for i in range(len(normalized) - GRAM_SIZE + 1)}
+
+
+def search_cars(query, queryset=None):
+    """
+    Поиск автомобилей по части номера.
+    Запросы от трех символов ищутся как подстрока: кандидаты выбираются
+    по индексу триграмм и проверяются на вхождение подстроки. Более
+    короткие запросы триграмм не имеют и проверяются по всем номерам.
+    """
+    queryset = Car.objects.all() if queryset is None else queryset
+    normalized = normalize_plate(query)
+    if not normalized:
+        return queryset.none()
+
+    if len(normalized) < GRAM_SIZE:
+        return queryset.filter(plate_normalized__contains=normalized)
+
+    grams = plate_grams(normalized)
+    candidates = PlateTrigram.objects.filter(gram__in=grams).values('car_id').annotate(
+        matched=Count('gram')
+    ).filter(matched=len(grams)).values('car_id')
+    return queryset.filter(id__in=candidates, plate_normalized__contains=normalized)
+
+
+def index_cars(cars):
+    """Пересчет нормализованного номера и триграмм для списка автомобилей"""
+    cars = list(cars)
+    if not cars:
+        return
+    changed = []
+    for car in cars:
+        normalized = normalize_plate(car.license_plate)
+        if car.plate_normalized != normalized:
+            car.plate_normalized = normalized
+            changed.append(car)
+    if changed:
+        Car.objects.bulk_update(changed, ['plate_normalized'], batch_size=500)
+
+    PlateTrigram.objects.filter(car__in=cars).delete()
+    PlateTrigram.objects.bulk_create(
+        [
+            PlateTrigram(car_id=car.id, gram=gram)
+            for car in cars
+            for gram in plate_grams(car.plate_normalized)
+        ],
+        batch_size=1000
+    )
+
+
+def index_unindexed_cars(batch_size=5000):
+    """Индексация автомобилей, созданных в обход save() (bulk_create)"""
+    return reindex_cars(Car.objects.filter(plate_normalized=''), batch_size)
+
+
+def reindex_cars(queryset=None, batch_size=5000):
+    """Пересчет индекса номеров пачками по первичному ключу"""
+    queryset = Car.objects.all() if queryset is None else queryset
+    queryset = queryset.only('id', 'license_plate', 'plate_normalized').order_by('id')
+    total = last_id = 0
+    while True:
+        cars = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not cars:
+            return total
+        with transaction.atomic():
+            index_cars(cars)
+        total += len(cars)
+        last_id = cars[-1].id
+
+
+@receiver(pre_save, sender=Car)
+def normalize_car_plate(sender, instance, **kwargs):
+    normalized = normalize_plate(instance.license_plate)
+    instance._plate_changed = normalized != instance.plate_normalized
+    instance.plate_normalized = normalized
+
+
+@receiver(post_save, sender=Car)
+def index_car_plate(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_plate_changed', False):
+        PlateTrigram.objects.filter(car=instance).delete()
+        PlateTrigram.objects.bulk_create(
+            [PlateTrigram(car=instance, gram=gram) for gram in plate_grams(instance.plate_normalized)]
+        )
@@ -0,0 +1,303 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+import django
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+
+from .columnar import month_bounds
+from .importers import chunked
+from .models import Payment, ParkingLogArchive, PaymentArchive
+
+logger = logging.getLogger(__name__)
+
+# Версия макета чека входит в ключ файла: при изменении макета увеличить
+RECEIPT_FORMAT = 1
+PAID = 'completed'
+# Чеков в одном задании пула процессов
+RENDER_CHUNK_SIZE = 200
+# Заданий пула в работе на процесс пула: больше пачек из базы не читается
+RENDER_WINDOW = 2
+
+_prerender_executor = None
+_prerender_lock = threading.Lock()
+
+STATUS_NAMES = dict(Payment.PAYMENT_STATUS_CHOICES)
+# Поля чека (кортеж receipt_row) при чтении из горячих таблиц
+HOT_FIELDS = (
+    'id', 'payment_time', 'parking_log__car__license_plate', 'parking_log__spot__number',
+    'parking_log__entry_time', 'parking_log__exit_time', 'amount', 'status',
+)
+STATUS = HOT_FIELDS.index('status')
+
+
+@lru_cache(maxsize=None)
+def receipt_styles():
+    """
+    Таблица стилей и оформление таблицы чека - одни на процесс:
+    getSampleStyleSheet() заметно дорог, чтобы строить его на каждый чек.
+    :return: (стиль заголовка, TableStyle)
+    """
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30
+    )
+    table_style = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('TOPPADDING', (0, 0), (-1, -1), 12),
+    ])
+    return title_style, table_style
+
+
+def _normalized(row):
+    # Сумма из только что созданного объекта может быть int - приводим к виду из базы
+    row = list(row)
+    row[6] = Decimal(row[6]).quantize(Decimal('0.01'))
+    return tuple(row)
+
+
+def receipt_row(payment):
+    """Данные чека из платежа с загруженными parking_log__car и parking_log__spot"""
+    log = payment.parking_log
+    return _normalized((
+        payment.id, payment.payment_time, log.car.license_plate, log.spot.number,
+        log.entry_time, log.exit_time, payment.amount, payment.status
+    ))
+
+
+def load_receipt_row(payment_id):
+    """Данные чека одним запросом; None, если платежа нет"""
+    row = Payment.objects.filter(pk=payment_id).values_list(*HOT_FIELDS).first()
+    return _normalized(row) if row else None
+
+
+def _format_time(value):
+    return value.strftime("%d.%m.%Y %H:%M") if value else ''
+
+
+def render_receipt(row):
+    """Генерация PDF-чека об оплате"""
+    payment_id, payment_time, plate, spot, entry_time, exit_time, amount, status = row
+    title_style, table_style = receipt_styles()
+    buffer = BytesIO()
+    # invariant: без даты создания и случайного идентификатора документа,
+    # одинаковые данные дают одинаковый файл
+    doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=1)
+
+    data = [
+        ["Номер чека:", str(payment_id)],
+        ["Дата:", _format_time(payment_time)],
+        ["Номер автомобиля:", plate],
+        ["Место парковки:", spot],
+        ["Время въезда:", _format_time(entry_time)],
+        ["Время выезда:", _format_time(exit_time) or "Не выехал"],
+        ["Сумма:", f"{amount} руб."],
+        ["Статус:", STATUS_NAMES.get(status, status)]
+    ]
+    table = Table(data, colWidths=[2*inch, 4*inch])
+    table.setStyle(table_style)
+    doc.build([Paragraph("Чек об оплате парковки", title_style), Spacer(1, 20), table])
+    return buffer.getvalue()
+
+
+def receipt_key(row):
+    """Адрес чека - хэш его содержимого"""
+    raw = json.dumps([RECEIPT_FORMAT] + [str(value) for value in row])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def receipts_root():
+    return Path(getattr(settings, 'RECEIPTS_ROOT', settings.BASE_DIR / 'receipts'))
+
+
+def receipt_path(key):
+    return receipts_root() / key[:2] / f'{key}.pdf'
+
+
+def store_receipt(row):
+    """
+    Файл чека по адресу содержимого: строится только при отсутствии.
+    Запись через временный файл, поэтому параллельные построения
+    одного чека безопасны.
+    """
+    path = receipt_path(receipt_key(row))
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_bytes(render_receipt(row))
+    os.replace(temporary, path)
+    return path
+
+
+def is_cacheable(row):
+    """Оплаченный чек больше не меняется; остальные строятся на каждый запрос"""
+    return row[STATUS] == PAID
+
+
+def prerender_receipt(payment_id):
+    """Построение чека после оплаты; ошибка не мешает оплате"""
+    try:
+        row = load_receipt_row(payment_id)
+        if row and is_cacheable(row):
+            store_receipt(row)
+    except Exception:
+        logger.exception(f"Ошибка построения чека платежа {payment_id}")
+
+
+def receipt_response(request, payment):
+    """
+    Ответ с чеком. Оплаченный чек отдается из файла (построенного
+    при оплате или сейчас), ETag - адрес содержимого.
+    """
+    row = receipt_row(payment)
+    filename = f'receipt_{row[0]}.pdf'
+    if not is_cacheable(row):
+        response = HttpResponse(render_receipt(row), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    etag = quote_etag(receipt_key(row))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(
+            open(store_receipt(row), 'rb'),
+            as_attachment=True,
+            filename=filename,
+            content_type='application/pdf'
+        )
+    response['ETag'] = etag
+    return response
+
+
+def _get_prerender_executor():
+    global _prerender_executor
+    with _prerender_lock:
+        if _prerender_executor is None:
+            _prerender_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipt-render')
+        return _prerender_executor
+
+
+def _prerender_in_worker(payment_id):
+    try:
+        prerender_receipt(payment_id)
+    finally:
+        # Соединения потока пула не закрываются Django после запроса
+        connections.close_all()
+
+
+@receiver(post_save, sender=Payment)
+def payment_completed(sender, instance, **kwargs):
+    # Чек строится после фиксации (в той же транзакции обычно закрывается
+    # сессия) и в отдельном потоке: on_commit выполняется в потоке записи,
+    # который нельзя занимать построением PDF
+    if instance.status == PAID:
+        payment_id = instance.pk
+        transaction.on_commit(lambda: _get_prerender_executor().submit(_prerender_in_worker, payment_id))
+
+
+def month_receipt_rows(month):
+    """Оплаченные за месяц чеки: горячие платежи, затем архивные"""
+    start_time, end_time = month_bounds(month)
+    paid = {'status': PAID, 'payment_time__gte': start_time, 'payment_time__lt': end_time}
+    for row in Payment.objects.filter(**paid).order_by('payment_time', 'id').values_list(
+        *HOT_FIELDS
+    ).iterator(chunk_size=2000):
+        yield _normalized(row)
+
+    # В архиве платеж связан с логом через log_id, а не через внешний ключ
+    archived = PaymentArchive.objects.filter(**paid).order_by('payment_time', 'payment_id').values_list(
+        'payment_id', 'log_id', 'payment_time', 'amount', 'status'
+    )
+    for chunk in chunked(archived.iterator(chunk_size=2000), 2000):
+        logs = {
+            log_id: values
+            for log_id, *values in ParkingLogArchive.objects.filter(
+                log_id__in={log_id for _, log_id, *_ in chunk}
+            ).values_list('log_id', 'car__license_plate', 'spot__number', 'entry_time', 'exit_time')
+        }
+        for payment_id, log_id, payment_time, amount, status in chunk:
+            if log_id in logs:
+                yield _normalized((payment_id, payment_time, *logs[log_id], amount, status))
+
+
+def _store_chunk(rows):
+    """Задание пула: чеки пачки на диск; (id платежа, путь)"""
+    return [(row[0], str(store_receipt(row))) for row in rows]
+
+
+def _bounded_map(executor, func, items, window):
+    """
+    executor.map с ограниченным числом заданий в работе: Executor.map
+    сразу забирает весь итератор, а здесь следующая пачка отправляется
+    после получения результата самой старой. Порядок результатов сохраняется.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_receipts_zip(month, target, workers=None, progress=None):
+    """
+    Чеки месяца в ZIP. Чеки строятся пулом процессов пачками по
+    RENDER_CHUNK_SIZE и сохраняются в общий кэш, уже построенные
+    берутся с диска. В работе не больше RENDER_WINDOW пачек на процесс,
+    поэтому строки месяца читаются из базы по мере записи архива.
+    target - путь или бинарный файл.
+    :return: число чеков
+    """
+    workers = workers or getattr(settings, 'RECEIPT_WORKERS', None) or os.cpu_count() or 1
+    chunks = chunked(month_receipt_rows(month), RENDER_CHUNK_SIZE)
+    executor = None
+    if workers > 1:
+        # Процессам пула нужна только таблица стилей и настройки (RECEIPTS_ROOT), не база
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        results = _bounded_map(executor, _store_chunk, chunks, workers * RENDER_WINDOW)
+    else:
+        results = map(_store_chunk, chunks)
+
+    count = 0
+    try:
+        # PDF уже сжаты - без повторного сжатия
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as archive:
+            for stored in results:
+                for payment_id, path in stored:
+                    archive.write(path, f'receipt_{payment_id}.pdf')
+                count += len(stored)
+                if progress:
+                    progress(count)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return count
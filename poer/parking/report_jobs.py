@@ -0,0 +1,300 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.http import FileResponse, Http404
+from django.utils import timezone
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .models import ReportJob
+from .reports import ReportGenerator
+from .stats import local_midnight
+from smart_parking.sqlite import run_write
+
+logger = logging.getLogger(__name__)
+
+DAILY = 'daily'
+MONTHLY = 'monthly'
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Версия формата отчетов: при изменении генераторов увеличить,
+# чтобы сохраненные файлы закрытых периодов построились заново
+REPORT_FORMAT = 3
+
+# Задание считается брошенным, если его процесс пропустил столько отметок подряд
+HEARTBEAT_MISSES = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+# (pid, идентификатор) процесса: после fork идентификатор создается заново
+_worker = [None, None]
+
+
+def parse_params(kind, data, today=None):
+    """
+    Параметры отчета из запроса: daily - date (YYYY-MM-DD, по умолчанию сегодня),
+    monthly - year и month (по умолчанию текущий месяц). ValueError при ошибке.
+    """
+    today = today or timezone.localdate()
+    if kind == DAILY:
+        value = data.get('date')
+        day = datetime.strptime(value, '%Y-%m-%d').date() if value else today
+        return {'date': day.isoformat()}
+    if kind == MONTHLY:
+        year = int(data.get('year', today.year))
+        month = int(data.get('month', today.month))
+        if not (1 <= month <= 12):
+            raise ValueError('Month must be between 1 and 12')
+        date(year, month, 1)
+        return {'year': year, 'month': month}
+    raise ValueError(f'Unknown report kind: {kind}')
+
+
+def report_period(kind, params):
+    """Границы периода отчета [start, end) в местном времени"""
+    if kind == DAILY:
+        day = date.fromisoformat(params['date'])
+        return local_midnight(day), local_midnight(day + timedelta(days=1))
+    first = date(params['year'], params['month'], 1)
+    following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return local_midnight(first), local_midnight(following)
+
+
+def is_closed(kind, params, now=None):
+    """Период закончился - отчет за него больше не меняется"""
+    return report_period(kind, params)[1] <= (now or timezone.now())
+
+
+def params_key(kind, params):
+    raw = json.dumps([REPORT_FORMAT, kind, params], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def report_filename(job):
+    """Имя файла для скачивания (как у прежних синхронных отчетов)"""
+    if job.kind == DAILY:
+        return f"daily_report_{job.params['date']}.xlsx"
+    return f"monthly_report_{job.params['year']}_{job.params['month']:02d}.xlsx"
+
+
+def reports_root():
+    return Path(getattr(settings, 'REPORTS_ROOT', settings.BASE_DIR / 'reports'))
+
+
+def result_path(job):
+    return reports_root() / job.file_name
+
+
+def build_report(kind, params):
+    generator = ReportGenerator()
+    if kind == DAILY:
+        return generator.generate_daily_report_excel(date.fromisoformat(params['date']))
+    return generator.generate_monthly_report_excel(params['year'], params['month'])
+
+
+def worker_id():
+    """Идентификатор текущего процесса как исполнителя заданий"""
+    pid = os.getpid()
+    if _worker[0] != pid:
+        _worker[:] = [pid, f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}']
+    return _worker[1]
+
+
+def heartbeat_seconds():
+    return getattr(settings, 'REPORT_HEARTBEAT_SECONDS', 30)
+
+
+def heartbeat_cutoff(now=None):
+    """Задания с отметкой раньше этого момента брошены своим процессом"""
+    return (now or timezone.now()) - timedelta(seconds=heartbeat_seconds() * HEARTBEAT_MISSES)
+
+
+def find_reusable(key, final, now=None):
+    """
+    Задание, результат которого можно отдать вместо нового построения:
+    готовый отчет за закрытый период (файл на месте) или задание
+    с теми же параметрами, которое еще строится.
+    """
+    now = now or timezone.now()
+    timeout = timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 600))
+    if final:
+        for job in ReportJob.objects.filter(params_key=key, status=DONE, is_final=True).order_by('-finished_at'):
+            if result_path(job).exists():
+                return job
+    return ReportJob.objects.filter(
+        params_key=key,
+        status__in=(PENDING, RUNNING),
+        heartbeat_at__gte=heartbeat_cutoff(now)
+    ).exclude(
+        started_at__lt=now - timeout
+    ).order_by('-created_at').first()
+
+
+def submit_report(kind, params, user=None):
+    """
+    Постановка отчета в очередь. Повторный запрос закрытого периода
+    возвращает уже готовое задание, одинаковые запросы во время построения -
+    выполняющееся задание.
+    """
+    key = params_key(kind, params)
+    final = is_closed(kind, params)
+    job, created = run_write(
+        _find_or_create,
+        kind=kind,
+        params=params,
+        params_key=key,
+        is_final=final,
+        created_by=user if user is not None and user.is_authenticated else None,
+        worker=worker_id(),
+        heartbeat_at=timezone.now()
+    )
+    if not created:
+        return job
+
+    workers = getattr(settings, 'REPORT_WORKERS', 2)
+    if workers:
+        transaction.on_commit(lambda: _get_executor(workers).submit(_run_in_worker, job.pk))
+    else:
+        # REPORT_WORKERS = 0: построение прямо в запросе (тесты, отладка)
+        run_job(job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def _find_or_create(params_key, is_final, **fields):
+    # Поиск и создание в одной транзакции записи: два одинаковых запроса
+    # не создадут два задания
+    job = find_reusable(params_key, is_final)
+    if job is not None:
+        return job, False
+    return ReportJob.objects.create(params_key=params_key, is_final=is_final, **fields), True
+
+
+def fail_orphaned_jobs(now=None):
+    """
+    Пометка ошибочными незавершенных заданий, процесс которых перестал
+    отмечаться (остановлен или перезапущен): иначе повторные запросы ждали
+    бы их. Задания других работающих процессов не затрагиваются.
+    """
+    now = now or timezone.now()
+    cutoff = heartbeat_cutoff(now)
+    return run_write(
+        ReportJob.objects.filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff),
+            status__in=(PENDING, RUNNING)
+        ).update,
+        status=FAILED,
+        error='Построение прервано перезапуском',
+        finished_at=now
+    )
+
+
+def _heartbeat():
+    """Периодическая отметка незавершенных заданий процесса"""
+    while True:
+        time.sleep(heartbeat_seconds())
+        try:
+            run_write(
+                ReportJob.objects.filter(worker=worker_id(), status__in=(PENDING, RUNNING)).update,
+                heartbeat_at=timezone.now()
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отметки заданий отчетов: {str(e)}")
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            orphaned = fail_orphaned_jobs()
+            if orphaned:
+                logger.warning(f"Прерванных заданий отчетов: {orphaned}")
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-worker')
+            threading.Thread(target=_heartbeat, name='report-heartbeat', daemon=True).start()
+        return _executor
+
+
+def _run_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Соединения потока пула не закрываются Django после запроса
+        connections.close_all()
+
+
+def _update(job_id, **fields):
+    run_write(ReportJob.objects.filter(pk=job_id).update, **fields)
+
+
+def run_job(job_id):
+    """Построение отчета задания и сохранение файла на диск"""
+    job = ReportJob.objects.get(pk=job_id)
+    now = timezone.now()
+    _update(job_id, status=RUNNING, started_at=now, heartbeat_at=now)
+    try:
+        content = build_report(job.kind, job.params)
+        # Результат закрытого периода общий для всех заданий с теми же параметрами
+        file_name = f'{job.params_key}.xlsx' if job.is_final else f'{job.pk}.xlsx'
+        root = reports_root()
+        root.mkdir(parents=True, exist_ok=True)
+        temporary = root / f'.{job.pk}.tmp'
+        temporary.write_bytes(content)
+        os.replace(temporary, root / file_name)
+    except Exception as e:
+        logger.exception(f"Ошибка построения отчета {job_id}")
+        _update(job_id, status=FAILED, error=str(e), finished_at=timezone.now())
+        return
+    _update(job_id, status=DONE, file_name=file_name, finished_at=timezone.now())
+    logger.info(f"Отчет {job_id} построен: {file_name}")
+
+
+def download_response(job):
+    """Файл готового отчета; Http404, если файла нет"""
+    path = result_path(job) if job.status == DONE and job.file_name else None
+    if path is None or not path.exists():
+        raise Http404('Файл отчета не найден')
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=report_filename(job),
+        content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def purge_report_jobs(now=None):
+    """
+    Удаление заданий по открытым периодам старше REPORT_RESULT_TTL вместе
+    с файлами и пометка ошибочными зависших (строятся дольше
+    REPORT_JOB_TIMEOUT) и брошенных заданий. Отчеты закрытых периодов
+    хранятся как кэш и не удаляются.
+    """
+    now = now or timezone.now()
+    ttl = timedelta(seconds=getattr(settings, 'REPORT_RESULT_TTL', 24 * 60 * 60))
+    timeout = timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 600))
+
+    stale = run_write(
+        ReportJob.objects.filter(status=RUNNING, started_at__lt=now - timeout).update,
+        status=FAILED,
+        error='Превышено время построения',
+        finished_at=now
+    )
+    stale += fail_orphaned_jobs(now)
+    expired = list(ReportJob.objects.filter(is_final=False, created_at__lt=now - ttl))
+    for job in expired:
+        if job.file_name:
+            result_path(job).unlink(missing_ok=True)
+    run_write(ReportJob.objects.filter(pk__in=[job.pk for job in expired]).delete)
+    return stale, len(expired)
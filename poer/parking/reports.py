@@ -1,93 +1,43 @@
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 from datetime import datetime, timedelta
 from django.db.models import Sum, Count
 from django.utils import timezone
+import numpy as np
 import xlsxwriter
 from io import BytesIO
 import os
 
 from .models import Payment, ParkingLog, ParkingSpot
+from .archive import payment_totals
+from .stats import revenue_series, spot_utilization, local_midnight
+from .analytics import occupancy_heatmap
+from .receipts import receipt_row, render_receipt
+from .tariffs import closed_session_charges, group_sum
+from smart_parking.db_router import use_replica
 
 class ReportGenerator:
-    def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30
-        )
-
     def generate_receipt_pdf(self, payment):
-        """Генерация PDF-чека об оплате"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        # Заголовок
-        elements.append(Paragraph("Чек об оплате парковки", self.title_style))
-        elements.append(Spacer(1, 20))
-
-        # Информация о платеже
-        data = [
-            ["Номер чека:", str(payment.id)],
-            ["Дата:", payment.payment_time.strftime("%d.%m.%Y %H:%M")],
-            ["Номер автомобиля:", payment.parking_log.car.license_plate],
-            ["Место парковки:", payment.parking_log.spot.number],
-            ["Время въезда:", payment.parking_log.entry_time.strftime("%d.%m.%Y %H:%M")],
-            ["Время выезда:", payment.parking_log.exit_time.strftime("%d.%m.%Y %H:%M") if payment.parking_log.exit_time else "Не выехал"],
-            ["Сумма:", f"{payment.amount} руб."],
-            ["Статус:", payment.get_status_display()]
-        ]
-
-        # Создаем таблицу
-        table = Table(data, colWidths=[2*inch, 4*inch])
-        table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('TOPPADDING', (0, 0), (-1, -1), 12),
-        ]))
-
-        elements.append(table)
-        doc.build(elements)
-        return buffer.getvalue()
+        """Генерация PDF-чека об оплате (общие стили, без кэша на диске)"""
+        return render_receipt(receipt_row(payment))
 
+    @use_replica()
     def generate_daily_report_excel(self, date=None):
         """Генерация отчета по загрузке парковки и выручке за день"""
         if date is None:
             date = timezone.now().date()
 
-        # Получаем данные
-        start_time = timezone.make_aware(datetime.combine(date, datetime.min.time()))
-        end_time = timezone.make_aware(datetime.combine(date, datetime.max.time()))
-
-        # Статистика по местам
-        spots_stats = ParkingSpot.objects.annotate(
-            total_time=Sum('parkinglog__exit_time' - 'parkinglog__entry_time'),
-            total_payments=Sum('parkinglog__payment__amount')
-        ).filter(
-            parkinglog__entry_time__gte=start_time,
-            parkinglog__entry_time__lte=end_time
-        )
+        # Получаем данные: сутки [00:00, 00:00 следующего дня) в местном времени
+        start_time = local_midnight(date)
+        end_time = local_midnight(date + timedelta(days=1))
 
-        # Общая статистика
-        total_payments = Payment.objects.filter(
-            payment_time__gte=start_time,
-            payment_time__lte=end_time,
-            status='completed'
-        ).aggregate(
-            total_amount=Sum('amount'),
-            total_count=Count('id')
-        )
+        # Статистика по местам: сессии обрезаются границами суток
+        spots_stats = spot_utilization(start_time, end_time)
+
+        # Общая статистика (с учетом архива)
+        total_payments = payment_totals(start_time, end_time)
+
+        # Начислено по тарифу за закрытые за сутки сессии
+        spot_ids, _, amounts = closed_session_charges(start_time, end_time)
+        charges = group_sum(spot_ids, amounts)
 
         # Создаем Excel файл
         output = BytesIO()
@@ -107,6 +57,14 @@ class ReportGenerator:
             'border': 1,
             'num_format': '#,##0.00 ₽'
         })
+        hours_format = workbook.add_format({
+            'border': 1,
+            'num_format': '0.00'
+        })
+        percent_format = workbook.add_format({
+            'border': 1,
+            'num_format': '0.0"%"'
+        })
 
         # Заголовок
         worksheet.merge_range('A1:E1', f'Отчет по парковке за {date.strftime("%d.%m.%Y")}', header_format)
@@ -115,34 +73,87 @@ class ReportGenerator:
         worksheet.write('C3', f'Количество оплат: {total_payments["total_count"] or 0}', cell_format)
 
         # Заголовки таблицы
-        headers = ['Место', 'Время использования (часы)', 'Выручка', 'Загрузка (%)']
+        headers = ['Место', 'Время использования (часы)', 'Выручка', 'Загрузка (%)', 'Начислено по тарифу']
         for col, header in enumerate(headers):
             worksheet.write(5, col, header, header_format)
 
         # Данные по местам
         row = 6
         for spot in spots_stats:
-            total_hours = spot.total_time.total_seconds() / 3600 if spot.total_time else 0
-            utilization = (total_hours / 24) * 100 if total_hours else 0
-
-            worksheet.write(row, 0, spot.number, cell_format)
-            worksheet.write(row, 1, total_hours, cell_format)
-            worksheet.write(row, 2, spot.total_payments or 0, money_format)
-            worksheet.write(row, 3, f'{utilization:.1f}%', cell_format)
+            worksheet.write(row, 0, spot['number'], cell_format)
+            worksheet.write(row, 1, spot['occupied_seconds'] / 3600, hours_format)
+            worksheet.write(row, 2, spot['revenue'], money_format)
+            worksheet.write(row, 3, spot['utilization'], percent_format)
+            worksheet.write(row, 4, charges.get(spot['spot_id'], 0), money_format)
             row += 1
 
-        # График загрузки
+        # График загрузки (строки данных - с 7-й по последнюю записанную)
         chart = workbook.add_chart({'type': 'column'})
         chart.add_series({
             'name': 'Загрузка парковки',
-            'categories': f'=Sheet1!$A$6:$A${row-1}',
-            'values': f'=Sheet1!$D$6:$D${row-1}',
+            'categories': f'=Sheet1!$A$7:$A${row}',
+            'values': f'=Sheet1!$D$7:$D${row}',
         })
         worksheet.insert_chart('A20', chart)
 
+        # Загрузка мест по часам
+        self._write_occupancy_sheets(
+            workbook,
+            occupancy_heatmap(start_time, end_time, 'hour'),
+            'HH:MM',
+            header_format
+        )
+
         workbook.close()
         return output.getvalue()
 
+    def _write_occupancy_sheets(self, workbook, heatmap, bucket_format, header_format):
+        """Листы с тепловой картой загрузки мест и распределением длительности стоянки"""
+        percent_format = workbook.add_format({'num_format': '0'})
+        column_format = workbook.add_format({'bold': True, 'bg_color': '#D9E1F2', 'border': 1, 'num_format': bucket_format})
+
+        worksheet = workbook.add_worksheet('Загрузка мест')
+        peak_time = heatmap['peak_time']
+        worksheet.write(0, 0, 'Загрузка мест, %', header_format)
+        worksheet.write(1, 0, (
+            f"Пиковая занятость: {heatmap['peak']} мест"
+            + (f" ({timezone.localtime(peak_time).strftime('%d.%m.%Y %H:%M')})" if peak_time else '')
+        ))
+
+        worksheet.write(3, 0, 'Место', header_format)
+        for col, bucket in enumerate(heatmap['buckets'], start=1):
+            worksheet.write_datetime(3, col, timezone.localtime(bucket).replace(tzinfo=None), column_format)
+        utilization = heatmap['utilization'].round(1)
+        for row, (number, values) in enumerate(zip(heatmap['numbers'], utilization), start=4):
+            worksheet.write_string(row, 0, number, header_format)
+            worksheet.write_row(row, 1, values.tolist(), percent_format)
+        last_row = 3 + len(heatmap['numbers'])
+        last_col = len(heatmap['buckets'])
+        if last_row > 3 and last_col:
+            worksheet.conditional_format(4, 1, last_row, last_col, {
+                'type': '3_color_scale',
+                'min_type': 'num', 'min_value': 0, 'min_color': '#63BE7B',
+                'mid_type': 'num', 'mid_value': 50, 'mid_color': '#FFEB84',
+                'max_type': 'num', 'max_value': 100, 'max_color': '#F8696B',
+            })
+        worksheet.freeze_panes(4, 1)
+
+        dwell = heatmap['dwell']
+        worksheet = workbook.add_worksheet('Длительность стоянки')
+        worksheet.write(0, 0, 'Длительность, мин', header_format)
+        worksheet.write(0, 1, 'Сессий', header_format)
+        for row, interval in enumerate(dwell['bins'], start=1):
+            label = f"{interval['from']}-{interval['to']}" if interval['to'] is not None else f"{interval['from']}+"
+            worksheet.write(row, 0, label)
+            worksheet.write(row, 1, interval['count'])
+        row = len(dwell['bins']) + 2
+        for label, key in (('Среднее', 'mean'), ('Медиана', 'p50'), ('90%', 'p90'), ('99%', 'p99')):
+            worksheet.write(row, 0, label, header_format)
+            if dwell[key] is not None:
+                worksheet.write_number(row, 1, round(dwell[key], 1))
+            row += 1
+
+    @use_replica()
     def generate_monthly_report_excel(self, year, month):
         """Генерация месячного отчета"""
         start_date = datetime(year, month, 1)
@@ -151,25 +162,17 @@ class ReportGenerator:
         else:
             end_date = datetime(year, month + 1, 1)
 
-        # Получаем данные по дням
-        daily_stats = []
-        current_date = start_date
-        while current_date < end_date:
-            next_date = current_date + timedelta(days=1)
-            stats = Payment.objects.filter(
-                payment_time__gte=current_date,
-                payment_time__lt=next_date,
-                status='completed'
-            ).aggregate(
-                total_amount=Sum('amount'),
-                total_count=Count('id')
-            )
-            daily_stats.append({
-                'date': current_date,
-                'amount': stats['total_amount'] or 0,
-                'count': stats['total_count'] or 0
-            })
-            current_date = next_date
+        # Данные по дням одним сгруппированным запросом (границы - в местном времени)
+        daily_stats = revenue_series(
+            local_midnight(start_date.date()),
+            local_midnight(end_date.date()),
+            'day'
+        )
+
+        # Начислено по тарифу за закрытые сессии, по суткам выезда
+        _, exits, amounts = closed_session_charges(local_midnight(start_date.date()), local_midnight(end_date.date()))
+        edges = np.array([stat['period'].timestamp() for stat in daily_stats])
+        charges = group_sum(np.searchsorted(edges, exits, side='right') - 1, amounts)
 
         # Создаем Excel файл
         output = BytesIO()
@@ -195,10 +198,10 @@ class ReportGenerator:
         })
 
         # Заголовок
-        worksheet.merge_range('A1:C1', f'Месячный отчет за {start_date.strftime("%B %Y")}', header_format)
+        worksheet.merge_range('A1:D1', f'Месячный отчет за {start_date.strftime("%B %Y")}', header_format)
 
         # Заголовки таблицы
-        headers = ['Дата', 'Выручка', 'Количество оплат']
+        headers = ['Дата', 'Выручка', 'Количество оплат', 'Начислено по тарифу']
         for col, header in enumerate(headers):
             worksheet.write(2, col, header, header_format)
 
@@ -206,10 +209,11 @@ class ReportGenerator:
         row = 3
         total_amount = 0
         total_count = 0
-        for stat in daily_stats:
-            worksheet.write(row, 0, stat['date'], date_format)
+        for day, stat in enumerate(daily_stats):
+            worksheet.write(row, 0, stat['period'].date(), date_format)
             worksheet.write(row, 1, stat['amount'], money_format)
             worksheet.write(row, 2, stat['count'], cell_format)
+            worksheet.write(row, 3, charges.get(day, 0), money_format)
             total_amount += stat['amount']
             total_count += stat['count']
             row += 1
@@ -218,6 +222,7 @@ class ReportGenerator:
         worksheet.write(row + 1, 0, 'ИТОГО:', header_format)
         worksheet.write(row + 1, 1, total_amount, money_format)
         worksheet.write(row + 1, 2, total_count, cell_format)
+        worksheet.write(row + 1, 3, round(sum(charges.values()), 2), money_format)
 
         # График выручки
         chart = workbook.add_chart({'type': 'line'})
@@ -228,5 +233,13 @@ class ReportGenerator:
         })
         worksheet.insert_chart('A20', chart)
 
+        # Загрузка мест по дням
+        self._write_occupancy_sheets(
+            workbook,
+            occupancy_heatmap(local_midnight(start_date.date()), local_midnight(end_date.date()), 'day'),
+            'dd.mm',
+            header_format
+        )
+
         workbook.close()
         return output.getvalue() 
\ No newline at end of file
@@ -0,0 +1,143 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+
+from .versions import get_version, bump_version
+
+ADMINISTRATOR = 'Administrator'
+RECEPTIONIST = 'Receptionist'
+CLIENT = 'Client'
+
+# Смена этой версии сбрасывает роли всех пользователей
+# (изменение прав группы, переименование или удаление группы)
+ROLES_VERSION = 'roles'
+CACHE_TIMEOUT = 60 * 60
+
+
+class UserRoles:
+    """Группы и права пользователя, загруженные один раз"""
+    __slots__ = ('groups', 'permissions')
+
+    def __init__(self, groups=(), permissions=()):
+        self.groups = frozenset(groups)
+        self.permissions = frozenset(permissions)
+
+    @property
+    def is_admin(self):
+        return ADMINISTRATOR in self.groups
+
+    @property
+    def is_receptionist(self):
+        return RECEPTIONIST in self.groups
+
+    @property
+    def is_client(self):
+        return CLIENT in self.groups
+
+    def has_perm(self, perm):
+        return perm in self.permissions
+
+
+def _cache_key(user_id):
+    return f"parking:roles:{get_version(ROLES_VERSION)['token']}:{user_id}"
+
+
+def get_roles(user):
+    """
+    Роли пользователя: из атрибута объекта (в пределах запроса),
+    затем из кэша, и только при промахе - из базы.
+    """
+    if user is None or not user.is_authenticated:
+        return UserRoles()
+    roles = getattr(user, '_parking_roles', None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        cached = (
+            list(user.groups.values_list('name', flat=True)),
+            list(user.get_all_permissions()) if user.is_active else [],
+        )
+        cache.set(key, cached, CACHE_TIMEOUT)
+    roles = user._parking_roles = UserRoles(*cached)
+    return roles
+
+
+def forget_roles(*user_ids):
+    for user_id in user_ids:
+        cache.delete(_cache_key(user_id))
+
+
+def is_admin(user):
+    return get_roles(user).is_admin
+
+
+def is_receptionist(user):
+    return get_roles(user).is_receptionist
+
+
+def is_client(user):
+    return get_roles(user).is_client
+
+
+def is_staff_member(user):
+    """Администратор или ресепшн"""
+    roles = get_roles(user)
+    return roles.is_admin or roles.is_receptionist
+
+
+def user_roles(request):
+    """Контекстный процессор: роли текущего пользователя в шаблонах"""
+    return {'user_roles': get_roles(getattr(request, 'user', None))}
+
+
+class IsParkingAdmin(BasePermission):
+    """Доступ только для группы Administrator"""
+
+    def has_permission(self, request, view):
+        return is_admin(request.user)
+
+
+class IsParkingStaff(BasePermission):
+    """Доступ для групп Administrator и Receptionist"""
+
+    def has_permission(self, request, view):
+        return is_staff_member(request.user)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        forget_roles(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) / permission.user_set.remove(...)
+        forget_roles(*pk_set)
+    else:
+        # group.user_set.clear(): затронутые пользователи уже неизвестны
+        bump_version(ROLES_VERSION)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version(ROLES_VERSION)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    bump_version(ROLES_VERSION)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    # is_active и is_superuser влияют на права
+    if not created:
+        forget_roles(instance.pk)
@@ -0,0 +1,299 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Min, Max
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+import logging
+
+from .models import ParkingLog, Payment, HourlySpotStats, HourlyRevenue
+
+logger = logging.getLogger(__name__)
+
+# Почасовые итоги хранятся по часам UTC. Для часовых поясов с целым
+# смещением (Europe/Moscow) местные сутки состоят из целых часов UTC.
+HOUR = timedelta(hours=1)
+PAID = 'completed'
+
+SOURCE_MODELS = ('ParkingLog', 'ParkingLogArchive', 'Payment', 'PaymentArchive')
+ROLLUP_MODELS = ('HourlySpotStats', 'HourlyRevenue')
+
+# Удаление при переносе в архив: итоги учитывают и архив, поэтому не меняются
+_moving_to_archive = ContextVar('rollups_moving_to_archive', default=False)
+
+
+@contextmanager
+def moving_to_archive():
+    """Удаление строк в блоке не вычитается из почасовых итогов"""
+    token = _moving_to_archive.set(True)
+    try:
+        yield
+    finally:
+        _moving_to_archive.reset(token)
+
+
+def get_models(apps=None):
+    """Модели по имени; в миграции - исторические из ее реестра apps"""
+    apps = apps or global_apps
+    return {name: apps.get_model('parking', name) for name in SOURCE_MODELS + ROLLUP_MODELS}
+
+
+def hour_floor(value):
+    """Начало часа UTC, в который попадает момент value"""
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def is_hour_aligned(value):
+    return hour_floor(value) == value
+
+
+def session_slices(entry_time, exit_time):
+    """Части сессии по часам: (начало часа, секунд в этом часе)"""
+    hour = hour_floor(entry_time)
+    while hour < exit_time:
+        following = hour + HOUR
+        seconds = (min(exit_time, following) - max(entry_time, hour)).total_seconds()
+        if seconds > 0:
+            yield hour, seconds
+        hour = following
+
+
+def add_session(deltas, spot_id, entry_time, exit_time, sign=1, start=None, end=None):
+    """
+    Вклад закрытой сессии в почасовые итоги мест.
+    start/end ограничивают часы (при пересчете диапазона).
+    """
+    for hour, seconds in session_slices(entry_time, exit_time):
+        if (start is None or hour >= start) and (end is None or hour < end):
+            values = deltas.setdefault((spot_id, hour), {'occupied_seconds': 0, 'entries': 0})
+            values['occupied_seconds'] += sign * seconds
+    hour = hour_floor(entry_time)
+    if (start is None or hour >= start) and (end is None or hour < end):
+        values = deltas.setdefault((spot_id, hour), {'occupied_seconds': 0, 'entries': 0})
+        values['entries'] += sign
+
+
+def add_payment(deltas, spot_id, amount, payment_time, sign=1):
+    """Вклад оплаченного платежа в почасовую выручку"""
+    if spot_id is None:
+        return
+    values = deltas.setdefault((spot_id, hour_floor(payment_time)), {'amount': Decimal(0), 'payments': 0})
+    values['amount'] += sign * Decimal(str(amount))
+    values['payments'] += sign
+
+
+def apply_deltas(model, deltas):
+    """
+    Прибавление приращений {(spot_id, hour): {поле: значение}} к строкам итогов
+    одной транзакцией: существующие строки - bulk_update, новые - bulk_create.
+    """
+    deltas = {key: values for key, values in deltas.items() if any(values.values())}
+    if not deltas:
+        return
+    fields = sorted({field for values in deltas.values() for field in values})
+    spot_ids = {spot_id for spot_id, _ in deltas}
+    hours = {hour for _, hour in deltas}
+
+    with transaction.atomic():
+        existing = {
+            (row.spot_id, row.hour): row
+            for row in model.objects.select_for_update().filter(spot_id__in=spot_ids, hour__in=hours)
+            if (row.spot_id, row.hour) in deltas
+        }
+        to_update = []
+        to_create = []
+        for (spot_id, hour), values in deltas.items():
+            row = existing.get((spot_id, hour))
+            if row is None:
+                to_create.append(model(spot_id=spot_id, hour=hour, **values))
+                continue
+            for field, value in values.items():
+                setattr(row, field, getattr(row, field) + value)
+            to_update.append(row)
+        model.objects.bulk_update(to_update, fields, batch_size=500)
+        model.objects.bulk_create(to_create, batch_size=500)
+
+
+def add_closed_logs(logs):
+    """Учет закрытых сессий, созданных через bulk_create (импорт)"""
+    deltas = {}
+    for log in logs:
+        if log.exit_time:
+            add_session(deltas, log.spot_id, log.entry_time, log.exit_time)
+    apply_deltas(HourlySpotStats, deltas)
+
+
+def add_paid_payments(payments, spot_ids):
+    """
+    Учет оплаченных платежей, созданных через bulk_create.
+    :param spot_ids: {parking_log_id: spot_id}
+    """
+    deltas = {}
+    for payment in payments:
+        if payment.status == PAID and payment.payment_time:
+            add_payment(deltas, spot_ids[payment.parking_log_id], payment.amount, payment.payment_time)
+    apply_deltas(HourlyRevenue, deltas)
+
+
+def month_windows(start, end):
+    """Интервалы по календарным месяцам UTC внутри [start, end)"""
+    current = start
+    while current < end:
+        following = (current.replace(day=28) + timedelta(days=4)).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        yield current, min(following, end)
+        current = min(following, end)
+
+
+def rollup_bounds(apps=None):
+    """
+    Период, за который есть данные для итогов: от первого въезда или
+    оплаты до последнего выезда или оплаты (не раньше текущего момента).
+    :return: (начало, конец) или None, если данных нет
+    """
+    models = get_models(apps)
+    first = [
+        models[name].objects.aggregate(value=Min(field))['value']
+        for name, field in (
+            ('ParkingLog', 'entry_time'), ('ParkingLogArchive', 'entry_time'),
+            ('Payment', 'payment_time'), ('PaymentArchive', 'payment_time'),
+        )
+    ]
+    first = [value for value in first if value]
+    if not first:
+        return None
+    last = [timezone.now()] + [
+        models[name].objects.aggregate(value=Max(field))['value']
+        for name, field in (
+            ('ParkingLog', 'exit_time'), ('ParkingLogArchive', 'exit_time'),
+            ('Payment', 'payment_time'), ('PaymentArchive', 'payment_time'),
+        )
+    ]
+    return min(first), max(value for value in last if value)
+
+
+def rebuild_window(start, end, apps=None):
+    """
+    Пересчет итогов часов [start, end) из горячих и архивных таблиц.
+    Старые строки окна удаляются и создаются заново в одной транзакции.
+    apps - реестр моделей миграции (при заполнении итогов миграцией).
+    :return: (строк загрузки, строк выручки)
+    """
+    models = get_models(apps)
+    sessions = {}
+    for model in (models['ParkingLog'], models['ParkingLogArchive']):
+        rows = model.objects.filter(
+            entry_time__lt=end,
+            exit_time__isnull=False,
+            exit_time__gt=start
+        ).values_list('spot_id', 'entry_time', 'exit_time')
+        for spot_id, entry_time, exit_time in rows.iterator(chunk_size=5000):
+            add_session(sessions, spot_id, entry_time, exit_time, start=start, end=end)
+
+    revenue = {}
+    paid = {'status': PAID, 'payment_time__gte': start, 'payment_time__lt': end}
+    for spot_id, amount, payment_time in models['Payment'].objects.filter(**paid).values_list(
+        'parking_log__spot_id', 'amount', 'payment_time'
+    ).iterator(chunk_size=5000):
+        add_payment(revenue, spot_id, amount, payment_time)
+    archived = list(models['PaymentArchive'].objects.filter(**paid).values_list('log_id', 'amount', 'payment_time'))
+    if archived:
+        spots = dict(
+            models['ParkingLogArchive'].objects.filter(
+                log_id__in={log_id for log_id, _, _ in archived}
+            ).values_list('log_id', 'spot_id')
+        )
+        for log_id, amount, payment_time in archived:
+            if log_id in spots:
+                add_payment(revenue, spots[log_id], amount, payment_time)
+
+    with transaction.atomic():
+        models['HourlySpotStats'].objects.filter(hour__gte=start, hour__lt=end).delete()
+        models['HourlyRevenue'].objects.filter(hour__gte=start, hour__lt=end).delete()
+        apply_deltas(models['HourlySpotStats'], sessions)
+        apply_deltas(models['HourlyRevenue'], revenue)
+    return len(sessions), len(revenue)
+
+
+def rebuild_rollups(start, end, progress=None, apps=None):
+    """Пересчет итогов по месяцам, каждый месяц - отдельной транзакцией"""
+    start = hour_floor(start)
+    end = hour_floor(end - timedelta(microseconds=1)) + HOUR
+    totals = [0, 0]
+    for window_start, window_end in month_windows(start, end):
+        sessions, revenue = rebuild_window(window_start, window_end, apps)
+        totals[0] += sessions
+        totals[1] += revenue
+        if progress:
+            progress(window_start, sessions, revenue)
+    return tuple(totals)
+
+
+@receiver(pre_save, sender=ParkingLog)
+def remember_log(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if not instance._state.adding and instance.pk:
+        instance._rollup_previous = ParkingLog.objects.filter(pk=instance.pk).values(
+            'spot_id', 'entry_time', 'exit_time'
+        ).first()
+
+
+@receiver(post_save, sender=ParkingLog)
+def log_saved(sender, instance, **kwargs):
+    """Закрытие сессии (или правка закрытой) меняет почасовые итоги"""
+    previous = getattr(instance, '_rollup_previous', None)
+    deltas = {}
+    if previous and previous['exit_time']:
+        add_session(deltas, previous['spot_id'], previous['entry_time'], previous['exit_time'], sign=-1)
+    if instance.exit_time:
+        add_session(deltas, instance.spot_id, instance.entry_time, instance.exit_time)
+    apply_deltas(HourlySpotStats, deltas)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if not instance._state.adding and instance.pk:
+        instance._rollup_previous = Payment.objects.filter(pk=instance.pk).values(
+            'status', 'amount', 'payment_time', 'parking_log__spot_id'
+        ).first()
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, **kwargs):
+    """Оплата (или отмена оплаты) меняет почасовую выручку"""
+    previous = getattr(instance, '_rollup_previous', None)
+    deltas = {}
+    if previous and previous['status'] == PAID and previous['payment_time']:
+        add_payment(deltas, previous['parking_log__spot_id'], previous['amount'], previous['payment_time'], sign=-1)
+    if instance.status == PAID and instance.payment_time:
+        spot_id = ParkingLog.objects.filter(pk=instance.parking_log_id).values_list('spot_id', flat=True).first()
+        add_payment(deltas, spot_id, instance.amount, instance.payment_time)
+    apply_deltas(HourlyRevenue, deltas)
+
+
+@receiver(post_delete, sender=ParkingLog)
+def log_deleted(sender, instance, **kwargs):
+    """Удаление закрытой сессии вычитает ее из итогов (кроме переноса в архив)"""
+    if instance.exit_time and not _moving_to_archive.get():
+        deltas = {}
+        add_session(deltas, instance.spot_id, instance.entry_time, instance.exit_time, sign=-1)
+        apply_deltas(HourlySpotStats, deltas)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    """
+    Удаление оплаты вычитает ее из выручки. При каскадном удалении лога
+    платежи удаляются раньше него, поэтому место лога еще можно прочитать.
+    """
+    if instance.status == PAID and instance.payment_time and not _moving_to_archive.get():
+        spot_id = ParkingLog.objects.filter(pk=instance.parking_log_id).values_list('spot_id', flat=True).first()
+        deltas = {}
+        add_payment(deltas, spot_id, instance.amount, instance.payment_time, sign=-1)
+        apply_deltas(HourlyRevenue, deltas)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import ParkingSpot, Car, ParkingLog, Payment
+from .models import ParkingSpot, Car, ParkingLog, Payment, ReportJob
+from django.urls import reverse
 from django.utils import timezone
 
 class ParkingSpotSerializer(serializers.ModelSerializer):
@@ -33,7 +34,7 @@ class ParkingSpotSerializer(serializers.ModelSerializer):
 class CarSerializer(serializers.ModelSerializer):
     class Meta:
         model = Car
-        fields = ['id', 'number', 'owner', 'phone']
+        fields = ['id', 'license_plate', 'owner', 'phone']
 
 class ParkingLogSerializer(serializers.ModelSerializer):
     duration = serializers.SerializerMethodField()
@@ -42,12 +43,45 @@ class ParkingLogSerializer(serializers.ModelSerializer):
         model = ParkingLog
         fields = ['id', 'car', 'spot', 'entry_time', 'exit_time',
                  'is_reservation', 'reservation_start', 'reservation_end',
-                 'duration']
+                 'duration', 'updated_at']
 
     def get_duration(self, obj):
-        return obj.calculate_duration()
+        if obj.exit_time:
+            return obj.exit_time - obj.entry_time
+        # Одно значение "сейчас" на весь список вместо вызова на каждую строку
+        now = self.context.setdefault('now', timezone.now())
+        return now - obj.entry_time
+
+class ReservationSerializer(serializers.Serializer):
+    """Элемент пакетной резервации"""
+    spot = serializers.IntegerField()
+    license_plate = serializers.CharField(max_length=20)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError(
+                "Время начала должно быть раньше времени окончания"
+            )
+        return data
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ['id', 'parking_log', 'amount', 'status', 'payment_time'] 
\ No newline at end of file
+        fields = ['id', 'parking_log', 'amount', 'status', 'payment_time', 'updated_at'] 
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'kind', 'params', 'status', 'is_final', 'error',
+                 'created_at', 'started_at', 'finished_at', 'download_url']
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        url = reverse('reportjob-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,232 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db.models import Sum, Count, Q, Value, DateTimeField, DurationField, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Trunc, Greatest, Least, Coalesce
+from django.utils import timezone
+
+from .archive import archive_cutoff
+from .models import (
+    ParkingSpot, ParkingLog, Payment, ParkingLogArchive, PaymentArchive, HourlySpotStats, HourlyRevenue
+)
+from .rollups import PAID, is_hour_aligned
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+# Ограничение на число интервалов ряда (например, почасовой ряд за год - 8784)
+MAX_BUCKETS = 10000
+
+
+def local_midnight(date, tz=None):
+    """Начало суток date в часовом поясе отчетов"""
+    return timezone.make_aware(datetime.combine(date, time.min), tz or timezone.get_current_timezone())
+
+
+def bucket_start(value, granularity, tz=None):
+    """Начало интервала, в который попадает момент value (в локальном времени)"""
+    tz = tz or timezone.get_current_timezone()
+    local = timezone.localtime(value, tz)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    date = local.date()
+    if granularity == 'week':
+        date -= timedelta(days=date.weekday())
+    elif granularity == 'month':
+        date = date.replace(day=1)
+    return local_midnight(date, tz)
+
+
+def next_bucket(start, granularity, tz=None):
+    """Начало следующего интервала"""
+    tz = tz or timezone.get_current_timezone()
+    if granularity == 'hour':
+        # Через UTC, чтобы переход на летнее время не давал повторов и пропусков
+        return timezone.localtime(start + timedelta(hours=1), tz)
+    date = timezone.localtime(start, tz).date()
+    if granularity == 'day':
+        date += timedelta(days=1)
+    elif granularity == 'week':
+        date += timedelta(days=7)
+    else:
+        date = (date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return local_midnight(date, tz)
+
+
+def buckets(start_time, end_time, granularity, tz=None):
+    """Начала всех интервалов периода [start_time, end_time)"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Неизвестная гранулярность: {granularity}')
+    result = []
+    current = bucket_start(start_time, granularity, tz)
+    while current < end_time:
+        result.append(current)
+        if len(result) > MAX_BUCKETS:
+            raise ValueError(f'Период содержит больше {MAX_BUCKETS} интервалов')
+        current = next_bucket(current, granularity, tz)
+    return result
+
+
+def use_rollups(start_time, end_time, status=PAID):
+    """
+    Можно ли читать почасовые итоги вместо исходных строк: итоги включены
+    (PARKING_REPORT_ROLLUPS), хранят только оплаченные платежи и целые часы
+    """
+    return (
+        getattr(settings, 'PARKING_REPORT_ROLLUPS', True)
+        and status == PAID
+        and is_hour_aligned(start_time)
+        and is_hour_aligned(end_time)
+    )
+
+
+def revenue_series(start_time, end_time, granularity='day', status=PAID):
+    """
+    Выручка и количество оплат по интервалам периода [start_time, end_time)
+    одним сгруппированным запросом: по почасовым итогам или по платежам
+    (горячие и архивные через UNION ALL). Интервалы считаются в текущем
+    часовом поясе; интервалы без оплат заполняются нулями.
+    :return: список {'period': aware datetime, 'amount': Decimal, 'count': int}
+    """
+    tz = timezone.get_current_timezone()
+    series = buckets(start_time, end_time, granularity, tz)
+
+    if use_rollups(start_time, end_time, status):
+        rows = HourlyRevenue.objects.filter(
+            hour__gte=start_time,
+            hour__lt=end_time
+        ).order_by().annotate(
+            bucket=Trunc('hour', granularity, tzinfo=tz)
+        ).values('bucket').annotate(
+            total=Sum('amount'),
+            number=Sum('payments')
+        ).values_list('bucket', 'total', 'number')
+        return _fill_series(series, rows, granularity, tz)
+
+    def grouped(model):
+        return model.objects.filter(
+            payment_time__gte=start_time,
+            payment_time__lt=end_time,
+            status=status
+        ).order_by().annotate(
+            bucket=Trunc('payment_time', granularity, tzinfo=tz)
+        ).values('bucket').annotate(
+            total=Sum('amount'),
+            number=Count('id')
+        ).values_list('bucket', 'total', 'number')
+
+    return _fill_series(series, grouped(Payment).union(grouped(PaymentArchive), all=True), granularity, tz)
+
+
+def _fill_series(series, rows, granularity, tz):
+    """Суммы строк (интервал, сумма, количество) по интервалам ряда с нулями для пустых"""
+    totals = {}
+    for period, amount, count in rows:
+        period = bucket_start(period, granularity, tz)
+        previous_amount, previous_count = totals.get(period, (0, 0))
+        totals[period] = (previous_amount + (amount or 0), previous_count + count)
+
+    return [
+        {'period': period, 'amount': totals.get(period, (0, 0))[0], 'count': totals.get(period, (0, 0))[1]}
+        for period in series
+    ]
+
+
+def clipped_duration(start_time, end_time, now):
+    """
+    Длительность сессии внутри окна [start_time, end_time):
+    LEAST(COALESCE(exit_time, now), end) - GREATEST(entry_time, start)
+    """
+    return ExpressionWrapper(
+        Least(
+            Coalesce('exit_time', Value(now, output_field=DateTimeField())),
+            Value(end_time, output_field=DateTimeField())
+        ) - Greatest('entry_time', Value(start_time, output_field=DateTimeField())),
+        output_field=DurationField()
+    )
+
+
+def _occupied_by_spot(model, start_time, end_time, now, open_only=False):
+    """Занятое время по местам: {spot_id: секунд} одним GROUP BY"""
+    if min(end_time, now) <= start_time:
+        # Окно еще не началось: незакрытые сессии дали бы отрицательное время
+        return {}
+    sessions = model.objects.filter(entry_time__lt=min(end_time, now))
+    if open_only:
+        sessions = sessions.filter(exit_time__isnull=True)
+    else:
+        sessions = sessions.filter(Q(exit_time__isnull=True) | Q(exit_time__gt=start_time))
+    rows = sessions.order_by().values('spot_id').annotate(
+        occupied=Sum(clipped_duration(start_time, end_time, now))
+    ).values_list('spot_id', 'occupied')
+    return {spot_id: occupied.total_seconds() for spot_id, occupied in rows if occupied}
+
+
+def _rolled_up_by_spot(model, field, start_time, end_time):
+    """Сумма поля почасовых итогов по местам за окно"""
+    return dict(
+        model.objects.filter(hour__gte=start_time, hour__lt=end_time).order_by().values(
+            'spot_id'
+        ).annotate(total=Sum(field)).values_list('spot_id', 'total')
+    )
+
+
+def _revenue_by_spot(start_time, end_time, status, archived):
+    """Выручка по местам: {spot_id: Decimal} одним GROUP BY"""
+    if archived:
+        # В архиве платеж связан с логом через log_id, а не через внешний ключ
+        payments = PaymentArchive.objects.annotate(
+            spot_id=Subquery(
+                ParkingLogArchive.objects.filter(log_id=OuterRef('log_id')).values('spot_id')[:1]
+            )
+        )
+        spot_field = 'spot_id'
+    else:
+        payments = Payment.objects.all()
+        spot_field = 'parking_log__spot_id'
+    return dict(
+        payments.filter(
+            status=status,
+            payment_time__gte=start_time,
+            payment_time__lt=end_time
+        ).order_by().values(spot_field).annotate(total=Sum('amount')).values_list(spot_field, 'total')
+    )
+
+
+def _merge(target, source):
+    for key, value in source.items():
+        if value:
+            target[key] = target[key] + value if target.get(key) else value
+
+
+def spot_utilization(start_time, end_time, now=None, status=PAID):
+    """
+    Загрузка и выручка по каждому месту за окно [start_time, end_time).
+    Для окон из целых часов закрытые сессии и выручка читаются из почасовых
+    итогов, а незакрытые сессии добавляются из логов. Иначе сессии
+    обрезаются границами окна в базе (GREATEST/LEAST), поэтому сессии
+    через полночь и незакрытые сессии учитываются частично; архив
+    читается, только если окно начинается раньше горизонта архивации.
+    :return: список {'spot_id', 'number', 'occupied_seconds', 'revenue', 'utilization'}
+    """
+    now = now or timezone.now()
+    if use_rollups(start_time, end_time, status):
+        occupied = _rolled_up_by_spot(HourlySpotStats, 'occupied_seconds', start_time, end_time)
+        _merge(occupied, _occupied_by_spot(ParkingLog, start_time, end_time, now, open_only=True))
+        revenue = _rolled_up_by_spot(HourlyRevenue, 'amount', start_time, end_time)
+    else:
+        occupied = _occupied_by_spot(ParkingLog, start_time, end_time, now)
+        revenue = _revenue_by_spot(start_time, end_time, status, archived=False)
+        if start_time < archive_cutoff(now):
+            _merge(occupied, _occupied_by_spot(ParkingLogArchive, start_time, end_time, now))
+            _merge(revenue, _revenue_by_spot(start_time, end_time, status, archived=True))
+
+    window = (end_time - start_time).total_seconds()
+    result = []
+    for spot_id, number in ParkingSpot.objects.order_by('number').values_list('id', 'number'):
+        seconds = occupied.get(spot_id) or 0
+        result.append({
+            'spot_id': spot_id,
+            'number': number,
+            'occupied_seconds': seconds,
+            'revenue': revenue.get(spot_id) or 0,
+            'utilization': min(seconds / window * 100, 100) if window > 0 else 0,
+        })
+    return result
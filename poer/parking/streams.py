@@ -0,0 +1,223 @@
+import asyncio
+import json
+import threading
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import logging
+
+from .models import ParkingSpot
+from .occupancy import cached_occupancy_counts as occupancy_counts
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+# Опрос изменений, сделанных другими процессами (гейты, WSGI-воркеры)
+POLL_SECONDS = 5
+
+
+def spot_state(spot):
+    """Состояние места: occupied / reserved / free"""
+    if spot['is_occupied']:
+        return 'occupied'
+    if spot['is_reserved']:
+        return 'reserved'
+    return 'free'
+
+
+def spot_delta(spot):
+    return {'id': spot['id'], 'number': spot['number'], 'state': spot_state(spot)}
+
+
+def occupancy_snapshot():
+    """Полное состояние всех мест и счетчики"""
+    spots = ParkingSpot.objects.values('id', 'number', 'is_occupied', 'is_reserved')
+    return {
+        'spots': [spot_delta(spot) for spot in spots],
+        'counts': occupancy_counts(),
+    }
+
+
+class Subscription:
+    """
+    Подписчик потока. Хранит только последние изменения по каждому месту,
+    поэтому память на соединение ограничена числом мест, а медленный
+    клиент получает свежее состояние, а не очередь устаревших событий.
+    """
+    __slots__ = ('pending', 'counts', 'event')
+
+    def __init__(self):
+        self.pending = {}
+        self.counts = None
+        self.event = asyncio.Event()
+
+    def push(self, deltas, counts):
+        for delta in deltas:
+            self.pending[delta['id']] = delta
+        if counts is not None:
+            self.counts = counts
+        self.event.set()
+
+    async def wait(self, timeout):
+        """Накопленные изменения или None по таймауту"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        batch = {'spots': list(self.pending.values()), 'counts': self.counts}
+        self.pending = {}
+        self.counts = None
+        return batch
+
+
+class OccupancyBroadcaster:
+    """Рассылка изменений всем подписчикам процесса, сгруппированным по event loop"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loops = {}
+        self._poller = None
+        self._last_seen = None
+
+    @property
+    def has_subscribers(self):
+        return bool(self._loops)
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription()
+        with self._lock:
+            self._loops.setdefault(loop, set()).add(subscription)
+            if self._poller is None or self._poller.done():
+                self._poller = loop.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscribers = self._loops.get(loop)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._loops[loop]
+
+    def publish(self, deltas, counts=None):
+        """Потокобезопасная публикация: один вызов на event loop, а не на подписчика"""
+        with self._lock:
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fanout, loop, deltas, counts)
+            except RuntimeError:
+                # Event loop уже закрыт
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+    def _fanout(self, loop, deltas, counts):
+        for subscription in list(self._loops.get(loop, ())):
+            subscription.push(deltas, counts)
+
+    async def _poll(self):
+        """Подхват изменений мест, сохраненных в других процессах"""
+        while self.has_subscribers:
+            try:
+                deltas, counts = await sync_to_async(self._changed_spots)()
+                if deltas:
+                    self.publish(deltas, counts)
+            except Exception as e:
+                logger.error(f"Ошибка при опросе состояния мест: {str(e)}")
+            await asyncio.sleep(POLL_SECONDS)
+
+    def _changed_spots(self):
+        if self._last_seen is None:
+            self._last_seen = ParkingSpot.objects.aggregate(last=Max('updated_at'))['last']
+            return [], None
+        spots = list(
+            ParkingSpot.objects.filter(updated_at__gt=self._last_seen)
+            .values('id', 'number', 'is_occupied', 'is_reserved', 'updated_at')
+        )
+        if not spots:
+            return [], None
+        self._last_seen = max(spot['updated_at'] for spot in spots)
+        return [spot_delta(spot) for spot in spots], occupancy_counts()
+
+
+broadcaster = OccupancyBroadcaster()
+
+
+def instance_delta(instance):
+    return spot_delta({
+        'id': instance.id,
+        'number': instance.number,
+        'is_occupied': instance.is_occupied,
+        'is_reserved': instance.is_reserved,
+    })
+
+
+def publish_on_commit(*deltas):
+    """
+    Рассылка после фиксации транзакции: откаченное изменение не попадает
+    в поток. Счетчики считаются уже после смены версии мест (обработчик
+    occupancy подключен раньше, его on_commit выполняется первым).
+    """
+    transaction.on_commit(lambda: broadcaster.publish(list(deltas), occupancy_counts()))
+
+
+def publish_spots_on_commit(spots):
+    """
+    Рассылка мест, записанных bulk-операцией (сигналы при ней не отправляются).
+    Вызывается после смены версии мест в той же транзакции.
+    """
+    if broadcaster.has_subscribers:
+        publish_on_commit(*[instance_delta(spot) for spot in spots])
+
+
+@receiver(post_save, sender=ParkingSpot)
+def publish_spot_change(sender, instance, **kwargs):
+    if broadcaster.has_subscribers:
+        publish_on_commit(instance_delta(instance))
+
+
+@receiver(post_delete, sender=ParkingSpot)
+def publish_spot_delete(sender, instance, **kwargs):
+    if broadcaster.has_subscribers:
+        publish_on_commit({'id': instance.id, 'number': instance.number, 'state': 'removed'})
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+async def occupancy_events():
+    """Поток событий SSE: снимок при подключении, затем изменения"""
+    subscription = broadcaster.subscribe()
+    try:
+        snapshot = await sync_to_async(occupancy_snapshot)()
+        yield sse_event('snapshot', snapshot)
+        while True:
+            batch = await subscription.wait(KEEPALIVE_SECONDS)
+            if batch is None:
+                yield ': keepalive\n\n'
+            else:
+                yield sse_event('delta', batch)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def occupancy_stream(request):
+    """GET /api/occupancy/stream/ - живой поток занятости мест (Server-Sent Events, ASGI)"""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный поток занял бы воркер навсегда
+        return JsonResponse(
+            {'error': 'Поток доступен только при запуске под ASGI'},
+            status=501
+        )
+    response = StreamingHttpResponse(occupancy_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,257 @@
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
+from django.utils import timezone
+import numpy as np
+
+from .analytics import Epoch
+from .archive import archive_cutoff
+from .models import ParkingLog, ParkingLogArchive, Payment, PaymentArchive
+
+# Шаг таблицы тарифа: границы правил кратны 15 минутам местного времени
+SLOT = 900
+SLOTS_PER_DAY = 86400 // SLOT
+# 1970-01-01 - четверг (понедельник = 0)
+EPOCH_WEEKDAY = 3
+PAID = 'completed'
+# Платежи, из которых складывается начисление за сессию (кроме ошибочных)
+CHARGED = ('pending', PAID)
+
+# Тариф по умолчанию - прежние 100 рублей за каждый начатый час
+DEFAULT_TARIFF = {
+    'rate': 100,
+    'rules': (),
+    'grace_minutes': 0,
+    'daily_cap': None,
+    'step_minutes': 60,
+}
+
+
+def _slot(value, name):
+    """'HH:MM' -> номер 15-минутного интервала суток"""
+    try:
+        hours, minutes = (int(part) for part in value.split(':'))
+    except (AttributeError, ValueError):
+        raise ImproperlyConfigured(f'PARKING_TARIFF: {name} must be HH:MM, got {value!r}')
+    seconds = (hours * 60 + minutes) * 60
+    if not (0 <= minutes < 60 and 0 <= seconds <= 86400) or seconds % SLOT:
+        raise ImproperlyConfigured(f'PARKING_TARIFF: {name} must be a multiple of 15 minutes within a day')
+    return seconds // SLOT
+
+
+def compile_tariff(config, tz=None):
+    """
+    Сборка тарифа из настроек в таблицу ставок (день недели x 15 минут).
+    Правила применяются по порядку, более позднее перекрывает раннее;
+    правило с end <= start действует с start до конца суток и с начала
+    суток до end в те же дни недели.
+    """
+    config = {**DEFAULT_TARIFF, **config}
+    table = np.full((7, SLOTS_PER_DAY), float(config['rate']))
+    for rule in config['rules']:
+        days = list(rule.get('days', range(7)))
+        if any(day not in range(7) for day in days):
+            raise ImproperlyConfigured('PARKING_TARIFF: rule days must be weekday numbers 0-6')
+        start = _slot(rule.get('start', '00:00'), 'start')
+        end = _slot(rule.get('end', '24:00'), 'end')
+        rate = float(rule['rate'])
+        for day in days:
+            if start < end:
+                table[day, start:end] = rate
+            else:
+                table[day, start:] = rate
+                table[day, :end] = rate
+
+    cap = config['daily_cap']
+    step = int(config['step_minutes']) * 60
+    if step <= 0:
+        raise ImproperlyConfigured('PARKING_TARIFF: step_minutes must be positive')
+    return Tariff(
+        table,
+        grace=int(config['grace_minutes']) * 60,
+        cap=float(cap) if cap is not None else np.inf,
+        step=step,
+        tz=tz or timezone.get_default_timezone()
+    )
+
+
+class Tariff:
+    """
+    Скомпилированный тариф. Стоимость сессии - интеграл ставки по времени
+    (длительность округляется вверх до step секунд); сессии не дольше
+    grace бесплатны; начисление за местные сутки не превышает cap.
+    """
+    __slots__ = ('table', 'grace', 'cap', 'step', 'tz')
+
+    def __init__(self, table, grace, cap, step, tz):
+        self.table = table
+        self.grace = grace
+        self.cap = cap
+        self.step = step
+        self.tz = tz
+
+    def _timeline(self, first, last):
+        """
+        Интервалы по SLOT секунд от first до last: стоимость каждого,
+        накопленная стоимость на их границах и местные сутки.
+        Смещение часового пояса берется по каждому часу UTC, поэтому
+        переходы на летнее время учитываются.
+        """
+        base = np.floor(first / SLOT) * SLOT
+        count = int(np.ceil((last - base) / SLOT)) + 1
+        starts = base + np.arange(count) * SLOT
+        hours = (starts // 3600).astype(np.int64)
+        first_hour = int(hours[0])
+        offsets = np.array([
+            datetime.fromtimestamp(hour * 3600, self.tz).utcoffset().total_seconds()
+            for hour in range(first_hour, int(hours[-1]) + 1)
+        ])
+        local = starts + offsets[hours - first_hour]
+        local_day = (local // 86400).astype(np.int64)
+        weekday = (local_day + EPOCH_WEEKDAY) % 7
+        slot_of_day = ((local % 86400) // SLOT).astype(np.int64)
+
+        prices = self.table[weekday, slot_of_day] * (SLOT / 3600)
+        cumulative = np.concatenate([[0.0], np.cumsum(prices)])
+        new_day = np.concatenate([[True], local_day[1:] != local_day[:-1]])
+        day_first = np.append(np.flatnonzero(new_day), count)
+        day_index = np.cumsum(new_day) - 1
+        capped = np.minimum(cumulative[day_first[1:]] - cumulative[day_first[:-1]], self.cap)
+        capped_cumulative = np.concatenate([[0.0], np.cumsum(capped)])
+        return base, prices, cumulative, day_first, day_index, capped_cumulative
+
+    def price_batch(self, entry, exit):
+        """
+        Стоимость сессий по массивам моментов въезда и выезда (секунды Unix).
+        :return: массив сумм в рублях, округленных до копеек
+        """
+        entry = np.asarray(entry, dtype=np.float64)
+        exit = np.asarray(exit, dtype=np.float64)
+        if not len(entry):
+            return np.zeros(0)
+        duration = np.maximum(exit - entry, 0)
+        # Допуск в миллисекунду: иначе ровно час из-за погрешности float стал бы двумя
+        billed = np.maximum(np.ceil((duration - 0.001) / self.step), 0) * self.step
+        stop = entry + billed
+        base, prices, cumulative, day_first, day_index, capped_cumulative = self._timeline(entry.min(), stop.max())
+
+        def cost(moment):
+            slot = np.minimum(((moment - base) // SLOT).astype(np.int64), len(prices) - 1)
+            return cumulative[slot] + prices[slot] * (moment - base - slot * SLOT) / SLOT
+
+        first_slot = ((entry - base) // SLOT).astype(np.int64)
+        last_slot = ((np.maximum(stop - 1e-6, entry) - base) // SLOT).astype(np.int64)
+        first_day = day_index[first_slot]
+        last_day = day_index[last_slot]
+        entry_cost = cost(entry)
+        stop_cost = cost(stop)
+
+        # Сессия в пределах одних суток - одно ограничение; иначе неполные первые
+        # и последние сутки плюс уже ограниченные полные сутки между ними
+        same_day = np.minimum(stop_cost - entry_cost, self.cap)
+        head = np.minimum(cumulative[day_first[first_day + 1]] - entry_cost, self.cap)
+        tail = np.minimum(stop_cost - cumulative[day_first[last_day]], self.cap)
+        middle = capped_cumulative[last_day] - capped_cumulative[np.minimum(first_day + 1, last_day)]
+        amount = np.where(first_day == last_day, same_day, head + middle + tail)
+        amount[duration <= self.grace] = 0
+        return np.round(amount, 2)
+
+    def price(self, entry_time, exit_time):
+        """Стоимость одной сессии (Decimal)"""
+        amount = self.price_batch([entry_time.timestamp()], [exit_time.timestamp()])[0]
+        return Decimal(str(amount)).quantize(Decimal('0.01'))
+
+
+@lru_cache(maxsize=None)
+def current_tariff():
+    """Тариф из settings.PARKING_TARIFF, собирается один раз на процесс"""
+    return compile_tariff(getattr(settings, 'PARKING_TARIFF', {}))
+
+
+@receiver(setting_changed)
+def tariff_setting_changed(setting, **kwargs):
+    if setting in ('PARKING_TARIFF', 'TIME_ZONE'):
+        current_tariff.cache_clear()
+
+
+def bill_session(log):
+    """
+    Начисление за закрытую сессию: стоимость по тарифу за вычетом оплаченного
+    создается ожидающим платежом. Вызывать внутри транзакции закрытия.
+    :return: Payment или None, если доплата не нужна
+    """
+    amount = current_tariff().price(log.entry_time, log.exit_time)
+    paid = Payment.objects.filter(parking_log=log, status=PAID).aggregate(total=Sum('amount'))['total'] or 0
+    if amount <= paid:
+        return None
+    return Payment.objects.create(parking_log=log, amount=amount - paid, status='pending')
+
+
+def open_session_debts(now=None):
+    """
+    Текущий долг по незакрытым сессиям (стоимость до now за вычетом оплат).
+    :return: (список сессий, общий долг)
+    """
+    now = now or timezone.now()
+    # Только условие exit_time IS NULL: так выбирается частичный индекс незакрытых сессий
+    rows = list(ParkingLog.objects.filter(exit_time__isnull=True).annotate(
+        entry=Epoch('entry_time'),
+        paid=Sum('payment__amount', filter=Q(payment__status=PAID))
+    ).order_by('entry_time').values_list('id', 'spot__number', 'car__license_plate', 'entry_time', 'entry', 'paid'))
+    amounts = current_tariff().price_batch([row[4] for row in rows], np.full(len(rows), now.timestamp()))
+    sessions = []
+    for (log_id, spot, plate, entry_time, _, paid), amount in zip(rows, amounts.tolist()):
+        paid = float(paid or 0)
+        sessions.append({
+            'log_id': log_id,
+            'spot': spot,
+            'license_plate': plate,
+            'entry_time': entry_time,
+            'amount': amount,
+            'paid': paid,
+            'due': round(max(amount - paid, 0), 2),
+        })
+    return sessions, round(sum(session['due'] for session in sessions), 2)
+
+
+def closed_session_charges(start_time, end_time, now=None):
+    """
+    Начисления за сессии, закрытые в [start_time, end_time): суммы платежей
+    сессии (оплаченных и ожидающих), то есть по тарифу, действовавшему при
+    выезде. Горячие логи и (если окно старше горизонта архивации) архив.
+    :return: (spot_id, момент выезда в секундах Unix, сумма) - массивы NumPy
+    """
+    charged = Q(status__in=CHARGED)
+    parts = [ParkingLog.objects.annotate(
+        charged=Sum('payment__amount', filter=Q(payment__status__in=CHARGED))
+    )]
+    if start_time < archive_cutoff(now or timezone.now()):
+        # В архиве платеж связан с логом через log_id, а не через внешний ключ
+        parts.append(ParkingLogArchive.objects.annotate(charged=Subquery(
+            PaymentArchive.objects.filter(charged, log_id=OuterRef('log_id')).order_by().values('log_id').annotate(
+                total=Sum('amount')
+            ).values('total')
+        )))
+    data = np.concatenate([
+        np.array(
+            list(queryset.filter(exit_time__gte=start_time, exit_time__lt=end_time).order_by().values_list(
+                'spot_id', Epoch('exit_time'), Coalesce('charged', Value(Decimal(0)), output_field=DecimalField())
+            )),
+            dtype=np.float64
+        ).reshape(-1, 3)
+        for queryset in parts
+    ])
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def group_sum(keys, amounts):
+    """Суммы начислений по ключам (места, номера суток): {ключ: сумма}"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=amounts, minlength=len(unique))
+    return dict(zip(unique.tolist(), np.round(totals, 2).tolist()))
@@ -1,5 +1,11 @@
+from datetime import timedelta
 from django.utils import timezone
 from .models import ParkingSpot
+from .archive import archive_logs
+from .columnar import ColumnarUnavailable, export_partitions
+from .report_jobs import purge_report_jobs
+from smart_parking.db_router import sync_replica
+from .versions import bump_version, REPLICA_VERSIONS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,4 +26,58 @@ def check_reservation_timeouts():
     return {
         'cancelled_count': len(cancelled),
         'cancelled_spots': [spot.number for spot in cancelled]
-    } 
\ No newline at end of file
+    } 
+
+def sync_read_replica():
+    """Обновление реплики для отчетов"""
+    try:
+        sync_replica()
+        bump_version(*REPLICA_VERSIONS)
+        logger.info("Реплика базы данных обновлена")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении реплики: {str(e)}")
+        return False
+
+def archive_old_logs():
+    """Перенос закрытых логов старше горизонта в архив"""
+    logs, payments = archive_logs()
+    if logs:
+        logger.info(f"Архивировано логов: {logs}, платежей: {payments}")
+    return {
+        'archived_logs': logs,
+        'archived_payments': payments
+    }
+
+def export_analytics():
+    """
+    Обновление разделов выгрузки для аналитики за прошлый и текущий месяц
+    (их отдает /api/analytics/export/); полные разделы не перезаписываются
+    """
+    current = timezone.localdate().replace(day=1)
+    previous = (current - timedelta(days=1)).replace(day=1)
+    try:
+        # Из основной базы: полнота раздела определяется по updated_at,
+        # а отстающая реплика дала бы раздел без последних изменений
+        partitions = export_partitions(previous, current)
+    except ColumnarUnavailable as e:
+        logger.warning(f"Выгрузка для аналитики пропущена: {str(e)}")
+        return {
+            'written_partitions': 0
+        }
+    written = sum(1 for *_, rows in partitions if rows is not None)
+    if written:
+        logger.info(f"Выгрузка для аналитики: обновлено разделов {written}")
+    return {
+        'written_partitions': written
+    }
+
+def purge_old_report_jobs():
+    """Удаление устаревших отчетов по открытым периодам и зависших заданий"""
+    stale, removed = purge_report_jobs()
+    if stale or removed:
+        logger.info(f"Заданий на отчеты удалено: {removed}, зависших: {stale}")
+    return {
+        'stale_jobs': stale,
+        'removed_jobs': removed
+    }
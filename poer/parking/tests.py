@@ -1,3 +1,1186 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import warnings
+import threading
+import time
+import zipfile
+from contextlib import contextmanager, nullcontext
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache, caches
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from unittest import mock, skipUnless
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from smart_parking.metrics import QueryStats, _request_queries, registry
+from smart_parking.db_router import reset_replica_check, sync_replica, use_replica
+from smart_parking.sqlite import WriterQueue
+from .models import (
+    ParkingSpot, Car, ParkingLog, Payment, ParkingLogArchive, PaymentArchive, HourlySpotStats, ReportJob
+)
+from . import columnar
+from .receipts import receipts_root, write_receipts_zip
+from .tariffs import closed_session_charges, compile_tariff
+from .analytics import occupancy_heatmap
+from .changefeed import changes_after
+from .streams import broadcaster
+from .versions import KEY_PREFIX, CARS_VERSION, SPOTS_VERSION, get_version
+from .exports import export_rows, iter_csv
+from .report_jobs import DAILY, fail_orphaned_jobs, purge_report_jobs
+from .importers import Checkpoint, ImportDataError, LogImporter
+from .archive import archive_logs, payment_totals
+from .roles import ADMINISTRATOR, CLIENT, RECEPTIONIST, is_admin, is_client
+from .stats import local_midnight, revenue_series, spot_utilization
 
-# Create your tests here.
+
+class ListQueryCountTests(TestCase):
+    """Количество запросов на страницу списка не зависит от числа строк"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_rows(self, start, count):
+        now = timezone.now()
+        for i in range(start, start + count):
+            spot = ParkingSpot.objects.create(number=f'Q{i}')
+            car = Car.objects.create(license_plate=f'QC{i}')
+            log = ParkingLog.objects.create(
+                car=car,
+                spot=spot,
+                entry_time=now - timedelta(hours=2),
+                exit_time=now if i % 2 else None
+            )
+            Payment.objects.create(parking_log=log, amount=200, status='completed', payment_time=now)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def assert_constant_queries(self, url):
+        self.create_rows(0, 1)
+        single = self.count_queries(url)
+        self.create_rows(1, 9)
+        full_page = self.count_queries(url)
+        self.assertEqual(single, full_page, f'{url}: {single} queries for 1 row, {full_page} for 10 rows')
+
+    def test_spots_list(self):
+        self.assert_constant_queries('/api/spots/')
+
+    def test_cars_list(self):
+        self.assert_constant_queries('/api/cars/')
+
+    def test_logs_list(self):
+        self.assert_constant_queries('/api/logs/')
+
+    def test_payments_list(self):
+        self.assert_constant_queries('/api/payments/')
+
+
+class FastJSONListTests(TestCase):
+    """?format=fastjson отдает те же данные, что и сериализаторы DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        now = timezone.now()
+        for i in range(5):
+            spot = ParkingSpot.objects.create(number=f'F{i}')
+            car = Car.objects.create(license_plate=f'FC{i}')
+            log = ParkingLog.objects.create(
+                car=car,
+                spot=spot,
+                entry_time=now - timedelta(hours=i + 1),
+                exit_time=now if i % 2 else None
+            )
+            Payment.objects.create(parking_log=log, amount='150.50', status='completed', payment_time=now)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    def assert_same_pages(self, url, volatile=()):
+        regular = self.fetch(url)
+        fast = self.fetch(f'{url}&format=fastjson')
+        self.assertEqual(fast['next'] is None, regular['next'] is None)
+        for row in regular['results'] + fast['results']:
+            for field in volatile:
+                row.pop(field)
+        self.assertEqual(fast['results'], regular['results'])
+        return fast
+
+    def test_logs(self):
+        # duration открытых сессий зависит от момента запроса
+        page = self.assert_same_pages('/api/logs/?page_size=2', volatile=('duration',))
+        self.assertIn('cursor=', page['next'])
+        closed = [row for row in self.fetch('/api/logs/?page_size=10&format=fastjson')['results'] if row['exit_time']]
+        self.assertTrue(all(row['duration'] for row in closed))
+
+    def test_payments(self):
+        self.assert_same_pages('/api/payments/?page_size=10')
+
+    async def test_async_stream_under_asgi(self):
+        # Под ASGI синхронный поток был бы буферизован целиком
+        response = await self.async_client.get('/api/logs/?page_size=10&format=fastjson')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(json.loads(body)['results']), 5)
+
+
+class KeysetPaginationTests(TestCase):
+    """Обход страниц по курсору: каждая строка ровно один раз в порядке (-entry_time, id)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        now = timezone.now().replace(microsecond=0)
+        spot = ParkingSpot.objects.create(number='K1')
+        car = Car.objects.create(license_plate='KC1')
+        # Четыре сессии с одинаковым временем въезда - граница страницы внутри группы
+        for hours in (1, 2, 2, 2, 2, 3, 4):
+            ParkingLog.objects.create(car=car, spot=spot, entry_time=now - timedelta(hours=hours))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_walk_with_ties(self):
+        expected = list(ParkingLog.objects.order_by('-entry_time', 'id').values_list('id', flat=True))
+        seen = []
+        url = '/api/logs/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage!', 'e30', 'WyJ4IiwgMV0', 'WyIyMDI0LTAxLTAxVDAwOjAwOjAwWiIsICIxIl0'):
+            response = self.client.get(f'/api/logs/?cursor={cursor}')
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn('cursor', response.json())
+
+
+class ChangeFeedTests(TestCase):
+    """Лента изменений: строки с одинаковым updated_at не теряются, токен переживает пустой ответ"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        spot = ParkingSpot.objects.create(number='C1')
+        car = Car.objects.create(license_plate='CC1')
+        now = timezone.now()
+        for _ in range(5):
+            ParkingLog.objects.create(car=car, spot=spot, entry_time=now)
+        # Все строки изменены в один момент, заведомо раньше окна settle_seconds()
+        ParkingLog.objects.update(updated_at=now - timedelta(minutes=1))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ties_on_updated_at(self):
+        seen, token, has_more = [], None, True
+        while has_more:
+            rows, token, has_more = changes_after(ParkingLog.objects.all(), token, limit=2)
+            seen += [row.pk for row in rows]
+        self.assertEqual(seen, sorted(ParkingLog.objects.values_list('id', flat=True)))
+
+    def test_empty_page_keeps_token(self):
+        response = self.client.get('/api/logs/changes/?limit=10')
+        token = response.json()['next_since']
+        self.assertEqual(len(response.json()['results']), 5)
+        response = self.client.get(f'/api/logs/changes/?since={token}')
+        self.assertEqual(response.json(), {'results': [], 'next_since': token, 'has_more': False})
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 5000}, WRITE_TRANSACTION_MAX_SECONDS=5)
+    def test_settle_window(self):
+        # Строка, записанная 8 с назад, еще может оказаться позади
+        # зафиксированной позже транзакции, ждавшей блокировку
+        now = timezone.now()
+        log = ParkingLog.objects.first()
+        ParkingLog.objects.filter(pk=log.pk).update(updated_at=now - timedelta(seconds=8))
+        rows, _, _ = changes_after(ParkingLog.objects.all(), now=now)
+        self.assertNotIn(log, rows)
+        rows, _, _ = changes_after(ParkingLog.objects.all(), now=now + timedelta(seconds=3))
+        self.assertIn(log, rows)
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/logs/changes/?since=garbage!')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+
+class BulkTests(TestCase):
+    """Пакетные операции: ошибки по элементам вместо 500, конфликт резерваций"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        cls.spot = ParkingSpot.objects.create(number='B1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def reserve(self, *spots):
+        start = timezone.now() + timedelta(hours=1)
+        items = [
+            {'spot': spot, 'license_plate': f'BR{spot}', 'start_time': start, 'end_time': start + timedelta(hours=2)}
+            for spot in spots
+        ]
+        return self.client.post('/api/spots/bulk_reserve/', items, format='json')
+
+    def test_conflicting_reservation(self):
+        self.assertEqual(self.reserve(self.spot.id).status_code, 201)
+        response = self.reserve(self.spot.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('spot', response.json()['errors'][0])
+        self.assertEqual(ParkingLog.objects.filter(spot=self.spot).count(), 1)
+
+    def test_malformed_items(self):
+        response = self.client.post('/api/cars/bulk/', [{'license_plate': ['X']}, {'license_plate': 'B2'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertIn('license_plate', errors[0])
+        self.assertEqual(errors[1], {})
+
+        response = self.client.patch('/api/spots/bulk/', [{'id': 'abc', 'number': 'B3'}, {'id': [1]}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([list(error) for error in response.json()['errors']], [['id'], ['id']])
+        self.assertFalse(Car.objects.exists())
+
+
+class PlateSearchTests(TestCase):
+    """Поиск по номеру после пакетного создания и изменения автомобилей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.addCleanup(cache.clear)
+
+    def search(self, query):
+        response = self.client.get('/api/cars/', {'license_plate': query})
+        return sorted(row['license_plate'] for row in response.json()['results'])
+
+    def test_bulk_created_and_updated_cars_found(self):
+        response = self.client.post(
+            '/api/cars/bulk/', [{'license_plate': 'А123ВС77'}, {'license_plate': 'K 777 MM 99'}], format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        # Подстрока по триграммам, кириллица совпадает с латиницей
+        self.assertEqual(self.search('23bc'), ['А123ВС77'])
+        self.assertEqual(self.search('777mm'), ['K 777 MM 99'])
+        # Короткий запрос - тоже подстрока, не только начало номера
+        self.assertEqual(self.search('a1'), ['А123ВС77'])
+        self.assertEqual(self.search('23'), ['А123ВС77'])
+
+        car_id = response.json()[0]['id']
+        response = self.client.patch('/api/cars/bulk/', [{'id': car_id, 'license_plate': 'X555XX50'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('23bc'), [])
+        self.assertEqual(self.search('555'), ['X555XX50'])
+
+
+class VersionTests(TestCase):
+    """Версия набора данных меняется только после фиксации транзакции"""
+
+    def test_bumped_after_commit(self):
+        before = get_version(SPOTS_VERSION)['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            ParkingSpot.objects.create(number='V1')
+            self.assertEqual(get_version(SPOTS_VERSION)['token'], before)
+        self.assertNotEqual(get_version(SPOTS_VERSION)['token'], before)
+
+    def test_not_bumped_on_rollback(self):
+        before = get_version(SPOTS_VERSION)['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                ParkingSpot.objects.create(number='V2')
+                raise RuntimeError
+        self.assertEqual(get_version(SPOTS_VERSION)['token'], before)
+
+
+@contextmanager
+def replica_databases(primary, replica, max_age=None):
+    # Файлы баз подменяются только для маршрутизатора и sync_replica;
+    # соединения теста остаются прежними
+    databases = {
+        **settings.DATABASES,
+        'default': {**settings.DATABASES['default'], 'NAME': primary},
+        'replica': {**settings.DATABASES['replica'], 'NAME': replica},
+    }
+    override = override_settings(DATABASES=databases, REPLICA_MAX_AGE=max_age)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        override.enable()
+    try:
+        yield
+    finally:
+        override.disable()
+
+
+class ConditionalListTests(TestCase):
+    """304 по ETag и Last-Modified, сброс после изменения набора"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        Car.objects.create(license_plate='E1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.addCleanup(cache.clear)
+
+    def age_version(self, seconds):
+        version = get_version(CARS_VERSION)
+        cache.set(KEY_PREFIX + CARS_VERSION, {**version, 'modified': version['modified'] - seconds}, None)
+
+    def test_etag_not_modified_until_change(self):
+        etag = self.client.get('/api/cars/')['ETag']
+        self.assertEqual(self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.create(license_plate='E2')
+        response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified(self):
+        self.age_version(10)
+        last_modified = self.client.get('/api/cars/')['Last-Modified']
+        self.assertEqual(self.client.get('/api/cars/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # Изменение в текущей секунде: Last-Modified не отдается и не дает 304
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.create(license_plate='E2')
+        response = self.client.get('/api/cars/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_etag_follows_replica_snapshot(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica = os.path.join(directory.name, 'replica.sqlite3')
+        open(replica, 'wb').close()
+        # Тестовая реплика - зеркало основной базы в памяти: отдельное соединение
+        # с ней заблокировано транзакцией теста, поэтому тело читается из основной
+        no_replica_reads = mock.patch('parking.conditional.use_replica', nullcontext)
+        with no_replica_reads, replica_databases(os.path.join(directory.name, 'primary.sqlite3'), replica):
+            etag = self.client.get('/api/cars/')['ETag']
+            # Запись в основную базу еще не попала в реплику - ETag прежний
+            with self.captureOnCommitCallbacks(execute=True):
+                Car.objects.create(license_plate='E2')
+            self.assertEqual(self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # Реплика обновлена (возможно, другим процессом)
+            later = time.time() + 5
+            os.utime(replica, (later, later))
+            response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class OccupancyStreamTests(TestCase):
+    """Изменения мест рассылаются подписчикам только после фиксации"""
+
+    def setUp(self):
+        self.published = []
+        # Подписчик-заглушка: рассылка перехватывается, event loop не нужен
+        broadcaster._loops[object()] = set()
+        broadcaster.publish = lambda deltas, counts=None: self.published.append((deltas, counts))
+        self.addCleanup(broadcaster._loops.clear)
+        self.addCleanup(vars(broadcaster).pop, 'publish')
+
+    def test_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            spot = ParkingSpot.objects.create(number='S1')
+            spot.is_occupied = True
+            spot.save()
+            self.assertEqual(self.published, [])
+        self.assertEqual([deltas[0]['state'] for deltas, _ in self.published], ['free', 'occupied'])
+        self.assertEqual(self.published[-1][1]['occupied'], 1)
+
+    def test_rolled_back_change_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                ParkingSpot.objects.create(number='S2')
+                raise RuntimeError
+        self.assertEqual(self.published, [])
+
+    def test_bulk_update_published(self):
+        spots = [ParkingSpot.objects.create(number=f'S{i}') for i in (3, 4)]
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('tester', password='tester123'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(
+                '/api/spots/bulk/', [{'id': spot.id, 'number': f'{spot.number}A'} for spot in spots], format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        deltas, counts = self.published[-1]
+        self.assertEqual({delta['id']: delta['number'] for delta in deltas}, {spot.id: f'{spot.number}A' for spot in spots})
+        self.assertEqual(counts['free'], 2)
+
+    def test_wsgi_not_supported(self):
+        response = self.client.get('/api/occupancy/stream/')
+        self.assertEqual(response.status_code, 501)
+
+
+class HomeFragmentCacheTests(TestCase):
+    """Сетка мест на главной: перерисовывается только карточка измененного места"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester123')
+        cls.spots = [ParkingSpot.objects.create(number=f'H{i}') for i in (1, 2)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.addCleanup(cache.clear)
+        self.addCleanup(caches['fragments'].clear)
+        # Записи фрагментов перехватываются: set вызывается только при отрисовке
+        fragments = caches['fragments']
+        self.rendered = []
+        original_set = fragments.set
+
+        def record_set(key, *args, **kwargs):
+            self.rendered.append(key)
+            return original_set(key, *args, **kwargs)
+
+        fragments.set = record_set
+        self.addCleanup(vars(fragments).pop, 'set')
+
+    def rendered_cards(self):
+        self.rendered.clear()
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return [key for key in self.rendered if key.startswith('template.cache.spot_card.')]
+
+    def test_only_changed_spot_rerendered(self):
+        self.assertEqual(len(self.rendered_cards()), 2)
+        self.assertEqual(self.rendered_cards(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            spot = ParkingSpot.objects.get(pk=self.spots[0].pk)
+            spot.is_occupied = True
+            spot.save()
+        self.assertEqual(len(self.rendered_cards()), 1)
+
+    def test_rolled_back_change_not_rerendered(self):
+        self.rendered_cards()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                spot = ParkingSpot.objects.get(pk=self.spots[0].pk)
+                spot.is_occupied = True
+                spot.save()
+                raise RuntimeError
+        self.assertEqual(self.rendered_cards(), [])
+
+
+@override_settings(METRICS_QUERY_HEADER=True)
+class MetricsTests(TestCase):
+    """Счетчик запросов к БД в заголовке и выдача /metrics"""
+
+    def setUp(self):
+        registry.reset()
+        ParkingSpot.objects.create(number='M1')
+
+    def test_query_count_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/spots/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-Query-Count']), len(queries))
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/spots/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('parking_http_requests_total{view="parkingspot-list",method="GET",status="200"} 1', body)
+        self.assertIn('parking_http_request_duration_seconds_count{view="parkingspot-list",method="GET"} 1', body)
+
+    def test_writer_thread_queries_counted(self):
+        stats = QueryStats()
+        token = _request_queries.set(stats)
+        self.addCleanup(_request_queries.reset, token)
+        # Задание видит счетчик запроса, отправившего его в поток записи
+        self.assertIs(WriterQueue().call(_request_queries.get), stats)
+
+    def test_metrics_forbidden_for_remote_clients(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 403)
+
+
+class SQLiteTests(TestCase):
+    """PRAGMA новых соединений и очередь записи"""
+
+    def test_pragmas_on_new_connection(self):
+        # Новое соединение с той же базой: PRAGMA применяет обработчик connection_created
+        fresh = connections.create_connection('default')
+        self.addCleanup(fresh.close)
+        with fresh.cursor() as cursor:
+            for name, expected in (('synchronous', 1), ('busy_timeout', 5000), ('cache_size', -65536), ('temp_store', 2)):
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], expected, name)
+
+    def test_writes_serialized(self):
+        events = []
+
+        def job(index):
+            events.append(('start', index))
+            time.sleep(0.01)
+            events.append(('end', index))
+
+        writer = WriterQueue()
+        threads = [threading.Thread(target=writer.call, args=(job, index)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Задания не перекрываются: за началом каждого сразу следует его конец
+        self.assertEqual(len(events), 8)
+        for started, ended in zip(events[::2], events[1::2]):
+            self.assertEqual((started[0], ended[0], started[1]), ('start', 'end', ended[1]))
+
+    def test_call_from_writer_thread_wrapped(self):
+        writer = WriterQueue(wrap=lambda func, *args: ('atomic', func(*args)))
+        # Вложенный вызов из потока-писателя (как из on_commit) тоже оборачивается
+        self.assertEqual(writer.call(lambda: writer.call(lambda: 1)), ('atomic', ('atomic', 1)))
+
+
+class ReplicaRoutingTests(TestCase):
+    """Чтение из реплики в use_replica() и возврат к основной базе"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.primary = os.path.join(directory.name, 'primary.sqlite3')
+        self.replica = os.path.join(directory.name, 'replica.sqlite3')
+        self.addCleanup(reset_replica_check)
+
+    def replica_settings(self, max_age=None):
+        return replica_databases(self.primary, self.replica, max_age)
+
+    def read_alias(self):
+        with use_replica():
+            return router.db_for_read(Car)
+
+    def test_routing_and_fallback(self):
+        with self.replica_settings(max_age=60):
+            # Файла реплики нет
+            self.assertEqual(self.read_alias(), 'default')
+            open(self.replica, 'wb').close()
+            reset_replica_check()
+            self.assertEqual(self.read_alias(), 'replica')
+            self.assertEqual(router.db_for_read(Car), 'default')
+            with use_replica():
+                self.assertEqual(router.db_for_write(Car), 'default')
+            # Реплика старше REPLICA_MAX_AGE
+            old = time.time() - 120
+            os.utime(self.replica, (old, old))
+            reset_replica_check()
+            self.assertEqual(self.read_alias(), 'default')
+
+    def test_sync_replica(self):
+        with self.replica_settings(max_age=60):
+            with sqlite3.connect(self.primary) as source:
+                source.execute('CREATE TABLE sample (value INTEGER)')
+                source.execute('INSERT INTO sample VALUES (42)')
+            source.close()
+            self.assertEqual(self.read_alias(), 'default')
+            sync_replica()
+            # Проверка реплики сброшена - чтение сразу переходит на нее
+            self.assertEqual(self.read_alias(), 'replica')
+            replica = sqlite3.connect(self.replica)
+            self.addCleanup(replica.close)
+            self.assertEqual(replica.execute('SELECT value FROM sample').fetchall(), [(42,)])
+
+
+class RolesCacheTests(TestCase):
+    """Роли загружаются один раз и сбрасываются при изменении групп"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_group, _ = Group.objects.get_or_create(name=CLIENT)
+        cls.user = User.objects.create_user('roles', password='roles123')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_roles_cached_between_requests(self):
+        self.assertFalse(is_client(self.fresh_user()))
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(is_client(user))
+            self.assertFalse(is_admin(user))
+
+    def test_group_change_invalidates(self):
+        self.assertFalse(is_client(self.fresh_user()))
+        self.user.groups.add(self.client_group)
+        self.assertTrue(is_client(self.fresh_user()))
+        self.client_group.user_set.remove(self.user)
+        self.assertFalse(is_client(self.fresh_user()))
+
+
+class SpotUtilizationTests(TestCase):
+    """Сессии обрезаются границами окна отчета"""
+
+    def test_sessions_clipped_to_window(self):
+        start = local_midnight(date(2024, 3, 1))
+        end = start + timedelta(days=1)
+        spot = ParkingSpot.objects.create(number='U1')
+        other = ParkingSpot.objects.create(number='U2')
+        car = Car.objects.create(license_plate='UC1')
+        # Через полночь в начале суток: учитываются 2 часа
+        ParkingLog.objects.create(car=car, spot=spot, entry_time=start - timedelta(hours=3), exit_time=start + timedelta(hours=2))
+        # Незакрытая сессия в конце суток: до конца окна - 1 час
+        log = ParkingLog.objects.create(car=car, spot=spot, entry_time=end - timedelta(hours=1))
+        # Вне окна
+        ParkingLog.objects.create(car=car, spot=other, entry_time=end + timedelta(hours=1), exit_time=end + timedelta(hours=2))
+        Payment.objects.create(parking_log=log, amount='300.00', status='completed', payment_time=end - timedelta(minutes=30))
+
+        stats = {row['number']: row for row in spot_utilization(start, end, now=end + timedelta(hours=5))}
+        self.assertEqual(stats['U1']['occupied_seconds'], 3 * 3600)
+        self.assertEqual(stats['U1']['revenue'], Decimal('300.00'))
+        self.assertAlmostEqual(stats['U1']['utilization'], 12.5)
+        self.assertEqual(stats['U2']['occupied_seconds'], 0)
+
+    def test_rollups_match_raw_rows(self):
+        start = local_midnight(date(2024, 3, 1))
+        end = start + timedelta(days=1)
+        spot = ParkingSpot.objects.create(number='R1')
+        car = Car.objects.create(license_plate='RC1')
+        log = ParkingLog.objects.create(car=car, spot=spot, entry_time=start + timedelta(minutes=50))
+        payment = Payment.objects.create(parking_log=log, amount='150.00', status='pending')
+        # Закрытие сессии и оплата попадают в почасовые итоги через сигналы
+        log.exit_time = start + timedelta(hours=2, minutes=10)
+        log.save()
+        payment.status = 'completed'
+        payment.payment_time = log.exit_time
+        payment.save()
+        self.assertEqual(HourlySpotStats.objects.filter(spot=spot).count(), 3)
+
+        now = end + timedelta(hours=1)
+        with override_settings(PARKING_REPORT_ROLLUPS=False):
+            raw = spot_utilization(start, end, now=now)
+            raw_series = revenue_series(start, end, 'hour')
+        self.assertEqual(spot_utilization(start, end, now=now), raw)
+        self.assertEqual(revenue_series(start, end, 'hour'), raw_series)
+
+    def test_deleted_rows_leave_rollups(self):
+        start = local_midnight(date(2024, 3, 1))
+        end = start + timedelta(days=1)
+        now = end + timedelta(hours=1)
+        spot = ParkingSpot.objects.create(number='R2')
+        car = Car.objects.create(license_plate='RC2')
+        logs = []
+        for hour in (1, 5):
+            log = ParkingLog.objects.create(
+                car=car, spot=spot, entry_time=start + timedelta(hours=hour), exit_time=start + timedelta(hours=hour + 2)
+            )
+            Payment.objects.create(parking_log=log, amount='100.00', status='completed', payment_time=log.exit_time)
+            logs.append(log)
+
+        def assert_matches_raw():
+            with override_settings(PARKING_REPORT_ROLLUPS=False):
+                raw = spot_utilization(start, end, now=now)
+                raw_series = revenue_series(start, end, 'hour')
+            self.assertEqual(spot_utilization(start, end, now=now), raw)
+            self.assertEqual(revenue_series(start, end, 'hour'), raw_series)
+
+        Payment.objects.filter(parking_log=logs[0]).delete()
+        assert_matches_raw()
+        # Удаление лога каскадно удаляет и его платеж
+        logs[1].delete()
+        assert_matches_raw()
+        self.assertEqual(sum(row['count'] for row in revenue_series(start, end, 'hour')), 0)
+
+    def test_heatmap_matches_utilization(self):
+        start = local_midnight(date(2024, 3, 1))
+        end = start + timedelta(days=1)
+        spot = ParkingSpot.objects.create(number='H1')
+        other = ParkingSpot.objects.create(number='H2')
+        car = Car.objects.create(license_plate='HC1')
+        ParkingLog.objects.create(car=car, spot=spot, entry_time=start - timedelta(hours=1), exit_time=start + timedelta(hours=2, minutes=30))
+        ParkingLog.objects.create(car=car, spot=other, entry_time=start + timedelta(hours=1, minutes=15), exit_time=start + timedelta(hours=5))
+        ParkingLog.objects.create(car=car, spot=spot, entry_time=end - timedelta(minutes=20))
+
+        now = end + timedelta(hours=1)
+        heatmap = occupancy_heatmap(start, end, 'hour', now=now)
+        stats = {row['number']: row['occupied_seconds'] for row in spot_utilization(start, end, now=now)}
+        totals = dict(zip(heatmap['numbers'], heatmap['occupied_seconds'].sum(axis=1)))
+        self.assertAlmostEqual(totals['H1'], stats['H1'], places=1)
+        self.assertAlmostEqual(totals['H2'], stats['H2'], places=1)
+        # Второй час (01:00-02:00): H1 занято целиком, H2 - 45 минут
+        self.assertAlmostEqual(heatmap['occupied_seconds'][heatmap['numbers'].index('H2'), 1], 45 * 60, places=1)
+        self.assertEqual(heatmap['peak'], 2)
+        self.assertEqual(list(heatmap['peak_by_bucket'][:4]), [1, 2, 2, 1])
+        self.assertEqual(heatmap['dwell']['sessions'], 1)
+
+
+class RevenueSeriesTests(TestCase):
+    """Ряд выручки по дням, неделям и месяцам на границе месяца (Москва - без перехода на летнее время)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        spot = ParkingSpot.objects.create(number='V1')
+        car = Car.objects.create(license_plate='VC1')
+        moments = [
+            (date(2024, 2, 29), 23, '100.00'),  # четверг, последний день февраля
+            (date(2024, 3, 1), 0, '200.00'),    # пятница, та же неделя
+            (date(2024, 3, 4), 10, '300.00'),   # понедельник, следующая неделя
+        ]
+        for day, hour, amount in moments:
+            paid_at = local_midnight(day) + timedelta(hours=hour, minutes=30)
+            log = ParkingLog.objects.create(car=car, spot=spot, entry_time=paid_at - timedelta(hours=1), exit_time=paid_at)
+            Payment.objects.create(parking_log=log, amount=amount, status='completed', payment_time=paid_at)
+        cls.start = local_midnight(date(2024, 2, 26))
+        cls.end = local_midnight(date(2024, 3, 11))
+
+    def series(self, granularity):
+        """{дата начала интервала: (сумма, количество)}; итоги и исходные строки совпадают"""
+        with override_settings(PARKING_REPORT_ROLLUPS=False):
+            raw = revenue_series(self.start, self.end, granularity)
+        with override_settings(PARKING_REPORT_ROLLUPS=True):
+            self.assertEqual(revenue_series(self.start, self.end, granularity), raw)
+        return {
+            timezone.localtime(row['period']).date(): (Decimal(row['amount']), row['count'])
+            for row in raw
+        }
+
+    def test_day(self):
+        series = self.series('day')
+        self.assertEqual(len(series), 14)
+        self.assertEqual(series[date(2024, 2, 29)], (Decimal('100.00'), 1))
+        self.assertEqual(series[date(2024, 3, 1)], (Decimal('200.00'), 1))
+        self.assertEqual(series[date(2024, 3, 2)], (0, 0))
+        self.assertEqual(series[date(2024, 3, 4)], (Decimal('300.00'), 1))
+
+    def test_week(self):
+        self.assertEqual(self.series('week'), {
+            date(2024, 2, 26): (Decimal('300.00'), 2),
+            date(2024, 3, 4): (Decimal('300.00'), 1),
+        })
+
+    def test_month(self):
+        # Первый интервал начинается с начала месяца, в который попадает start
+        self.assertEqual(self.series('month'), {
+            date(2024, 2, 1): (Decimal('100.00'), 1),
+            date(2024, 3, 1): (Decimal('500.00'), 2),
+        })
+
+    def test_invalid_granularity(self):
+        with self.assertRaises(ValueError):
+            revenue_series(self.start, self.end, 'year')
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user('tester', password='tester123'))
+        response = api.get('/api/payments/revenue/', {'start': '2024-03-01', 'end': '2024-03-02', 'granularity': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReportJobTests(TestCase):
+    """Отчеты за закрытые периоды строятся один раз и отдаются с диска"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(REPORTS_ROOT=directory.name, REPORT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Роли кэшируются по pk пользователя, а pk после отката теста повторяются
+        self.addCleanup(cache.clear)
+        admin = User.objects.create_user('reports', password='reports123')
+        admin.groups.add(Group.objects.get_or_create(name=ADMINISTRATOR)[0])
+        self.api = APIClient()
+        self.api.force_authenticate(admin)
+
+    def test_closed_period_reused(self):
+        response = self.api.post('/api/reports/', {'kind': 'monthly', 'year': 2024, 'month': 3}, format='json')
+        # REPORT_WORKERS = 0: отчет строится сразу
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertTrue(response.data['is_final'])
+
+        download = self.api.get(response.data['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('monthly_report_2024_03.xlsx', download['Content-Disposition'])
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'PK'))
+
+        # Повторный запрос того же месяца не строит отчет заново
+        again = self.api.get('/api/payments/monthly_report/?year=2024&month=3')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_open_period_rebuilt(self):
+        self.api.post('/api/reports/', {'kind': 'daily'}, format='json')
+        response = self.api.post('/api/reports/', {'kind': 'daily'}, format='json')
+        self.assertFalse(response.data['is_final'])
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+    @override_settings(REPORT_HEARTBEAT_SECONDS=30)
+    def test_orphaned_jobs_failed(self):
+        now = timezone.now()
+        # Задание другого работающего процесса: отметка свежая
+        job = ReportJob.objects.create(
+            kind=DAILY, params={'date': '2024-03-01'}, params_key='x', status='running',
+            worker='other:1', heartbeat_at=now - timedelta(seconds=60)
+        )
+        self.assertEqual(fail_orphaned_jobs(now), 0)
+        # Процесс пропустил три отметки подряд
+        self.assertEqual(fail_orphaned_jobs(now + timedelta(seconds=60)), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    @override_settings(REPORT_JOB_TIMEOUT=600)
+    def test_timeout_counted_from_start(self):
+        now = timezone.now()
+        job = ReportJob.objects.create(
+            kind=DAILY, params={'date': '2024-03-01'}, params_key='x', status='running', heartbeat_at=now
+        )
+        # Долго ждало в очереди, но строится всего минуту
+        ReportJob.objects.filter(pk=job.pk).update(
+            created_at=now - timedelta(hours=1), started_at=now - timedelta(minutes=1)
+        )
+        self.assertEqual(purge_report_jobs(now), (0, 0))
+        ReportJob.objects.filter(pk=job.pk).update(started_at=now - timedelta(minutes=11))
+        self.assertEqual(purge_report_jobs(now), (1, 0))
+
+
+class LogExportTests(TestCase):
+    """Выгрузка сессий: строка на платеж, архив соединяется по log_id"""
+
+    def test_csv_export(self):
+        spot = ParkingSpot.objects.create(number='E1')
+        car = Car.objects.create(license_plate='EX1')
+        entry = timezone.now() - timedelta(hours=3)
+        paid = ParkingLog.objects.create(car=car, spot=spot, entry_time=entry, exit_time=entry + timedelta(hours=1))
+        Payment.objects.create(parking_log=paid, amount='100.00', status='failed', payment_time=paid.exit_time)
+        Payment.objects.create(parking_log=paid, amount='100.00', status='completed', payment_time=paid.exit_time)
+        ParkingLog.objects.create(car=car, spot=spot, entry_time=entry + timedelta(hours=2))
+        for log_id in (1000, 1001):
+            ParkingLogArchive.objects.create(
+                log_id=log_id, period='2024-01', car=car, spot=spot,
+                entry_time=entry - timedelta(days=300), exit_time=entry - timedelta(days=300, hours=-2),
+                created_at=entry, updated_at=entry
+            )
+        PaymentArchive.objects.create(
+            payment_id=5000, log_id=1001, period='2024-01', amount='250.00', status='completed',
+            payment_time=entry - timedelta(days=300), created_at=entry, updated_at=entry
+        )
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(iter_csv(export_rows())).decode('utf-8-sig'))))
+        self.assertEqual(
+            [(row['log_id'], row['payment_amount'], row['payment_status']) for row in rows],
+            [
+                ('1000', '', ''), ('1001', '250.00', 'completed'),
+                (str(paid.id), '100.00', 'failed'), (str(paid.id), '100.00', 'completed'),
+                (str(paid.id + 1), '', ''),
+            ]
+        )
+        self.assertEqual(rows[2]['duration_seconds'], '3600.0')
+        self.assertEqual(rows[4]['exit_time'], '')
+
+
+class ColumnarRowsTests(TestCase):
+    """Строки разделов и проверка полноты раздела (без pyarrow)"""
+
+    def setUp(self):
+        spot = ParkingSpot.objects.create(number='R1')
+        self.car = Car.objects.create(license_plate='RQ1')
+        self.start, self.end = columnar.month_bounds(date(2024, 3, 1))
+        entry = self.start + timedelta(days=4)
+        self.log = ParkingLog.objects.create(car=self.car, spot=spot, entry_time=entry, exit_time=entry + timedelta(hours=1))
+        self.payment = Payment.objects.create(parking_log=self.log, amount='100.00', status='completed')
+        ParkingLogArchive.objects.create(
+            log_id=1000, period='2024-03', car=self.car, spot=spot, entry_time=entry, exit_time=entry,
+            created_at=entry, updated_at=entry
+        )
+        PaymentArchive.objects.create(
+            payment_id=5000, log_id=1000, period='2024-03', amount='50.00', status='completed',
+            created_at=entry, updated_at=entry
+        )
+        # created_at задается при создании; переносим платеж в март
+        Payment.objects.filter(pk=self.payment.pk).update(created_at=entry)
+
+    def test_payment_rows(self):
+        rows = list(columnar._payment_rows(self.start, self.end))
+        self.assertEqual(
+            [(row[0], row[1], row[2], row[3], row[-1]) for row in rows],
+            [
+                (self.payment.pk, self.log.pk, self.log.spot_id, Decimal('100.00'), False),
+                (5000, 1000, self.log.spot_id, Decimal('50.00'), True),
+            ]
+        )
+
+    def test_is_complete(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = columnar.partition_path('logs', date(2024, 3, 1), root=root)
+            path.parent.mkdir(parents=True)
+            path.touch()
+            written = timezone.now().timestamp()
+            os.utime(path, (written, written))
+            self.assertTrue(columnar.is_complete('logs', path, date(2024, 3, 1)))
+            # Строка месяца изменена после записи раздела
+            ParkingLog.objects.filter(pk=self.log.pk).update(updated_at=timezone.now() + timedelta(minutes=1))
+            self.assertFalse(columnar.is_complete('logs', path, date(2024, 3, 1)))
+            # Незакрытая сессия месяца
+            ParkingLog.objects.filter(pk=self.log.pk).update(updated_at=self.start, exit_time=None)
+            self.assertFalse(columnar.is_complete('logs', path, date(2024, 3, 1)))
+
+    def test_endpoint_serves_exported_partitions(self):
+        admin = User.objects.create_user('analyst', password='analyst123')
+        admin.groups.add(Group.objects.get_or_create(name=ADMINISTRATOR)[0])
+        self.addCleanup(cache.clear)
+        api = APIClient()
+        api.force_authenticate(admin)
+        with tempfile.TemporaryDirectory() as root, override_settings(ANALYTICS_EXPORT_ROOT=root):
+            # Запрос разделы не пишет: не выгруженные месяцы - 404
+            response = api.get('/api/analytics/export/', {'start': '2024-03', 'end': '2024-04'})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json()['missing'], ['2024-03', '2024-04'])
+            self.assertFalse(columnar.partition_path('logs', date(2024, 3, 1)).exists())
+
+            path = columnar.partition_path('logs', date(2024, 3, 1))
+            path.parent.mkdir(parents=True)
+            path.write_bytes(b'PAR1')
+            response = api.get('/api/analytics/export/', {'start': '2024-03'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'PAR1')
+
+
+@skipUnless(columnar.pa is not None, 'pyarrow is not installed')
+class ColumnarExportTests(TestCase):
+    """Разделы закрытых месяцев при повторной выгрузке не перезаписываются"""
+
+    def test_export_partitions(self):
+        spot = ParkingSpot.objects.create(number='P1')
+        car = Car.objects.create(license_plate='PQ1')
+        entry = local_midnight(date(2024, 3, 5))
+        log = ParkingLog.objects.create(car=car, spot=spot, entry_time=entry, exit_time=entry + timedelta(hours=1))
+        Payment.objects.create(parking_log=log, amount='100.00', status='completed', payment_time=log.exit_time)
+
+        with tempfile.TemporaryDirectory() as root:
+            partitions = columnar.export_partitions(date(2024, 3, 1), date(2024, 4, 1), datasets=('logs',), root=root)
+            self.assertEqual([rows for *_, rows in partitions], [1, 0])
+            table = columnar.pq.read_table(partitions[0][2])
+            self.assertEqual(table.column('license_plate').to_pylist(), ['PQ1'])
+
+            again = columnar.export_partitions(date(2024, 3, 1), date(2024, 4, 1), datasets=('logs',), root=root)
+            self.assertEqual([rows for *_, rows in again], [None, None])
+
+
+class ReceiptTests(TestCase):
+    """Оплаченные чеки строятся один раз и хранятся по хэшу содержимого"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(RECEIPTS_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        spot = ParkingSpot.objects.create(number='C1')
+        self.car = Car.objects.create(license_plate='RC1')
+        self.spot = spot
+        entry = local_midnight(date(2024, 3, 5))
+        log = ParkingLog.objects.create(car=self.car, spot=spot, entry_time=entry, exit_time=entry + timedelta(hours=2))
+        self.payment = Payment.objects.create(parking_log=log, amount=200, status='completed', payment_time=log.exit_time)
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('receipts', password='receipts123'))
+
+    def test_receipt_cached(self):
+        response = self.api.get(f'/api/payments/{self.payment.id}/receipt/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(len(list(receipts_root().glob('*/*.pdf'))), 1)
+
+        again = self.api.get(f'/api/payments/{self.payment.id}/receipt/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_month_zip(self):
+        entry = local_midnight(date(2024, 3, 10))
+        ParkingLogArchive.objects.create(
+            log_id=1000, period='2024-03', car=self.car, spot=self.spot,
+            entry_time=entry, exit_time=entry + timedelta(hours=1), created_at=entry, updated_at=entry
+        )
+        PaymentArchive.objects.create(
+            payment_id=5000, log_id=1000, period='2024-03', amount='100.00', status='completed',
+            payment_time=entry + timedelta(hours=1), created_at=entry, updated_at=entry
+        )
+        target = io.BytesIO()
+        self.assertEqual(write_receipts_zip(date(2024, 3, 1), target, workers=1), 2)
+        with zipfile.ZipFile(target) as archive:
+            self.assertEqual(archive.namelist(), [f'receipt_{self.payment.id}.pdf', 'receipt_5000.pdf'])
+
+
+class TariffTests(TestCase):
+    """Тариф: ставки по дням недели и времени суток, бесплатные минуты, ограничение за сутки"""
+
+    def test_rules(self):
+        tariff = compile_tariff({
+            'rate': 100,
+            'rules': [
+                {'days': [0, 1, 2, 3, 4], 'start': '08:00', 'end': '20:00', 'rate': 150},
+                {'days': [5, 6], 'rate': 60},
+                {'start': '22:00', 'end': '06:00', 'rate': 30},
+            ],
+            'grace_minutes': 15,
+            'daily_cap': 1200,
+            'step_minutes': 15,
+        })
+        # Среда, 6 марта 2024
+        wednesday = local_midnight(date(2024, 3, 6))
+        self.assertEqual(tariff.price(wednesday + timedelta(hours=10), wednesday + timedelta(hours=10, minutes=10)), 0)
+        # 16 минут округляются до 30: 0.5 часа по 150
+        self.assertEqual(tariff.price(wednesday + timedelta(hours=10), wednesday + timedelta(hours=10, minutes=16)), Decimal('75.00'))
+        self.assertEqual(tariff.price(wednesday + timedelta(hours=19), wednesday + timedelta(hours=21)), Decimal('250.00'))
+        # Среда 10:00 - суббота 10:00: трое суток по 1200 и утро субботы (6 ч по 30 и 4 ч по 60)
+        self.assertEqual(tariff.price(wednesday + timedelta(hours=10), wednesday + timedelta(days=3, hours=10)), Decimal('4020.00'))
+
+        entry = [(wednesday + timedelta(hours=hours)).timestamp() for hours in (10, 19, 10)]
+        exit = [(wednesday + timedelta(hours=hours)).timestamp() for hours in (10.1, 21, 82)]
+        self.assertEqual(tariff.price_batch(entry, exit).tolist(), [0, 250, 4020])
+
+    def test_exit_bills_session(self):
+        # Роли кэшируются по pk пользователя, а pk после отката теста повторяются
+        self.addCleanup(cache.clear)
+        staff = User.objects.create_user('tariffs', password='tariffs123')
+        staff.groups.add(Group.objects.get_or_create(name=RECEPTIONIST)[0])
+        api = APIClient()
+        api.force_authenticate(staff)
+        spot = ParkingSpot.objects.create(number='T1', is_occupied=True)
+        car = Car.objects.create(license_plate='TR1')
+        log = ParkingLog.objects.create(car=car, spot=spot, entry_time=timezone.now() - timedelta(hours=2, minutes=5))
+
+        debts = api.get('/api/logs/debts/').json()
+        self.assertEqual(debts['total'], 300)
+        self.assertEqual(debts['sessions'][0]['license_plate'], 'TR1')
+
+        # Тариф по умолчанию: 100 рублей за каждый начатый час
+        response = api.post(f'/api/logs/{log.id}/exit/')
+        self.assertEqual(response.data['amount_due'], '300.00')
+        self.assertEqual(list(Payment.objects.filter(parking_log=log).values_list('amount', 'status')), [(Decimal('300.00'), 'pending')])
+
+        # Повторный выезд не начисляет второй раз
+        self.assertEqual(api.post(f'/api/logs/{log.id}/exit/').status_code, 400)
+        self.assertEqual(Payment.objects.filter(parking_log=log).count(), 1)
+
+        # Отчеты берут сумму из платежей сессии, а не пересчитывают по новому тарифу
+        with override_settings(PARKING_TARIFF={'rate': 1000}):
+            spot_ids, _, amounts = closed_session_charges(log.entry_time, timezone.now() + timedelta(minutes=1))
+        self.assertEqual((spot_ids.tolist(), amounts.tolist()), ([spot.id], [300.0]))
+
+    def test_archived_charges(self):
+        spot = ParkingSpot.objects.create(number='T2')
+        car = Car.objects.create(license_plate='TR2')
+        start = local_midnight(date(2024, 3, 1))
+        ParkingLogArchive.objects.create(
+            log_id=1000, period='2024-03', car=car, spot=spot, entry_time=start, exit_time=start + timedelta(hours=1),
+            created_at=start, updated_at=start
+        )
+        for payment_id, amount, payment_status in ((5000, '100.00', 'completed'), (5001, '50.00', 'pending'), (5002, '70.00', 'failed')):
+            PaymentArchive.objects.create(
+                payment_id=payment_id, log_id=1000, period='2024-03', amount=amount, status=payment_status,
+                created_at=start, updated_at=start
+            )
+        spot_ids, _, amounts = closed_session_charges(start, start + timedelta(days=1))
+        self.assertEqual((spot_ids.tolist(), amounts.tolist()), ([spot.id], [150.0]))
+
+
+class ArchiveTests(TestCase):
+    """Перенос холодных логов в архив и чтение отчетов из обеих таблиц"""
+
+    def setUp(self):
+        self.start = local_midnight(date(2024, 3, 1))
+        self.spot = ParkingSpot.objects.create(number='A1')
+        car = Car.objects.create(license_plate='AR1')
+        self.old = ParkingLog.objects.create(
+            car=car, spot=self.spot, entry_time=self.start + timedelta(hours=1), exit_time=self.start + timedelta(hours=3)
+        )
+        Payment.objects.create(parking_log=self.old, amount='200.00', status='completed', payment_time=self.old.exit_time)
+        self.recent = ParkingLog.objects.create(car=car, spot=self.spot, entry_time=timezone.now() - timedelta(hours=1))
+
+    def test_archive_and_union_read(self):
+        self.assertEqual(archive_logs(batch_size=1), (1, 1))
+        self.assertEqual(list(ParkingLog.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(ParkingLogArchive.objects.get().log_id, self.old.id)
+        self.assertEqual(PaymentArchive.objects.get().amount, Decimal('200.00'))
+
+        end = self.start + timedelta(days=1)
+        self.assertEqual(payment_totals(self.start, end)['total_amount'], Decimal('200.00'))
+        with override_settings(PARKING_REPORT_ROLLUPS=False):
+            stats = spot_utilization(self.start, end)
+        self.assertEqual(stats[0]['occupied_seconds'], 2 * 3600)
+        self.assertEqual(stats[0]['revenue'], Decimal('200.00'))
+        # Перенос в архив почасовые итоги не уменьшает
+        self.assertEqual(spot_utilization(self.start, end), stats)
+
+    def test_resume_after_partial_batch(self):
+        # Строка архива уже есть, а горячий лог еще не удален: повторная вставка игнорируется
+        ParkingLogArchive.objects.create(
+            log_id=self.old.id, period='2024-03', car_id=self.old.car_id, spot=self.spot,
+            entry_time=self.old.entry_time, exit_time=self.old.exit_time,
+            created_at=self.old.created_at, updated_at=self.old.updated_at
+        )
+        archive_logs()
+        self.assertEqual(ParkingLogArchive.objects.filter(log_id=self.old.id).count(), 1)
+        self.assertFalse(ParkingLog.objects.filter(pk=self.old.id).exists())
+        self.assertEqual(archive_logs(), (0, 0))
+
+
+class ImportResumeTests(TestCase):
+    """Прогресс импорта фиксируется вместе с пачкой"""
+
+    def records(self, bad_row=None):
+        entry = local_midnight(date(2024, 3, 1))
+        for index in range(5):
+            yield {
+                'license_plate': f'IM{index}',
+                'spot': '' if index == bad_row else 'I1',
+                'entry_time': (entry + timedelta(hours=index)).isoformat(),
+                'exit_time': (entry + timedelta(hours=index, minutes=30)).isoformat(),
+                'amount': '50.00',
+            }
+
+    def test_failed_chunk_rolled_back_with_checkpoint(self):
+        checkpoint = Checkpoint('test-import')
+        with self.assertRaises(ImportDataError):
+            LogImporter(chunk_size=2).run(self.records(bad_row=3), checkpoint=checkpoint)
+        # Зафиксирована только первая пачка; вторая откатилась вместе с прогрессом
+        self.assertEqual(checkpoint.load(), 2)
+        self.assertEqual(ParkingLog.objects.count(), 2)
+
+        rows, _ = LogImporter(chunk_size=2).run(self.records(), skip=checkpoint.load(), checkpoint=checkpoint)
+        self.assertEqual(rows, 3)
+        self.assertEqual(checkpoint.load(), 5)
+        self.assertEqual(ParkingLog.objects.count(), 5)
+        self.assertEqual(Payment.objects.count(), 5)
+
+    def test_invalid_payment_fields(self):
+        for field, value in (('amount', 'abc'), ('amount', 'NaN'), ('payment_status', 'refunded')):
+            records = [{**record, field: value} for record in self.records()]
+            with self.assertRaises(ImportDataError):
+                LogImporter().run(records)
+        self.assertFalse(ParkingLog.objects.exists())
@@ -12,5 +12,7 @@ urlpatterns = [
     path('pay/', views.pay, name='pay'),
     path('daily-report/', views.daily_report, name='daily_report'),
     path('monthly-report/', views.monthly_report, name='monthly_report'),
+    path('reports/<uuid:job_id>/', views.report_job, name='report_job'),
+    path('reports/<uuid:job_id>/download/', views.report_job_download, name='report_job_download'),
     path('control-barrier/', views.control_barrier, name='control_barrier'),
 ] 
\ No newline at end of file
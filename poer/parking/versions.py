@@ -0,0 +1,60 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+# Версии наборов данных хранятся в кэше без срока действия.
+# При многопроцессном развертывании кэш должен быть общим (Redis/Memcached),
+# иначе версия, измененная одним процессом, не видна другим.
+KEY_PREFIX = 'parking:version:'
+
+SPOTS_VERSION = 'spots'
+CARS_VERSION = 'cars'
+LOGS_VERSION = 'logs'
+
+# Наборы, списки которых читаются из реплики: после обновления реплики
+# их версии меняются, чтобы сбросить кэши, построенные по версии в кэше
+# (ETag таких списков строится по снимку реплики, см. conditional.py)
+REPLICA_VERSIONS = (CARS_VERSION,)
+
+
+def _new_version():
+    now = time.time()
+    return {'token': f'{time.time_ns():x}', 'modified': now}
+
+
+def get_version(name):
+    """
+    Текущая версия набора данных: {'token': str, 'modified': unix time}.
+    Если версия отсутствует в кэше (например, после перезапуска), создается
+    новая, поэтому все зависимые кэши считаются устаревшими.
+    """
+    key = KEY_PREFIX + name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*names):
+    """
+    Смена версии наборов данных после изменения. Внутри транзакции версия
+    меняется только после фиксации: иначе параллельный запрос успел бы
+    закэшировать (или отдать с новым ETag) еще старые данные под новой версией.
+    """
+    def bump():
+        for name in names:
+            cache.set(KEY_PREFIX + name, _new_version(), None)
+
+    transaction.on_commit(bump)
+
+
+def track_model(model, *names):
+    """Смена версий при сохранении и удалении объектов модели"""
+    def model_changed(sender, **kwargs):
+        bump_version(*names)
+
+    uid = f'parking_version_{model._meta.label_lower}_{"_".join(names)}'
+    post_save.connect(model_changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(model_changed, sender=model, weak=False, dispatch_uid=uid)
@@ -1,42 +1,42 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.http import HttpResponse, Http404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import Group
 from django.contrib.auth.views import LoginView
-from .models import ParkingSpot, Car, ParkingLog, Payment
-from .reports import ReportGenerator
+from .models import ParkingSpot, Car, ParkingLog, Payment, ReportJob
+from .report_jobs import DAILY, MONTHLY, DONE, parse_params, submit_report, download_response
+from .occupancy import cached_occupancy_counts, spots_with_current_car, lot_version
+from .roles import get_roles, is_admin, is_client, is_staff_member
+from .tariffs import current_tariff
+from smart_parking.sqlite import run_write
 
 class CustomLoginView(LoginView):
     template_name = 'parking/login.html'
     redirect_authenticated_user = True
 
-def is_admin(user):
-    return user.groups.filter(name='Administrator').exists()
-
-def is_receptionist(user):
-    return user.groups.filter(name='Receptionist').exists()
-
-def is_client(user):
-    return user.groups.filter(name='Client').exists()
-
 @login_required
 def home(request):
-    spots = ParkingSpot.objects.all()
-    total_spots = spots.count()
-    available_spots = sum(1 for spot in spots if spot.is_available)
+    # Места вместе с номером текущего автомобиля - один запрос; выполняется
+    # только если сетка мест не найдена в кэше фрагментов
+    spots = spots_with_current_car()
+    counts = cached_occupancy_counts()
+    total_spots = counts['total']
+    available_spots = counts['free']
     occupied_spots = total_spots - available_spots
     
-    # Определяем доступные действия в зависимости от роли
-    can_manage = is_admin(request.user)
-    can_control_barrier = is_admin(request.user) or is_receptionist(request.user)
-    can_reserve = is_client(request.user)
-    can_view_reports = is_admin(request.user)
+    # Определяем доступные действия в зависимости от роли (роли кэшируются)
+    roles = get_roles(request.user)
+    can_manage = roles.is_admin
+    can_control_barrier = roles.is_admin or roles.is_receptionist
+    can_reserve = roles.is_client
+    can_view_reports = roles.is_admin
     
     context = {
         'spots': spots,
+        'lot_version': lot_version(),
         'total_spots': total_spots,
         'available_spots': available_spots,
         'occupied_spots': occupied_spots,
@@ -72,7 +72,7 @@ def reserve(request):
             messages.error(request, f'Ошибка при бронировании: {str(e)}')
     
     # Получаем список доступных мест
-    available_spots = ParkingSpot.objects.filter(is_available=True)
+    available_spots = ParkingSpot.objects.filter(is_occupied=False, is_reserved=False)
     return render(request, 'parking/reserve.html', {'spots': available_spots})
 
 @login_required
@@ -94,25 +94,7 @@ def pay(request):
                 messages.error(request, 'Нет активной парковки для этого автомобиля')
                 return redirect('parking:pay')
             
-            # Создаем платеж
-            payment = Payment.objects.create(
-                parking_log=parking_log,
-                amount=hours * 100,  # 100 рублей в час
-                status='completed',
-                payment_time=timezone.now()
-            )
-            
-            # Обновляем время выезда
-            parking_log.exit_time = timezone.now() + timedelta(hours=hours)
-            parking_log.save()
-            
-            # Освобождаем место
-            spot = parking_log.spot
-            spot.is_occupied = False
-            spot.is_reserved = False
-            spot.reservation_start = None
-            spot.reservation_end = None
-            spot.save()
+            run_write(_record_payment, parking_log, hours)
             
             messages.success(request, 'Оплата успешно произведена!')
             return redirect('parking:home')
@@ -125,48 +107,73 @@ def pay(request):
     
     return render(request, 'parking/pay.html')
 
+def _record_payment(parking_log, hours):
+    """Оплата и освобождение места одной транзакцией"""
+    now = timezone.now()
+    exit_time = now + timedelta(hours=hours)
+    # Создаем платеж: оплачиваемые часы по тарифу
+    payment = Payment.objects.create(
+        parking_log=parking_log,
+        amount=current_tariff().price(now, exit_time),
+        status='completed',
+        payment_time=now
+    )
+    
+    # Обновляем время выезда
+    parking_log.exit_time = exit_time
+    parking_log.save()
+    
+    # Освобождаем место
+    spot = parking_log.spot
+    spot.is_occupied = False
+    spot.is_reserved = False
+    spot.reservation_start = None
+    spot.reservation_end = None
+    spot.save()
+    return payment
+
 @login_required
 @user_passes_test(is_admin)
 def daily_report(request):
     """Представление для генерации ежедневного отчета"""
-    date_str = request.GET.get('date')
-    if date_str:
-        try:
-            date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        except ValueError:
-            return HttpResponse('Invalid date format. Use YYYY-MM-DD', status=400)
-    else:
-        date = timezone.now().date()
-
-    report_generator = ReportGenerator()
-    excel_content = report_generator.generate_daily_report_excel(date)
-    
-    response = HttpResponse(excel_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="daily_report_{date}.xlsx"'
-    return response
+    try:
+        params = parse_params(DAILY, request.GET)
+    except ValueError:
+        return HttpResponse('Invalid date format. Use YYYY-MM-DD', status=400)
+    return _report_response(request, DAILY, params)
 
 @login_required
 @user_passes_test(is_admin)
 def monthly_report(request):
     """Представление для генерации месячного отчета"""
     try:
-        year = int(request.GET.get('year', timezone.now().year))
-        month = int(request.GET.get('month', timezone.now().month))
-        
-        if not (1 <= month <= 12):
-            return HttpResponse('Month must be between 1 and 12', status=400)
-            
-        report_generator = ReportGenerator()
-        excel_content = report_generator.generate_monthly_report_excel(year, month)
-        
-        response = HttpResponse(excel_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="monthly_report_{year}_{month:02d}.xlsx"'
-        return response
+        params = parse_params(MONTHLY, request.GET)
     except ValueError as e:
         return HttpResponse(str(e), status=400)
+    return _report_response(request, MONTHLY, params)
+
+def _report_response(request, kind, params):
+    """Готовый отчет отдается сразу, иначе - страница ожидания задания"""
+    job = submit_report(kind, params, request.user)
+    if job.status == DONE:
+        return download_response(job)
+    return redirect('parking:report_job', job_id=job.pk)
+
+@login_required
+@user_passes_test(is_admin)
+def report_job(request, job_id):
+    """Статус фонового построения отчета"""
+    job = get_object_or_404(ReportJob, pk=job_id)
+    return render(request, 'parking/report_job.html', {'job': job})
+
+@login_required
+@user_passes_test(is_admin)
+def report_job_download(request, job_id):
+    """Скачивание готового отчета"""
+    return download_response(get_object_or_404(ReportJob, pk=job_id))
 
 @login_required
-@user_passes_test(lambda u: is_admin(u) or is_receptionist(u))
+@user_passes_test(is_staff_member)
 def control_barrier(request):
     """Управление шлагбаумом"""
     if request.method == 'POST':
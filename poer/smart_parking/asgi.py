@@ -3,6 +3,11 @@ ASGI config for smart_parking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live occupancy stream (/api/occupancy/stream/) holds connections
+open for a long time and must be served through this entry point, e.g.:
+
+    uvicorn smart_parking.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -0,0 +1,133 @@
+"""
+Маршрутизация чтения между основной базой и репликой. Из реплики читается
+только внутри use_replica() (отчеты, списки API, списки админки); запись
+и чтение после записи идут в основную базу. Если реплика не настроена,
+ее файл еще не создан или устарел (REPLICA_MAX_AGE), чтение идет из
+основной базы. Локально реплика - второй файл SQLite, обновляемый
+sync_replica() (manage.py sync_replica).
+"""
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+PRIMARY_ALIAS = 'default'
+REPLICA_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Секунды, в течение которых используется результат проверки реплики
+REPLICA_CHECK_INTERVAL = 30
+# (момент проверки, доступна ли) для процесса
+_replica_state = [None, False]
+
+
+@contextmanager
+def use_replica():
+    """Чтение ORM в блоке (или декорированной функции) - из реплики"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_available():
+    """
+    Реплика настроена, ее база существует и не старше REPLICA_MAX_AGE.
+    Результат кэшируется в процессе на REPLICA_CHECK_INTERVAL секунд,
+    чтобы не обращаться к файлу при каждом чтении.
+    """
+    checked_at, available = _replica_state
+    now = time.monotonic()
+    interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', REPLICA_CHECK_INTERVAL)
+    if checked_at is None or now - checked_at >= interval:
+        available = _check_replica()
+        _replica_state[:] = [now, available]
+    return available
+
+
+def reset_replica_check():
+    """Сброс результата проверки: следующее чтение проверит реплику заново"""
+    _replica_state[:] = [None, False]
+
+
+@receiver(setting_changed)
+def _databases_changed(setting, **kwargs):
+    if setting in ('DATABASES', 'REPLICA_CHECK_INTERVAL', 'REPLICA_MAX_AGE'):
+        reset_replica_check()
+
+
+def _check_replica():
+    config = settings.DATABASES.get(REPLICA_ALIAS)
+    if not config:
+        return False
+    if config['ENGINE'] != 'django.db.backends.sqlite3':
+        return True
+    try:
+        modified = os.path.getmtime(config['NAME'])
+    except OSError:
+        return False
+    max_age = getattr(settings, 'REPLICA_MAX_AGE', None)
+    return max_age is None or time.time() - modified <= max_age
+
+
+def replica_snapshot():
+    """
+    Идентификатор снимка реплики SQLite (время изменения и размер файла)
+    или None, если реплика недоступна или это не файл SQLite. Меняется
+    при каждом sync_replica и одинаков во всех процессах.
+    """
+    config = settings.DATABASES.get(REPLICA_ALIAS)
+    if not config or config['ENGINE'] != 'django.db.backends.sqlite3' or not replica_available():
+        return None
+    try:
+        stat = os.stat(config['NAME'])
+    except OSError:
+        return None
+    return {'token': f'{stat.st_mtime_ns:x}-{stat.st_size:x}', 'modified': stat.st_mtime}
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_available():
+            return REPLICA_ALIAS
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Обе базы содержат одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика - копия основной базы, миграции к ней не применяются
+        return db == PRIMARY_ALIAS
+
+
+def sync_replica():
+    """
+    Копия основной базы SQLite в файл реплики через backup API: читатели
+    реплики ждут окончания копирования и видят согласованный снимок.
+    """
+    source_name = settings.DATABASES[PRIMARY_ALIAS]['NAME']
+    target_name = settings.DATABASES[REPLICA_ALIAS]['NAME']
+
+    source = sqlite3.connect(source_name)
+    target = sqlite3.connect(target_name)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    # Соединения с репликой в этом процессе переоткрываются после копирования
+    connections[REPLICA_ALIAS].close()
+    reset_replica_check()
@@ -0,0 +1,209 @@
+"""
+Метрики запросов: задержка, число и время SQL-запросов, размер ответа
+по представлениям (имя URL) и методам; выдача в формате Prometheus
+на /metrics. Счетчик запросов текущего запроса хранится в contextvar,
+поэтому учитывает sync_to_async под ASGI и задания потока-писателя
+SQLite; запросы при чтении StreamingHttpResponse не учитываются.
+Данные хранятся в памяти процесса: при нескольких процессах
+Prometheus опрашивает каждый.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_request_queries = ContextVar('request_queries', default=None)
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """Обертка execute: запрос учитывается в счетчике текущего запроса"""
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Обработчик connection_created: установка count_queries"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Строки Prometheus: накопленные корзины, _sum и _count"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class ViewStats:
+    __slots__ = ('latency', 'queries', 'query_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.query_seconds = 0.0
+        self.response_bytes = 0
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Потокобезопасное хранилище метрик процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._responses = {}
+
+    def observe(self, view, method, status, seconds, queries, query_seconds, size):
+        with self._lock:
+            stats = self._views.get((view, method))
+            if stats is None:
+                stats = self._views[(view, method)] = ViewStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.query_seconds += query_seconds
+            if size is not None:
+                stats.response_bytes += size
+            key = (view, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._responses.clear()
+
+    def render(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            responses = sorted(self._responses.items())
+
+        lines = [
+            '# HELP parking_http_requests_total Requests by view, method and status.',
+            '# TYPE parking_http_requests_total counter',
+        ]
+        for (view, method, status), count in responses:
+            lines.append(
+                f'parking_http_requests_total{{view="{_label(view)}",method="{method}",status="{status}"}} {count}'
+            )
+
+        sections = (
+            ('parking_http_request_duration_seconds', 'histogram',
+             'Request latency in seconds.', lambda stats: stats.latency),
+            ('parking_http_db_queries', 'histogram',
+             'SQL queries per request.', lambda stats: stats.queries),
+            ('parking_http_db_query_seconds_total', 'counter',
+             'Time spent in SQL queries.', lambda stats: stats.query_seconds),
+            ('parking_http_response_bytes_total', 'counter',
+             'Response body size (streaming responses are not counted).', lambda stats: stats.response_bytes),
+        )
+        for name, kind, help_text, value in sections:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (view, method), stats in views:
+                labels = f'view="{_label(view)}",method="{method}"'
+                if kind == 'histogram':
+                    lines.extend(value(stats).samples(name, labels))
+                else:
+                    lines.append(f'{name}{{{labels}}} {value(stats)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    # Представление без имени URL помечается шаблоном маршрута
+    return match.view_name or match.route
+
+
+def _finish(request, response, stats, started):
+    seconds = time.perf_counter() - started
+    size = None if response.streaming else len(response.content)
+    registry.observe(
+        view_label(request), request.method, response.status_code,
+        seconds, stats.count, stats.seconds, size
+    )
+    if getattr(settings, 'METRICS_QUERY_HEADER', settings.DEBUG):
+        response['X-Query-Count'] = str(stats.count)
+        response['X-Query-Time'] = f'{stats.seconds * 1000:.1f}ms'
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Учет задержки, SQL-запросов и размера ответа каждого запроса"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = QueryStats()
+            token = _request_queries.set(stats)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_queries.reset(token)
+            return _finish(request, response, stats, started)
+    else:
+        def middleware(request):
+            stats = QueryStats()
+            token = _request_queries.set(stats)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _request_queries.reset(token)
+            return _finish(request, response, stats, started)
+    return middleware
+
+
+def metrics_view(request):
+    """GET /metrics - метрики в текстовом формате Prometheus"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'smart_parking.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'parking.roles.user_roles',
             ],
         },
     },
@@ -80,7 +82,59 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Запись берет блокировку сразу, а не при первом UPDATE,
+            # чтобы busy_timeout работал и для повышения блокировки
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Реплика для отчетов и списков; обновляется командой sync_replica.
+    # Пока файл не создан или старше REPLICA_MAX_AGE, чтение идет из основной базы.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['smart_parking.db_router.PrimaryReplicaRouter']
+# Реплика старше этого числа секунд не используется (None - без ограничения)
+REPLICA_MAX_AGE = 60 * 60
+
+# Профиль производительности SQLite (smart_parking/sqlite.py):
+# PRAGMA применяются к каждому новому соединению
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,          # мс
+    'mmap_size': 268435456,        # 256 МБ
+    'cache_size': -65536,          # 64 МБ (отрицательное значение - в КиБ)
+    'temp_store': 'MEMORY',
+}
+
+# Запись с въезда/выезда выполняется через единственный поток-писатель
+SQLITE_WRITE_QUEUE = True
+# Наибольшая длительность одной транзакции записи, секунд; вместе с
+# busy_timeout задает окно, которое лента изменений выжидает (parking/changefeed.py)
+WRITE_TRANSACTION_MAX_SECONDS = 5
+
+
+# Кэш счетчиков занятости и версий данных.
+# При нескольких процессах нужен общий кэш (Redis/Memcached).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smart-parking',
+    },
+    # Фрагменты шаблонов (карточки мест) - отдельно, чтобы вытеснение
+    # большого числа фрагментов не удаляло версии данных из 'default'
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smart-parking-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
 }
 
 
@@ -154,6 +208,55 @@ BARRIER_API_KEY = 'your-api-key-here'  # API ключ для управлени
 # Путь к OpenALPR (измените на ваш путь)
 ALPR_PATH = r'C:\Program Files\OpenALPR\alpr.exe'
 
+# Метрики запросов (/metrics): доступ с этих адресов или для staff-пользователей.
+# Заголовки X-Query-Count/X-Query-Time добавляются к ответам при METRICS_QUERY_HEADER
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_QUERY_HEADER = DEBUG
+
+# Закрытые логи старше горизонта переносятся в архив (manage.py archive_logs)
+PARKING_ARCHIVE_HORIZON_DAYS = 180
+
+# Отчеты за целые часы читают почасовые итоги (HourlySpotStats/HourlyRevenue).
+# Итоги заполняются миграцией 0008 и затем поддерживаются сигналами; после
+# правок в обход сигналов (queryset.update, SQL) - manage.py backfill_rollups
+PARKING_REPORT_ROLLUPS = True
+
+# Фоновое построение отчетов (parking/report_jobs.py): файлы результатов,
+# число потоков (0 - строить прямо в запросе), предельное время построения,
+# период отметок процесса о своих заданиях и срок хранения отчетов по
+# открытым периодам (секунды)
+REPORTS_ROOT = BASE_DIR / 'reports'
+REPORT_WORKERS = 2
+REPORT_JOB_TIMEOUT = 600
+REPORT_HEARTBEAT_SECONDS = 30
+REPORT_RESULT_TTL = 24 * 60 * 60
+
+# Выгрузка для аналитики в Parquet/Arrow (manage.py export_columnar, требует pyarrow):
+# каталог с разделами <набор>/month=ГГГГ-ММ/
+ANALYTICS_EXPORT_ROOT = BASE_DIR / 'analytics'
+
+# Тариф (parking/tariffs.py): ставка руб./час по умолчанию, правила по дням недели
+# (0 - понедельник) и времени суток (кратно 15 минутам, позднее правило перекрывает
+# раннее), бесплатные минуты, ограничение за местные сутки (None - без ограничения)
+# и шаг тарификации. Пример:
+#     'rules': [
+#         {'days': [0, 1, 2, 3, 4], 'start': '08:00', 'end': '20:00', 'rate': 150},
+#         {'days': [5, 6], 'rate': 80},
+#         {'start': '22:00', 'end': '06:00', 'rate': 30},
+#     ],
+PARKING_TARIFF = {
+    'rate': 100,
+    'rules': [],
+    'grace_minutes': 0,
+    'daily_cap': None,
+    'step_minutes': 60,
+}
+
+# PDF-чеки оплаченных платежей (parking/receipts.py): каталог файлов по хэшу
+# содержимого и число процессов для пакетного построения (None - по числу ядер)
+RECEIPTS_ROOT = BASE_DIR / 'receipts'
+RECEIPT_WORKERS = None
+
 # Настройки логирования
 LOGGING = {
     'version': 1,
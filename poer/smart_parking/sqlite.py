@@ -0,0 +1,120 @@
+"""
+Настройка SQLite: PRAGMA для новых соединений и очередь записи
+через единственный поток-писатель.
+"""
+
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+def apply_pragmas(cursor, pragmas):
+    """Применение PRAGMA {имя: значение} к открытому курсору"""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: settings.SQLITE_PRAGMAS для каждого соединения"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas)
+
+
+class WriterQueue:
+    """
+    Выполнение заданий по одному в отдельном потоке.
+    Поток запускается при первом задании и живет до конца процесса.
+    """
+
+    def __init__(self, name='sqlite-writer', wrap=None):
+        self.name = name
+        self.wrap = wrap
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_writer_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Постановка func(*args, **kwargs) в очередь; возвращает Future.
+        Задание выполняется в копии контекста вызывающего (contextvars),
+        поэтому счетчик запросов к БД текущего запроса учитывает и его.
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((future, contextvars.copy_context(), func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Выполнение func в потоке очереди с ожиданием результата"""
+        if self.is_writer_thread:
+            # Вызов из самого потока (например, из on_commit): ставить в очередь
+            # нельзя - поток ждал бы сам себя; транзакция та же, что и в очереди
+            return self._run(func, *args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def _run(self, func, *args, **kwargs):
+        if self.wrap:
+            return self.wrap(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            future, context, func, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = context.run(self._run, func, *args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+def _atomic_call(func, *args, **kwargs):
+    # Соединение потока-писателя живет весь процесс (CONN_MAX_AGE к нему
+    # не применяется) и переоткрывается только после ошибки, сделавшей
+    # его непригодным
+    try:
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    except Exception:
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+        raise
+
+
+writer_queue = WriterQueue(wrap=_atomic_call)
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Выполнение func одной короткой транзакцией записи. При включенной
+    очереди на SQLite - в потоке-писателе; без очереди, на другой СУБД
+    или внутри уже открытой транзакции - в текущем потоке.
+    """
+    if (
+        not getattr(settings, 'SQLITE_WRITE_QUEUE', False)
+        or connection.vendor != 'sqlite'
+        or connection.in_atomic_block
+    ):
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    return writer_queue.call(func, *args, **kwargs)
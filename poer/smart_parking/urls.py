@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.documentation import include_docs_urls
+from smart_parking.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,4 +25,5 @@ urlpatterns = [
     path('api/', include('parking.api_urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('docs/', include_docs_urls(title='Smart Parking API')),
+    path('metrics', metrics_view, name='metrics'),
 ]